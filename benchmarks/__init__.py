@@ -0,0 +1,5 @@
+"""
+Ingestion benchmarks for the XER pipeline.
+generate_xer writes seeded synthetic schedules of any size, and
+run_benchmark measures parsing and loading them into PostgreSQL.
+"""
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Seeded generator of synthetic XER files.
+Writes one project with a WBS tree, activities, relationships, resource
+assignments and activity codes, shaped like P6 exports: relationships only
+point backwards in activity order (so the network is acyclic), most are
+finish-to-start, and early activities are completed or in progress. The
+same seed and parameters always produce the same file.
+
+Usage:
+    python -m benchmarks.generate_xer <output.xer> --activities 100000 [--seed 42]
+"""
+
+import sys
+import random
+import argparse
+from datetime import datetime, timedelta
+
+DEFAULT_SEED = 42
+DEFAULT_RELATIONSHIPS_PER_ACTIVITY = 1.5
+DEFAULT_RESOURCES_PER_ACTIVITY = 0.6
+DEFAULT_ACTIVITIES_PER_WBS = 20
+
+# Children per WBS node; the tree depth grows with log(activities / activities_per_wbs)
+WBS_FANOUT = 8
+
+# Predecessors are picked among this many preceding activities
+RELATIONSHIP_WINDOW = 50
+
+RELATIONSHIP_TYPES = (('PR_FS', 0.80), ('PR_SS', 0.10), ('PR_FF', 0.07), ('PR_SF', 0.03))
+
+PROJECT_START = datetime(2025, 1, 6, 8, 0)
+DATE_FORMAT = '%Y-%m-%d %H:%M'
+HOURS_PER_DAY = 8
+
+TABLE_COLUMNS = {
+    'PROJECT': (
+        'proj_id', 'fy_start_month_num', 'proj_short_name', 'clndr_id', 'plan_start_date',
+        'plan_end_date', 'last_recalc_date', 'guid'
+    ),
+    'PROJWBS': (
+        'wbs_id', 'proj_id', 'obs_id', 'seq_num', 'proj_node_flag', 'sum_data_flag', 'status_code',
+        'wbs_short_name', 'wbs_name', 'parent_wbs_id', 'guid'
+    ),
+    'ACTVCODE': (
+        'actv_code_id', 'parent_actv_code_id', 'actv_code_type_id', 'actv_code_name', 'short_name',
+        'seq_num'
+    ),
+    'TASK': (
+        'task_id', 'proj_id', 'wbs_id', 'clndr_id', 'phys_complete_pct', 'complete_pct_type',
+        'task_type', 'duration_type', 'status_code', 'task_code', 'task_name', 'rsrc_id',
+        'total_float_hr_cnt', 'free_float_hr_cnt', 'remain_drtn_hr_cnt', 'target_drtn_hr_cnt',
+        'target_start_date', 'target_end_date', 'act_start_date', 'act_end_date',
+        'early_start_date', 'early_end_date', 'late_start_date', 'late_end_date',
+        'driving_path_flag', 'guid'
+    ),
+    'TASKPRED': (
+        'task_pred_id', 'task_id', 'pred_task_id', 'proj_id', 'pred_proj_id', 'pred_type',
+        'lag_hr_cnt'
+    ),
+    'TASKRSRC': (
+        'taskrsrc_id', 'task_id', 'proj_id', 'rsrc_id', 'remain_qty', 'target_qty', 'act_reg_qty',
+        'target_cost', 'act_reg_cost', 'remain_cost', 'target_start_date', 'target_end_date'
+    ),
+}
+
+def format_date(value):
+    """Format a datetime like P6 does"""
+    return value.strftime(DATE_FORMAT)
+
+def make_guid(rng):
+    """Return a P6-style 22 character GUID"""
+    return ''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/')
+                   for _ in range(22))
+
+def write_table(out, table_name, rows):
+    """Write one XER table; rows is an iterable of value tuples (None for empty)"""
+    out.write(f"%T\t{table_name}\n")
+    out.write("%F\t" + '\t'.join(TABLE_COLUMNS[table_name]) + "\n")
+    count = 0
+    for row in rows:
+        out.write("%R\t" + '\t'.join('' if value is None else str(value) for value in row) + "\n")
+        count += 1
+    return count
+
+def generate_xer(path, activities, seed=DEFAULT_SEED,
+                 relationships_per_activity=DEFAULT_RELATIONSHIPS_PER_ACTIVITY,
+                 resources_per_activity=DEFAULT_RESOURCES_PER_ACTIVITY,
+                 activities_per_wbs=DEFAULT_ACTIVITIES_PER_WBS):
+    """
+    Write a synthetic XER file and return the number of rows per table.
+    """
+    if activities < 1:
+        raise ValueError(f"Activities must be at least 1, got {activities}")
+
+    rng = random.Random(seed)
+    proj_id = 1000 + seed % 1000
+    wbs_count = max(1, activities // activities_per_wbs)
+    resource_count = max(5, activities // 200)
+    completed = int(activities * 0.3)
+    in_progress = int(activities * 0.1)
+    # Spread activities over a schedule roughly a tenth as many working days long
+    day_step = max(1, activities // 10) / activities
+    project_days = int(activities * day_step) + 40
+    type_names = [name for name, _ in RELATIONSHIP_TYPES]
+    type_weights = [weight for _, weight in RELATIONSHIP_TYPES]
+    counts = {}
+
+    def wbs_rows():
+        root_id = proj_id * 1000
+        yield (root_id, proj_id, 1, 0, 'Y', 'N', 'WS_Open', f'BENCH{proj_id}', f'Benchmark Project {proj_id}',
+               None, make_guid(rng))
+        for index in range(1, wbs_count + 1):
+            parent_index = (index - 1) // WBS_FANOUT
+            yield (root_id + index, proj_id, 1, (index - 1) % WBS_FANOUT * 10, 'N', 'N', 'WS_Open',
+                   f'W{index}', f'Work Package {index}', root_id + parent_index, make_guid(rng))
+
+    def actvcode_rows():
+        code_id = proj_id * 100
+        for type_index in range(1, 4):
+            for value_index in range(1, 11):
+                code_id += 1
+                yield (code_id, None, type_index, f'Code {type_index}.{value_index}',
+                       f'C{type_index}{value_index:02d}', value_index * 10)
+
+    def task_rows():
+        for index in range(activities):
+            task_id = 100000 + index
+            duration = rng.choice((0, 8, 16, 24, 40, 80, 160)) if index else 0
+            start = PROJECT_START + timedelta(days=int(index * day_step))
+            end = start + timedelta(days=duration / HOURS_PER_DAY)
+            if index < completed:
+                status, remaining, pct = 'TK_Complete', 0, 100
+                actual_start, actual_end = format_date(start), format_date(end)
+            elif index < completed + in_progress:
+                status, remaining, pct = 'TK_Active', duration // 2, 50
+                actual_start, actual_end = format_date(start), None
+            else:
+                status, remaining, pct = 'TK_NotStart', duration, 0
+                actual_start, actual_end = None, None
+            total_float = rng.choice((0, 0, 8, 40, 120, 400, -16))
+            late_start = start + timedelta(days=total_float / HOURS_PER_DAY)
+            yield (
+                task_id, proj_id, proj_id * 1000 + 1 + index * wbs_count // activities,
+                1, pct, 'CP_Drtn', 'TT_Task' if duration else 'TT_Mile', 'DT_FixedDUR2', status,
+                f'A{index * 10 + 1000}', f'Activity {index + 1}', None,
+                total_float, min(total_float, rng.choice((0, 8, 40))), remaining, duration,
+                format_date(start), format_date(end), actual_start, actual_end,
+                format_date(start), format_date(end), format_date(late_start),
+                format_date(late_start + timedelta(days=duration / HOURS_PER_DAY)),
+                'Y' if total_float <= 0 else 'N', make_guid(rng)
+            )
+
+    def taskpred_rows():
+        pred_id = 500000
+        for index in range(1, activities):
+            count = int(relationships_per_activity)
+            if rng.random() < relationships_per_activity - count:
+                count += 1
+            low = max(0, index - RELATIONSHIP_WINDOW)
+            for pred_index in rng.sample(range(low, index), min(count, index - low)):
+                pred_id += 1
+                lag = rng.choice((-8, 8, 16, 40)) if rng.random() < 0.08 else 0
+                yield (pred_id, 100000 + index, 100000 + pred_index, proj_id, proj_id,
+                       rng.choices(type_names, type_weights)[0], lag)
+
+    def taskrsrc_rows():
+        assignment_id = 800000
+        for index in range(activities):
+            count = int(resources_per_activity)
+            if rng.random() < resources_per_activity - count:
+                count += 1
+            for _ in range(count):
+                assignment_id += 1
+                target = rng.choice((8, 16, 40, 80))
+                actual = target if index < completed else 0
+                start = PROJECT_START + timedelta(days=int(index * day_step))
+                yield (assignment_id, 100000 + index, proj_id, 9000 + rng.randrange(resource_count),
+                       target - actual, target, actual, target * 95, actual * 95, (target - actual) * 95,
+                       format_date(start), format_date(start + timedelta(days=target / HOURS_PER_DAY)))
+
+    with open(path, 'w', encoding='utf-8', newline='\n') as out:
+        out.write(f"ERMHDR\t19.12\t{format_date(PROJECT_START)[:10]}\tProject\tbenchmark\tbenchmark"
+                  f"\tdbxDatabaseNoName\tProject Management\tUSD\n")
+        counts['PROJECT'] = write_table(out, 'PROJECT', [(
+            proj_id, 1, f'BENCH{proj_id}', 1, format_date(PROJECT_START),
+            format_date(PROJECT_START + timedelta(days=project_days)),
+            format_date(PROJECT_START + timedelta(days=int(project_days * 0.35))), make_guid(rng)
+        )])
+        counts['PROJWBS'] = write_table(out, 'PROJWBS', wbs_rows())
+        counts['ACTVCODE'] = write_table(out, 'ACTVCODE', actvcode_rows())
+        counts['TASK'] = write_table(out, 'TASK', task_rows())
+        counts['TASKPRED'] = write_table(out, 'TASKPRED', taskpred_rows())
+        counts['TASKRSRC'] = write_table(out, 'TASKRSRC', taskrsrc_rows())
+        out.write("%E\n")
+    return counts
+
+def main():
+    """
+    Generate one synthetic XER file from the command line.
+    """
+    parser = argparse.ArgumentParser(description='Generate a synthetic XER file')
+    parser.add_argument('output', help='Path of the XER file to write')
+    parser.add_argument('--activities', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--relationships-per-activity', type=float, default=DEFAULT_RELATIONSHIPS_PER_ACTIVITY)
+    parser.add_argument('--resources-per-activity', type=float, default=DEFAULT_RESOURCES_PER_ACTIVITY)
+    parser.add_argument('--activities-per-wbs', type=int, default=DEFAULT_ACTIVITIES_PER_WBS)
+    args = parser.parse_args()
+
+    counts = generate_xer(
+        args.output, args.activities, args.seed, args.relationships_per_activity,
+        args.resources_per_activity, args.activities_per_wbs
+    )
+    print(f"[Benchmark] Wrote {args.output}: " + ', '.join(f"{table} {rows}" for table, rows in counts.items()))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
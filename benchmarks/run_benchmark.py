@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Ingestion benchmark for the XER pipeline.
+For each requested size a synthetic XER file is generated (see
+generate_xer), then parsed on its own and ingested end to end into the
+PostgreSQL database configured in .env. Every measurement runs in a freshly
+spawned process so its peak RSS is not inflated by earlier steps. Results
+are written as JSON together with the git commit, so runs from different
+commits can be compared to catch regressions.
+
+Ingestion writes real snapshots; point POSTGRES_DB at a scratch database.
+
+Usage:
+    python -m benchmarks.run_benchmark --sizes 1000 10000 100000 [--output results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Make the repository modules importable when run as a script
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.generate_xer import (
+    DEFAULT_SEED,
+    DEFAULT_RELATIONSHIPS_PER_ACTIVITY,
+    DEFAULT_RESOURCES_PER_ACTIVITY,
+    DEFAULT_ACTIVITIES_PER_WBS,
+    generate_xer
+)
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+RESULTS_VERSION = 1
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MB, or None if unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 1)
+
+@contextlib.contextmanager
+def quiet(verbose):
+    """Silence the pipeline's progress output unless verbose"""
+    if verbose:
+        yield
+        return
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+def measure_parse(path, batch_size, verbose):
+    """
+    Tokenize a file without touching the database (runs in a child process).
+    """
+    from xer_reader import iter_xer_batches
+
+    with quiet(verbose):
+        started = time.perf_counter()
+        rows = 0
+        tables = {}
+        for table_name, _, records in iter_xer_batches(path, batch_size):
+            rows += len(records)
+            tables[table_name] = tables.get(table_name, 0) + len(records)
+        seconds = time.perf_counter() - started
+    return {'seconds': seconds, 'rows': rows, 'tables': tables, 'peak_rss_mb': peak_rss_mb()}
+
+def measure_load(path, parallelism, verbose):
+    """
+    Ingest a file end to end, including post-ingest work (runs in a child process).
+    """
+    with quiet(verbose):
+        # Importing opens the connection pool, which reports itself
+        from parse_xer_content import ingest_xer_file
+
+        started = time.perf_counter()
+        result = ingest_xer_file(path, parallelism=parallelism)
+        seconds = time.perf_counter() - started
+    tables = {
+        table_name: {'rows': stats['rows'], 'rejected': stats['rejected'], 'seconds': round(stats['seconds'], 4)}
+        for table_name, stats in result['tables'].items()
+    }
+    rows = sum(stats['rows'] for stats in tables.values())
+    # Table loading alone, without metadata, post-ingest indexes, read models and CPM
+    load_seconds = sum(stats['seconds'] for stats in tables.values())
+    return {
+        'file_id': result['file_id'],
+        'seconds': seconds,
+        'load_seconds': load_seconds,
+        'rows': rows,
+        'tables': tables,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+def run_isolated(function, *args):
+    """Run a measurement in a freshly spawned process and return its result"""
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(function, *args).result()
+
+def rate(amount, seconds):
+    """Return amount per second rounded for the report, guarding against zero durations"""
+    return round(amount / seconds, 1) if seconds > 0 else None
+
+def git_commit():
+    """Return the current commit hash and whether the tree has local changes"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        status = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        return {'commit': commit, 'dirty': bool(status)}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+
+def benchmark_size(activities, args, work_dir):
+    """
+    Generate, parse and (unless skipped) load one synthetic file; returns its result entry.
+    """
+    from xer_reader import DEFAULT_BATCH_SIZE
+
+    path = os.path.join(work_dir, f'BENCH{activities}_2025-01-06.xer')
+    started = time.perf_counter()
+    counts = generate_xer(
+        path, activities, args.seed, args.relationships_per_activity,
+        args.resources_per_activity, args.activities_per_wbs
+    )
+    generate_seconds = time.perf_counter() - started
+    size_bytes = os.path.getsize(path)
+    megabytes = size_bytes / (1024 * 1024)
+    entry = {
+        'activities': activities,
+        'rows': counts,
+        'bytes': size_bytes,
+        'generate_seconds': round(generate_seconds, 4),
+        'parse': [],
+        'load': []
+    }
+
+    try:
+        for run in range(args.repeat):
+            parsed = run_isolated(measure_parse, path, DEFAULT_BATCH_SIZE, args.verbose)
+            parsed.update(
+                seconds=round(parsed['seconds'], 4),
+                rows_per_second=rate(parsed['rows'], parsed['seconds']),
+                mb_per_second=rate(megabytes, parsed['seconds'])
+            )
+            entry['parse'].append(parsed)
+            print(f"[Benchmark] {activities:,} activities, run {run + 1}: parse {parsed['seconds']:.2f}s "
+                  f"({parsed['mb_per_second']} MB/s, peak RSS {parsed['peak_rss_mb']} MB)", file=sys.stderr)
+
+            if args.skip_load:
+                continue
+            loaded = run_isolated(measure_load, path, args.load_parallelism, args.verbose)
+            loaded.update(
+                seconds=round(loaded['seconds'], 4),
+                load_seconds=round(loaded['load_seconds'], 4),
+                rows_per_second=rate(loaded['rows'], loaded['load_seconds']),
+                end_to_end_rows_per_second=rate(loaded['rows'], loaded['seconds'])
+            )
+            entry['load'].append(loaded)
+            print(f"[Benchmark] {activities:,} activities, run {run + 1}: end-to-end {loaded['seconds']:.2f}s, "
+                  f"{loaded['rows']:,} rows at {loaded['rows_per_second']} rows/s "
+                  f"(peak RSS {loaded['peak_rss_mb']} MB, file_id {loaded['file_id']})", file=sys.stderr)
+    finally:
+        if not args.keep_files:
+            os.remove(path)
+    return entry
+
+def main():
+    """
+    Run the benchmark for every requested size and write the JSON report.
+    Progress goes to stderr so the report can be piped from stdout.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark XER parsing and ingestion')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help='Activity counts to benchmark (1000 to 1000000)')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--relationships-per-activity', type=float, default=DEFAULT_RELATIONSHIPS_PER_ACTIVITY)
+    parser.add_argument('--resources-per-activity', type=float, default=DEFAULT_RESOURCES_PER_ACTIVITY)
+    parser.add_argument('--activities-per-wbs', type=int, default=DEFAULT_ACTIVITIES_PER_WBS)
+    parser.add_argument('--repeat', type=int, default=1, help='Measurements per size')
+    parser.add_argument('--load-parallelism', type=int, default=1,
+                        help='Loader connections per file (see XER_LOAD_PARALLELISM)')
+    parser.add_argument('--skip-load', action='store_true', help='Only measure parsing; no database needed')
+    parser.add_argument('--work-dir', help='Directory for generated files (default: a temporary directory)')
+    parser.add_argument('--keep-files', action='store_true', help='Keep the generated XER files')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    parser.add_argument('--verbose', action='store_true', help='Show the pipeline output of each run')
+    args = parser.parse_args()
+
+    report = {
+        'version': RESULTS_VERSION,
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {
+            'seed': args.seed,
+            'relationships_per_activity': args.relationships_per_activity,
+            'resources_per_activity': args.resources_per_activity,
+            'activities_per_wbs': args.activities_per_wbs,
+            'repeat': args.repeat,
+            'load_parallelism': args.load_parallelism,
+            'skip_load': args.skip_load,
+            'env': {name: value for name, value in sorted(os.environ.items()) if name.startswith('XER_')}
+        },
+        'results': []
+    }
+
+    with contextlib.ExitStack() as stack:
+        work_dir = args.work_dir or stack.enter_context(tempfile.TemporaryDirectory(prefix='xer-bench-'))
+        os.makedirs(work_dir, exist_ok=True)
+        for activities in args.sizes:
+            report['results'].append(benchmark_size(activities, args, work_dir))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            handle.write(output + '\n')
+        print(f"[Benchmark] Wrote results to {args.output}")
+    else:
+        print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
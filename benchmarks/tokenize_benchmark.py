@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Tokenizer throughput benchmark.
+Compares xer_reader.iter_xer_batches with the text-mode line loop it
+replaced (kept here as reference_batches) on the same files, in MB/s of
+XER input, and checks that both produce the same batches. No database is
+needed. Without --files a synthetic file is generated (see generate_xer).
+
+Usage:
+    python -m benchmarks.tokenize_benchmark [--files a.xer b.xer] [--activities 100000] [--repeat 3]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+
+# Make the repository modules importable when run as a script
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.generate_xer import (
+    DEFAULT_SEED,
+    DEFAULT_RELATIONSHIPS_PER_ACTIVITY,
+    DEFAULT_RESOURCES_PER_ACTIVITY,
+    DEFAULT_ACTIVITIES_PER_WBS,
+    generate_xer
+)
+from xer_reader import DEFAULT_BATCH_SIZE, READ_BLOCK_SIZE, sanitize_column_name, iter_xer_batches
+
+DEFAULT_ACTIVITIES = 100000
+
+def reference_batches(file_path, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    The previous tokenizer: text-mode readlines, one strip and split per
+    line. Only understands the %T/%F/%R layout.
+    """
+    current_table = None
+    current_columns = []
+    column_count = 0
+    batch = []
+
+    with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
+        while True:
+            lines = file.readlines(READ_BLOCK_SIZE)
+            if not lines:
+                break
+            for line in lines:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                if line.startswith('%T'):
+                    if batch:
+                        yield current_table, current_columns, batch
+                        batch = []
+                    current_table = line[2:].strip()
+                    current_columns = []
+                    column_count = 0
+                    continue
+                if line.startswith('%F') and current_table:
+                    raw_columns = [col.strip() for col in line[2:].split('\t')]
+                    current_columns = [sanitize_column_name(raw_col, i) for i, raw_col in enumerate(raw_columns)]
+                    column_count = len(current_columns)
+                    continue
+                if line.startswith('%R') and current_table and current_columns:
+                    data_values = line[2:].split('\t')
+                    if len(data_values) < column_count:
+                        data_values.extend([''] * (column_count - len(data_values)))
+                    batch.append(tuple([value.strip() or None for value in data_values[:column_count]]))
+                    if len(batch) >= batch_size:
+                        yield current_table, current_columns, batch
+                        batch = []
+                    continue
+                if line.startswith('%E') and current_table:
+                    if batch:
+                        yield current_table, current_columns, batch
+                        batch = []
+                    current_table = None
+                    current_columns = []
+                    column_count = 0
+    if batch:
+        yield current_table, current_columns, batch
+
+def measure(tokenizer, path, batch_size, repeat):
+    """Tokenize a file `repeat` times; returns the best time and the row count"""
+    best = None
+    rows = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = sum(len(records) for _, _, records in tokenizer(path, batch_size))
+        seconds = time.perf_counter() - started
+        best = seconds if best is None else min(best, seconds)
+    return best, rows
+
+def benchmark_file(path, batch_size, repeat):
+    """Measure both tokenizers on one file; returns its result entry"""
+    megabytes = os.path.getsize(path) / (1024 * 1024)
+    reference_seconds, reference_rows = measure(reference_batches, path, batch_size, repeat)
+    mmap_seconds, mmap_rows = measure(iter_xer_batches, path, batch_size, repeat)
+    identical = list(reference_batches(path, batch_size)) == list(iter_xer_batches(path, batch_size))
+    entry = {
+        'file': os.path.basename(path),
+        'megabytes': round(megabytes, 2),
+        'reference': {'seconds': round(reference_seconds, 4), 'rows': reference_rows,
+                      'mb_per_second': round(megabytes / reference_seconds, 1)},
+        'mmap': {'seconds': round(mmap_seconds, 4), 'rows': mmap_rows,
+                 'mb_per_second': round(megabytes / mmap_seconds, 1)},
+        'speedup': round(reference_seconds / mmap_seconds, 2),
+        'identical': identical
+    }
+    print(f"[Benchmark] {entry['file']}: line loop {entry['reference']['mb_per_second']} MB/s, "
+          f"mmap {entry['mmap']['mb_per_second']} MB/s ({entry['speedup']}x, "
+          f"{'identical' if identical else 'different'} output)", file=sys.stderr)
+    return entry
+
+def main():
+    """
+    Benchmark the tokenizers on the given or a generated file and print the JSON report.
+    """
+    parser = argparse.ArgumentParser(description='Compare XER tokenizer throughput')
+    parser.add_argument('--files', nargs='+', help='XER files to tokenize (default: generate one)')
+    parser.add_argument('--activities', type=int, default=DEFAULT_ACTIVITIES,
+                        help='Activities of the generated file')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per tokenizer; the best is reported')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        files = args.files
+        if not files:
+            work_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix='xer-tokenize-'))
+            path = os.path.join(work_dir, f'BENCH{args.activities}_2025-01-06.xer')
+            generate_xer(
+                path, args.activities, args.seed, DEFAULT_RELATIONSHIPS_PER_ACTIVITY,
+                DEFAULT_RESOURCES_PER_ACTIVITY, DEFAULT_ACTIVITIES_PER_WBS
+            )
+            files = [path]
+        report = {
+            'batch_size': args.batch_size,
+            'repeat': args.repeat,
+            'results': [benchmark_file(path, args.batch_size, args.repeat) for path in files]
+        }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            handle.write(output + '\n')
+        print(f"[Benchmark] Wrote results to {args.output}")
+    else:
+        print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,25 @@
 import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import weakref
+import threading
+from contextlib import contextmanager
 import psycopg2
 from psycopg2 import pool
 from psycopg2 import extras
 from dotenv import load_dotenv
 import logging
 
+from config.query_cache import (
+    QueryCache,
+    table_tag,
+    make_key,
+    extract_relations
+)
+
 # Load environment variables
 load_dotenv()
 
@@ -22,9 +37,54 @@ DB_CONFIG = {
 POOL_MIN_CONNECTIONS = 1
 POOL_MAX_CONNECTIONS = int(os.getenv('POSTGRES_MAX_CONNECTIONS', '20'))
 
+# Seconds get_connection waits for a free pooled connection before raising PoolError
+POOL_ACQUIRE_TIMEOUT = float(os.getenv('POSTGRES_POOL_TIMEOUT', '60'))
+
+# Rows fetched per network round trip by the streaming query helpers
+STREAM_ITERSIZE = int(os.getenv('POSTGRES_STREAM_ITERSIZE', '2000'))
+
+# Statements (or VALUES rows) sent per network round trip by the batch helpers
+BATCH_PAGE_SIZE = int(os.getenv('POSTGRES_BATCH_PAGE_SIZE', '1000'))
+
+# Optional cache of SELECT results (see config/query_cache.py)
+QUERY_CACHE_ENABLED = os.getenv('POSTGRES_QUERY_CACHE', 'false').lower() == 'true'
+QUERY_CACHE_SIZE = int(os.getenv('POSTGRES_QUERY_CACHE_SIZE', '1024'))
+QUERY_CACHE_TTL = float(os.getenv('POSTGRES_QUERY_CACHE_TTL', '300'))
+
+# NOTIFY channel that carries cache invalidations between processes
+QUERY_CACHE_CHANNEL = 'query_cache_invalidate'
+
 # Global connection pool
 connection_pool = None
 
+# ThreadedConnectionPool raises PoolError as soon as it is exhausted; callers
+# queue on this semaphore instead. checked_out holds the ids of the connections
+# handed out by get_connection, so only those release a slot when returned.
+connection_slots = threading.BoundedSemaphore(POOL_MAX_CONNECTIONS)
+checked_out = set()
+checked_out_lock = threading.Lock()
+
+query_cache = QueryCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL) if QUERY_CACHE_ENABLED else None
+
+# Connection that LISTENs for invalidations from other processes, opened on first cache use
+cache_listener = None
+cache_listener_lock = threading.Lock()
+
+# {connection: {statement name: parameter count}} of the statements PREPAREd on each pooled connection
+prepared_statements = weakref.WeakKeyDictionary()
+prepared_statements_lock = threading.Lock()
+
+# %s placeholders (but not %%s) in psycopg2 query text
+PLACEHOLDER_PATTERN = re.compile(r'%%|%s')
+
+# {relation: frozenset of relations it reads}; empty for tables, filled from pg_depend for views
+relation_sources = {}
+
+# Time spent in get_connection, in total and per calling thread
+pool_wait_totals = {'acquisitions': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+pool_wait_lock = threading.Lock()
+thread_pool_waits = threading.local()
+
 def init_connection_pool():
     """Initialize the PostgreSQL connection pool"""
     global connection_pool
@@ -40,26 +100,198 @@ def init_connection_pool():
         print(f"❌ Error creating connection pool: {error}")
         raise error
 
-def get_connection():
-    """Get a connection from the pool"""
+def get_connection(timeout=None):
+    """
+    Get a connection from the pool. When all POOL_MAX_CONNECTIONS are in use,
+    wait up to `timeout` seconds (default POOL_ACQUIRE_TIMEOUT) for one to be
+    returned, then raise PoolError.
+    """
     global connection_pool
     if connection_pool is None:
         init_connection_pool()
     
+    timeout = POOL_ACQUIRE_TIMEOUT if timeout is None else timeout
+    started = time.perf_counter()
+    if not connection_slots.acquire(timeout=timeout):
+        error = pool.PoolError(
+            f"No database connection became available within {timeout:g}s "
+            f"(POSTGRES_MAX_CONNECTIONS={POOL_MAX_CONNECTIONS})"
+        )
+        print(f"❌ Error getting connection from pool: {error}")
+        raise error
     try:
-        return connection_pool.getconn()
+        connection = connection_pool.getconn()
     except Exception as error:
+        connection_slots.release()
         print(f"❌ Error getting connection from pool: {error}")
         raise error
+    with checked_out_lock:
+        checked_out.add(id(connection))
+    record_pool_wait(time.perf_counter() - started)
+    return connection
+
+def record_pool_wait(seconds):
+    """Add one connection acquisition to the pool wait statistics"""
+    with pool_wait_lock:
+        pool_wait_totals['acquisitions'] += 1
+        pool_wait_totals['wait_seconds'] += seconds
+        pool_wait_totals['max_wait_seconds'] = max(pool_wait_totals['max_wait_seconds'], seconds)
+    thread_pool_waits.acquisitions = getattr(thread_pool_waits, 'acquisitions', 0) + 1
+    thread_pool_waits.wait_seconds = getattr(thread_pool_waits, 'wait_seconds', 0.0) + seconds
+
+def get_pool_wait_stats(current_thread=False):
+    """Return cumulative get_connection counts and wait seconds, for the process or the calling thread"""
+    if current_thread:
+        return {
+            'acquisitions': getattr(thread_pool_waits, 'acquisitions', 0),
+            'wait_seconds': getattr(thread_pool_waits, 'wait_seconds', 0.0)
+        }
+    with pool_wait_lock:
+        return dict(pool_wait_totals)
 
 def return_connection(connection):
     """Return a connection to the pool"""
     global connection_pool
     if connection_pool and connection:
-        connection_pool.putconn(connection)
+        with checked_out_lock:
+            held = id(connection) in checked_out
+            checked_out.discard(id(connection))
+        try:
+            connection_pool.putconn(connection)
+        finally:
+            if held:
+                connection_slots.release()
+
+def poll_cache_invalidations():
+    """Apply invalidations NOTIFYed by other processes, such as XER ingestions"""
+    global cache_listener
+    with cache_listener_lock:
+        try:
+            if cache_listener is None:
+                cache_listener = psycopg2.connect(**DB_CONFIG)
+                cache_listener.autocommit = True
+                with cache_listener.cursor() as cursor:
+                    cursor.execute(f'LISTEN {QUERY_CACHE_CHANNEL}')
+            cache_listener.poll()
+        except psycopg2.Error as error:
+            # Invalidations may have been missed; start over and retry the listener next time
+            print(f"❌ Query cache listener error: {error}")
+            if cache_listener is not None:
+                cache_listener.close()
+            cache_listener = None
+            query_cache.clear()
+            return
+        notifies = list(cache_listener.notifies)
+        del cache_listener.notifies[:]
+    for notify in notifies:
+        try:
+            change = json.loads(notify.payload)
+        except ValueError:
+            query_cache.clear()
+            continue
+        query_cache.invalidate(change.get('tables', ()), change.get('project_ids', ()), change.get('file_ids', ()))
+
+def publish_invalidation(cursor, tables=(), project_ids=(), file_ids=()):
+    """NOTIFY cache invalidation on cursor's transaction; it is delivered when the transaction commits"""
+    change = {
+        'tables': sorted(tables),
+        'project_ids': sorted(str(project_id) for project_id in project_ids),
+        'file_ids': sorted(str(file_id) for file_id in file_ids)
+    }
+    cursor.execute("SELECT pg_notify(%s, %s)", (QUERY_CACHE_CHANNEL, json.dumps(change)))
+    return change
+
+def invalidate_query_cache(tables=(), project_ids=(), file_ids=()):
+    """
+    Drop cached results that depend on the given tables (optionally only those
+    scoped to the given projects/file_ids), here and, through NOTIFY, in every
+    other process using the cache. Called after an ingestion commits.
+    """
+    connection = get_connection()
+    try:
+        with connection.cursor() as cursor:
+            change = publish_invalidation(cursor, tables, project_ids, file_ids)
+        connection.commit()
+        if query_cache is not None:
+            query_cache.invalidate(change['tables'], change['project_ids'], change['file_ids'])
+    except psycopg2.Error as error:
+        connection.rollback()
+        print(f"❌ Could not publish query cache invalidation: {error}")
+        if query_cache is not None:
+            query_cache.clear()
+    finally:
+        return_connection(connection)
+
+def get_query_cache_stats():
+    """Return the cache hit/miss/eviction counters, or None if the cache is disabled"""
+    return query_cache.stats() if query_cache is not None else None
+
+def resolve_relations(cursor, relations):
+    """Expand views among relations into every relation they read, recursively"""
+    resolved = set()
+    pending = set(relations)
+    while pending:
+        unknown = [name for name in pending if name not in relation_sources]
+        if unknown:
+            cursor.execute("""
+                SELECT v.relname, s.relname
+                FROM pg_class v
+                JOIN pg_rewrite r ON r.ev_class = v.oid
+                JOIN pg_depend d ON d.objid = r.oid
+                    AND d.classid = 'pg_rewrite'::regclass
+                    AND d.refclassid = 'pg_class'::regclass
+                JOIN pg_class s ON s.oid = d.refobjid AND s.oid <> v.oid
+                WHERE v.relname = ANY(%s)
+            """, (unknown,))
+            found = {}
+            for view_name, source_name in cursor.fetchall():
+                found.setdefault(view_name, set()).add(source_name)
+            for name in unknown:
+                relation_sources[name] = frozenset(found.get(name, ()))
+        resolved |= pending
+        pending = set().union(*(relation_sources[name] for name in pending)) - resolved
+    return resolved
+
+def lookup_cached_result(query, params, shape, use_cache):
+    """Return (cache_key, cached_result); the key is None when the result must not be cached"""
+    if query_cache is None or not use_cache or not query.strip().upper().startswith('SELECT'):
+        return None, None
+    key = make_key(query, params, shape)
+    if key is None:
+        return None, None
+    poll_cache_invalidations()
+    hit, result = query_cache.get(key)
+    return key, result if hit else None
 
-def execute_query(query, params=None):
-    """Execute a query and return results"""
+def store_cached_result(cursor, key, query, result, cache_tags):
+    """Cache a SELECT result under the tables it reads and the caller's scope tags"""
+    if key is None:
+        return
+    tags = {table_tag(name) for name in resolve_relations(cursor, extract_relations(query))}
+    tags.update(cache_tags or ())
+    query_cache.put(key, result, tags)
+
+def commit_write(connection, cursor, query):
+    """Commit a write statement, invalidating cached results of the tables it touched"""
+    tables = extract_relations(query)
+    if tables:
+        publish_invalidation(cursor, tables)
+    connection.commit()
+    if tables and query_cache is not None:
+        query_cache.invalidate(tables)
+
+def execute_query(query, params=None, cache_tags=None, use_cache=True):
+    """
+    Execute a query and return results.
+    With POSTGRES_QUERY_CACHE enabled, SELECT results are cached; cache_tags
+    scopes them to a project or snapshot (config.query_cache.project_tag /
+    file_tag) so ingesting another project does not evict them. Cached rows
+    are shared between callers and must not be modified.
+    """
+    cache_key, cached = lookup_cached_result(query, params, 'rows', use_cache)
+    if cached is not None:
+        return {'rows': list(cached['rows']), 'columns': list(cached['columns'])}
+    
     connection = None
     cursor = None
     try:
@@ -76,13 +308,15 @@ def execute_query(query, params=None):
             results = cursor.fetchall()
             # Get column names
             columns = [desc[0] for desc in cursor.description]
+            store_cached_result(cursor, cache_key, query, {'rows': list(results), 'columns': columns}, cache_tags)
             return {
                 'rows': results,
                 'columns': columns
             }
         else:
-            connection.commit()
-            return {'affected_rows': cursor.rowcount}
+            affected_rows = cursor.rowcount
+            commit_write(connection, cursor, query)
+            return {'affected_rows': affected_rows}
             
     except Exception as error:
         if connection:
@@ -95,13 +329,21 @@ def execute_query(query, params=None):
         if connection:
             return_connection(connection)
 
-def execute_query_dict(query, params=None):
-    """Execute a query and return results as list of dictionaries"""
+def execute_query_dict(query, params=None, cache_tags=None, use_cache=True):
+    """
+    Execute a query and return results as list of dictionaries.
+    Cached like execute_query.
+    """
+    cache_key, cached = lookup_cached_result(query, params, 'dicts', use_cache)
+    if cached is not None:
+        return list(cached)
+    
     connection = None
     cursor = None
     try:
         connection = get_connection()
-        cursor = connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        # RealDictCursor builds each row as a dict directly, without a second copy
+        cursor = connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         
         if params:
             cursor.execute(query, params)
@@ -110,10 +352,12 @@ def execute_query_dict(query, params=None):
         
         if query.strip().upper().startswith('SELECT'):
             results = cursor.fetchall()
-            return [dict(row) for row in results]
+            store_cached_result(cursor, cache_key, query, list(results), cache_tags)
+            return results
         else:
-            connection.commit()
-            return {'affected_rows': cursor.rowcount}
+            affected_rows = cursor.rowcount
+            commit_write(connection, cursor, query)
+            return {'affected_rows': affected_rows}
             
     except Exception as error:
         if connection:
@@ -126,6 +370,149 @@ def execute_query_dict(query, params=None):
         if connection:
             return_connection(connection)
 
+@contextmanager
+def transaction():
+    """
+    Yield a cursor on a pooled connection and commit when the block succeeds,
+    roll back when it raises, then return the connection to the pool. Use it
+    to put several batch calls into one transaction.
+    """
+    connection = get_connection()
+    try:
+        with connection.cursor() as cursor:
+            yield cursor
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        return_connection(connection)
+
+def to_positional(query):
+    """Turn the %s placeholders of a query into $1, $2, ... for PREPARE; returns (query, count)"""
+    count = 0
+    def number(match):
+        nonlocal count
+        if match.group(0) == '%%':
+            return '%'
+        count += 1
+        return f'${count}'
+    return PLACEHOLDER_PATTERN.sub(number, query), count
+
+def prepare_statement(cursor, query):
+    """
+    PREPARE a query with %s placeholders on the cursor's connection, once per
+    connection; later calls on the same pooled connection reuse the plan.
+    Returns (statement_name, parameter_count).
+    """
+    connection = cursor.connection
+    name = 'stmt_' + hashlib.sha1(' '.join(query.split()).encode('utf-8')).hexdigest()[:16]
+    with prepared_statements_lock:
+        known = prepared_statements.setdefault(connection, {})
+        count = known.get(name)
+    if count is None:
+        positional, count = to_positional(query)
+        # Prepared statements belong to the session and survive rollbacks of this transaction
+        cursor.execute(f'PREPARE {name} AS {positional}')
+        with prepared_statements_lock:
+            known[name] = count
+    return name, count
+
+def execute_sql(name, count):
+    """Return the EXECUTE statement of a prepared statement with %s placeholders"""
+    return f"EXECUTE {name} ({', '.join(['%s'] * count)})" if count else f'EXECUTE {name}'
+
+def forget_prepared_statement(connection, name):
+    """Drop a statement from the tracking, e.g. after the server reported it missing"""
+    with prepared_statements_lock:
+        prepared_statements.get(connection, {}).pop(name, None)
+
+def execute_prepared(cursor, query, params=None):
+    """
+    Execute a query through a statement prepared on this connection. Results
+    are left on the cursor; committing is up to the caller.
+    """
+    name, count = prepare_statement(cursor, query)
+    try:
+        cursor.execute(execute_sql(name, count), params)
+    except psycopg2.errors.InvalidSqlStatementName:
+        # Someone ran DEALLOCATE/DISCARD on this session; prepare again next time
+        forget_prepared_statement(cursor.connection, name)
+        raise
+
+def execute_prepared_batch(cursor, query, params_list, page_size=None):
+    """
+    Execute a prepared query once per parameter tuple, sending page_size
+    EXECUTEs per round trip (default POSTGRES_BATCH_PAGE_SIZE). Committing is
+    up to the caller.
+    """
+    name, count = prepare_statement(cursor, query)
+    try:
+        extras.execute_batch(cursor, execute_sql(name, count), params_list, page_size=page_size or BATCH_PAGE_SIZE)
+    except psycopg2.errors.InvalidSqlStatementName:
+        forget_prepared_statement(cursor.connection, name)
+        raise
+
+def execute_values_batch(cursor, query, rows, template=None, page_size=None, fetch=False):
+    """
+    Run a query with a single VALUES %s placeholder for many rows, page_size
+    rows per statement (default POSTGRES_BATCH_PAGE_SIZE). Returns the
+    fetched rows with fetch=True. Committing is up to the caller.
+    """
+    return extras.execute_values(cursor, query, rows, template, page_size or BATCH_PAGE_SIZE, fetch)
+
+def execute_pipelined(cursor, statements):
+    """
+    Send a sequence of (query, params) pairs in one round trip. They run in
+    order and stop at the first error; only the last statement's result can
+    be fetched. Committing is up to the caller.
+    """
+    cursor.execute(b';'.join(cursor.mogrify(query, params) for query, params in statements))
+
+def stream_query_batches(query, params=None, batch_size=None, named=False):
+    """
+    Run a SELECT on a named server-side cursor and yield lists of at most
+    batch_size rows (default STREAM_ITERSIZE), fetched lazily as the caller
+    iterates. Rows are tuples, or namedtuples with named=True. The connection
+    is taken from the pool on the first iteration and returned as soon as the
+    result is exhausted, the generator is closed or it is garbage collected.
+    """
+    batch_size = batch_size or STREAM_ITERSIZE
+    cursor_factory = psycopg2.extras.NamedTupleCursor if named else None
+    connection = get_connection()
+    cursor = None
+    try:
+        cursor = connection.cursor(name=f'stream_{uuid.uuid4().hex}', cursor_factory=cursor_factory)
+        cursor.itersize = batch_size
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    except Exception as error:
+        print(f"❌ Database streaming query error: {error}")
+        raise error
+    finally:
+        try:
+            if cursor is not None and not cursor.closed:
+                cursor.close()
+            # Named cursors live in a transaction; end it before handing the connection back
+            connection.rollback()
+        except psycopg2.Error:
+            pass
+        return_connection(connection)
+
+def stream_query(query, params=None, itersize=None, named=False):
+    """
+    Run a SELECT on a named server-side cursor and yield its rows one at a
+    time, fetching `itersize` rows per round trip (default STREAM_ITERSIZE).
+    Memory stays bounded by itersize however large the result is; see
+    stream_query_batches for how the connection is handled.
+    """
+    for rows in stream_query_batches(query, params, itersize, named):
+        yield from rows
+
 def health_check():
     """Check database connection health"""
     try:
@@ -154,6 +541,17 @@ __all__ = [
     'execute_query_dict', 
     'get_connection',
     'return_connection',
+    'get_pool_wait_stats',
+    'invalidate_query_cache',
+    'get_query_cache_stats',
+    'stream_query',
+    'transaction',
+    'prepare_statement',
+    'execute_prepared',
+    'execute_prepared_batch',
+    'execute_values_batch',
+    'execute_pipelined',
+    'stream_query_batches',
     'health_check',
     'close_all_connections'
 ] 
\ No newline at end of file
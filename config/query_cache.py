@@ -0,0 +1,150 @@
+"""
+In-process query result cache used by config.database.
+Results are kept in an LRU bounded by entry count and TTL, keyed by the
+normalized SQL text, the parameters and the result shape. Each entry
+carries dependency tags:
+    table:<name>     every relation the query reads (views expanded to their tables)
+    project:<id>     the project the query is scoped to, if any
+    file:<id>        the snapshot (file_id) the query is scoped to, if any
+An invalidation names the tables that changed and, optionally, the
+projects and file_ids the change belongs to. An entry is dropped when it
+reads one of the tables and either has no project/file scope or is scoped
+to one of the changed projects or file_ids, so ingesting a snapshot of one
+project leaves the cached dashboards of every other project intact.
+"""
+
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+
+TABLE_TAG = 'table:'
+PROJECT_TAG = 'project:'
+FILE_TAG = 'file:'
+
+# Relations named after FROM/JOIN (reads) and INTO/UPDATE/TABLE (writes); quoted names keep their case
+RELATION_PATTERN = re.compile(
+    r'\b(?:FROM|JOIN|INTO|UPDATE|TABLE)\s+(?:ONLY\s+)?(?:"([^"]+)"|([A-Za-z_][\w$]*))(?:\s*\.\s*(?:"([^"]+)"|([A-Za-z_][\w$]*)))?',
+    re.IGNORECASE
+)
+
+# Words that can follow FROM/JOIN without naming a relation
+NON_RELATION_WORDS = {'lateral', 'select'}
+
+def table_tag(name):
+    """Return the dependency tag of a table or view"""
+    return f'{TABLE_TAG}{name}'
+
+def project_tag(project_id):
+    """Return the dependency tag of a project"""
+    return f'{PROJECT_TAG}{project_id}'
+
+def file_tag(file_id):
+    """Return the dependency tag of a snapshot"""
+    return f'{FILE_TAG}{file_id}'
+
+def normalize_sql(query):
+    """Collapse whitespace and drop a trailing semicolon so formatting does not split cache keys"""
+    return ' '.join(query.split()).rstrip(';').strip()
+
+def extract_relations(query):
+    """
+    Return the relation names a statement refers to, with PostgreSQL's case
+    folding applied (unquoted names lower case, quoted names as written).
+    """
+    relations = set()
+    for match in RELATION_PATTERN.finditer(query):
+        # A name followed by "(" is a function call, e.g. EXTRACT(YEAR FROM now())
+        if query[match.end():].lstrip().startswith('('):
+            continue
+        quoted, bare, quoted_child, bare_child = match.groups()
+        # schema.table: the table is the second part
+        if quoted_child or bare_child:
+            quoted, bare = quoted_child, bare_child
+        name = quoted or (bare or '').lower()
+        if name and name not in NON_RELATION_WORDS:
+            relations.add(name)
+    return relations
+
+def make_key(query, params, shape):
+    """Build the cache key of a query; returns None if the parameters cannot be serialized"""
+    try:
+        params_key = json.dumps(params, sort_keys=True, default=str)
+    except (TypeError, ValueError):
+        return None
+    return shape, normalize_sql(query), params_key
+
+class QueryCache:
+    """
+    Thread-safe LRU + TTL cache of query results with tag-based invalidation.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (True, value) for a fresh entry, (False, None) otherwise"""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.counters['misses'] += 1
+                return False, None
+            value, tags, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                self.counters['expirations'] += 1
+                self.counters['misses'] += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return True, value
+
+    def put(self, key, value, tags):
+        """Store a value with its dependency tags, evicting the least recently used entries"""
+        with self._lock:
+            self.entries[key] = (value, frozenset(tags), time.monotonic() + self.ttl_seconds)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def invalidate(self, tables=(), project_ids=(), file_ids=()):
+        """
+        Drop the entries that read one of `tables` and are unscoped or scoped to
+        one of `project_ids`/`file_ids`. Without tables, every entry scoped to
+        the projects or file_ids is dropped. Returns the number of entries dropped.
+        """
+        table_tags = {table_tag(name) for name in tables}
+        scope_tags = {project_tag(project_id) for project_id in project_ids}
+        scope_tags |= {file_tag(file_id) for file_id in file_ids}
+
+        with self._lock:
+            stale = []
+            for key, (_, tags, _) in self.entries.items():
+                scoped = any(tag.startswith((PROJECT_TAG, FILE_TAG)) for tag in tags)
+                if table_tags:
+                    matches = bool(tags & table_tags) and (not scoped or not scope_tags or bool(tags & scope_tags))
+                else:
+                    matches = bool(tags & scope_tags)
+                if matches:
+                    stale.append(key)
+            for key in stale:
+                del self.entries[key]
+            self.counters['invalidations'] += len(stale)
+            return len(stale)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self.counters['invalidations'] += len(self.entries)
+            self.entries.clear()
+
+    def stats(self):
+        """Return the hit/miss/eviction counters and the current size"""
+        with self._lock:
+            return dict(self.counters, entries=len(self.entries))
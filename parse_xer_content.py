@@ -1,16 +1,119 @@
 #!/usr/bin/env python3
 """
 XER File Parser for Primavera P6 Schedule Data
-Parses XER files and inserts data into SQLite database with file metadata tracking.
+Parses XER files and streams data into PostgreSQL with file metadata tracking.
 """
 
 import sys
 import os
+import io
 import re
+import json
 import time
+import uuid
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from config.database import execute_query, execute_query_dict
+import psycopg2
+import psycopg2.errors
+from psycopg2.extras import execute_values
+from config.database import (
+    get_connection,
+    return_connection,
+    invalidate_query_cache,
+    execute_pipelined,
+    POOL_MAX_CONNECTIONS
+)
+from xer_reader import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_PREFETCH_DEPTH,
+    iter_xer_batches,
+    list_xer_members,
+    prefetch_batches
+)
+from xer_types import (
+    TEXT,
+    infer_column_type,
+    infer_column_types,
+    merge_types,
+    values_conform
+)
+from xer_schema import get_table_columns, note_schema_change, publish_schema_changes
+from xer_incremental import (
+    ensure_snapshot_tables,
+    compute_table_hashes,
+    find_previous_snapshot,
+    filter_incremental_batches
+)
+from xer_kpi import collect_relationship_kpis
+from xer_wbs import collect_wbs_hierarchy
+from xer_read_models import READ_MODEL_SOURCES, run_post_ingest
+from xer_cpm import run_cpm
+from xer_diff import run_snapshot_diff
+from xer_columnar import COLUMNAR_EXPORT, open_snapshot_export, collect_columnar_export
+from xer_metrics import IngestMetrics, emit_metrics, log
+from xer_partitions import (
+    PARTITIONED_TABLES,
+    partition_clause,
+    create_snapshot_staging,
+    sync_staging_columns,
+    attach_snapshot_partitions,
+    discard_snapshot_partitions,
+    drop_snapshots
+)
+
+# Loader threads (each with its own pooled connection) used per file; 1 loads sequentially
+DEFAULT_LOAD_PARALLELISM = int(os.getenv('XER_LOAD_PARALLELISM', '1'))
+
+# Pooled connections a file holds at once besides its loaders: the ingestion's
+# own connection and one more for partition DDL, publishing, the post-ingest
+# stage, CPM or a streaming read of the diff
+FILE_CONNECTION_OVERHEAD = 2
+
+# Store tables that are unchanged since the project's previous published snapshot as references
+DEFAULT_INCREMENTAL = os.getenv('XER_INCREMENTAL', 'false').lower() == 'true'
+
+# Build indexes and refresh the dashboard read models after each ingestion
+DEFAULT_POST_INGEST = os.getenv('XER_POST_INGEST', 'true').lower() == 'true'
+
+# Recompute early/late dates and float of each snapshot (see xer_cpm)
+DEFAULT_CPM = os.getenv('XER_CPM', 'true').lower() == 'true'
+
+# Diff each snapshot against the previous published snapshot of its project (see xer_diff)
+DEFAULT_DIFF = os.getenv('XER_SCHEDULE_DIFF', 'true').lower() == 'true'
+
+# Tables written for every snapshot besides the XER tables; cached queries on them
+# are invalidated together with the XER tables when a file is ingested
+SNAPSHOT_TABLES = (
+    'file_metadata', 'xer_kpi_summary', 'xer_wbs_nodes', 'xer_wbs_closure', 'xer_cpm_results',
+    'xer_table_snapshots', 'xer_schedule_diff',
+    'xer_schedule_diff_summary'
+) + tuple(READ_MODEL_SOURCES)
+
+# Format ID of the two-phase commit transaction IDs used by parallel loads
+XER_TPC_FORMAT_ID = 0x584552
+
+# Rows per multi-row INSERT when a COPY batch has to fall back to execute_values
+EXECUTE_VALUES_PAGE_SIZE = int(os.getenv('XER_EXECUTE_VALUES_PAGE_SIZE', '500'))
+
+# JSON-lines file that receives rows PostgreSQL refused to load
+REJECT_LOG_PATH = os.getenv(
+    'XER_REJECT_LOG',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'xer_rejects.jsonl')
+)
+
+# Lock/serialization errors that are worth retrying after rolling back a savepoint
+RETRYABLE_ERRORS = (
+    psycopg2.errors.DeadlockDetected,
+    psycopg2.errors.SerializationFailure,
+    psycopg2.errors.LockNotAvailable,
+)
+
+# Characters that must be escaped in PostgreSQL COPY text format
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
 
 def extract_project_info_from_filename(filename):
     """
@@ -97,371 +200,982 @@ def extract_project_info_from_filename(filename):
     
     return project_info
 
-def sanitize_column_name(col_name, index):
-    """
-    Sanitize column name for database use.
-    Returns a valid column name.
-    """
-    if not col_name or not col_name.strip():
-        return f"col_{index}"
-    
-    # Remove leading/trailing whitespace
-    col_name = col_name.strip()
-    
-    # Replace invalid characters with underscores
-    sanitized = re.sub(r'[^\w]', '_', col_name)
-    
-    # Ensure it doesn't start with a number
-    if sanitized and sanitized[0].isdigit():
-        sanitized = f"col_{sanitized}"
-    
-    # If sanitization resulted in empty string, use fallback
-    if not sanitized:
-        sanitized = f"col_{index}"
-    
-    return sanitized
-
-def parse_xer_file(file_path):
-    """
-    Parse XER file and return structured data with column mapping.
-    Returns a dictionary with table names as keys and table data as values.
-    Each table data contains 'columns', 'column_mapping', and 'records'.
-    """
-    print(f"[Parser] Starting to parse XER file: {file_path}")
-    
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"XER file not found: {file_path}")
-    
-    xer_data = {}
-    current_table = None
-    current_columns = []
-    current_column_mapping = {}
-    
-    try:
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-            for line_num, line in enumerate(file, 1):
-                line = line.strip()
-                
-                # Skip empty lines and comments
-                if not line or line.startswith('#'):
-                    continue
-                
-                # Check for table definition
-                if line.startswith('%T'):
-                    current_table = line[2:].strip()
-                    xer_data[current_table] = {
-                        'columns': [],
-                        'column_mapping': {},
-                        'records': []
-                    }
-                    current_columns = []
-                    current_column_mapping = {}
-                    print(f"[Parser] Found table: {current_table}")
-                    continue
-                
-                # Check for column definition
-                if line.startswith('%F') and current_table:
-                    raw_columns = [col.strip() for col in line[2:].split('\t')]
-                    current_columns = []
-                    current_column_mapping = {}
-                    
-                    for i, raw_col in enumerate(raw_columns):
-                        sanitized_col = sanitize_column_name(raw_col, i)
-                        current_columns.append(sanitized_col)
-                        current_column_mapping[sanitized_col] = i  # Map to original position
-                    
-                    xer_data[current_table]['columns'] = current_columns
-                    xer_data[current_table]['column_mapping'] = current_column_mapping
-                    
-                    print(f"[Parser] Columns for {current_table}: {len(current_columns)} columns")
-                    print(f"[Parser] Column names: {current_columns[:10]}...")  # Show first 10 for debugging
-                    continue
-                
-                # Check for data rows
-                if line.startswith('%R') and current_table and current_columns:
-                    data_values = line[2:].split('\t')
-                    
-                    # Create record dictionary using sanitized column names
-                    record = {}
-                    for col_name in current_columns:
-                        original_index = current_column_mapping[col_name]
-                        value = data_values[original_index] if original_index < len(data_values) else ''
-                        # Clean up the value
-                        value = value.strip() if value else ''
-                        if value == '':
-                            value = None
-                        record[col_name] = value
-                    
-                    xer_data[current_table]['records'].append(record)
-                    continue
-                
-                # Check for end of table
-                if line.startswith('%E') and current_table:
-                    record_count = len(xer_data[current_table]['records'])
-                    print(f"[Parser] Completed table {current_table}: {record_count} records")
-                    current_table = None
-                    current_columns = []
-                    current_column_mapping = {}
-                    continue
-    
-    except Exception as e:
-        print(f"[Parser] Error reading XER file at line {line_num}: {str(e)}")
-        raise
-    
-    print(f"[Parser] Successfully parsed XER file. Found {len(xer_data)} tables.")
-    return xer_data
-
-def insert_file_metadata(db_cursor, filename, project_info):
+def insert_file_metadata(db_cursor, filename, project_info, schema_changes=None):
     """
     Insert file metadata and return the file_id.
+    The table is only created/altered if the schema catalog says it is missing.
+    The snapshot starts unpublished; publish_snapshot() makes it visible once
+    it is fully loaded.
     """
-    print(f"[Database] Inserting file metadata for: {filename}")
+    log(f"[Database] Inserting file metadata for: {filename}")
     
     # Create file_metadata table if it doesn't exist
     create_metadata_table_sql = """
         CREATE TABLE IF NOT EXISTS file_metadata (
-            file_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_id SERIAL PRIMARY KEY,
             file_name TEXT NOT NULL,
             project_id INTEGER,
             snapshot_date TEXT,
             file_category TEXT,
-            bl_version TEXT
+            bl_version TEXT,
+            project_name TEXT,
+            published BOOLEAN NOT NULL DEFAULT TRUE,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
         )
     """
     
-    execute_with_retry(db_cursor, create_metadata_table_sql)
+    metadata_columns = get_table_columns(db_cursor, 'file_metadata', schema_changes)
+    if metadata_columns is None or not {'published', 'created_at'} <= set(metadata_columns):
+        execute_with_retry(db_cursor, create_metadata_table_sql)
+        # Older databases were created before project_name and publishing were tracked;
+        # their snapshots were complete when committed, so they count as published
+        execute_with_retry(db_cursor, "ALTER TABLE file_metadata ADD COLUMN IF NOT EXISTS project_name TEXT")
+        execute_with_retry(
+            db_cursor, "ALTER TABLE file_metadata ADD COLUMN IF NOT EXISTS published BOOLEAN NOT NULL DEFAULT TRUE"
+        )
+        # Lets retention tell abandoned unpublished snapshots from ones still being ingested
+        execute_with_retry(
+            db_cursor, "ALTER TABLE file_metadata ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT now()"
+        )
+        note_schema_change(db_cursor, 'file_metadata', schema_changes)
     
     # Insert file metadata
     insert_metadata_sql = """
-        INSERT INTO file_metadata (file_name, project_id, snapshot_date, file_category, bl_version)
-        VALUES (?, ?, ?, ?, ?)
+        INSERT INTO file_metadata (file_name, project_id, project_name, snapshot_date, file_category, bl_version, published)
+        VALUES (%s, %s, %s, %s, %s, %s, FALSE)
+        RETURNING file_id
     """
     
     execute_with_retry(db_cursor, insert_metadata_sql, (
         filename,
         project_info.get('project_id'),
+        project_info.get('project_name'),
         project_info.get('snapshot_date'),
         project_info.get('file_category'),
         project_info.get('bl_version')
     ))
     
-    file_id = db_cursor.lastrowid
-    print(f"[Database] File metadata inserted with file_id: {file_id}")
+    file_id = db_cursor.fetchone()[0]
+    log(f"[Database] File metadata inserted with file_id: {file_id}")
     return file_id
 
-def create_table_if_not_exists(db_cursor, table_name, columns):
+def create_table_if_not_exists(db_cursor, table_name, columns, column_types=None, schema_changes=None):
     """
     Create table if it doesn't exist based on XER data structure.
+    column_types, if given, holds the inferred type of each column (default TEXT).
+    The large snapshot tables are created partitioned by file_id (see xer_partitions).
     """
     if not columns:
         print(f"[Database] Warning: No columns provided for table {table_name}")
         return
     
+    if column_types is None:
+        column_types = [TEXT] * len(columns)
+    
     # Create column definitions
     column_defs = []
-    for col_name in columns:
-        column_defs.append(f'"{col_name}" TEXT')
+    for col_name, column_type in zip(columns, column_types):
+        column_defs.append(f'"{col_name}" {column_type}')
     
     # Add file_id column if not present
     if 'file_id' not in [col.lower() for col in columns]:
         column_defs.append('file_id INTEGER')
     
-    create_sql = f'CREATE TABLE IF NOT EXISTS "{table_name}" ({", ".join(column_defs)})'
+    create_sql = f'CREATE TABLE IF NOT EXISTS "{table_name}" ({", ".join(column_defs)}){partition_clause(table_name)}'
     
     try:
         execute_with_retry(db_cursor, create_sql)
-        print(f"[Database] Table {table_name} created/verified with {len(column_defs)} columns")
+        note_schema_change(db_cursor, table_name, schema_changes)
+        log(f"[Database] Table {table_name} created/verified with {len(column_defs)} columns")
     except Exception as e:
         print(f"[Database] Error creating table {table_name}: {str(e)}")
         print(f"[Database] SQL: {create_sql}")
         raise
 
+@contextmanager
+def savepoint(db_cursor, name):
+    """
+    Run a block under a SAVEPOINT so a failing statement only undoes that block
+    instead of aborting the surrounding transaction. The savepoint commands use
+    a separate cursor so results of db_cursor can still be fetched afterwards.
+    """
+    with db_cursor.connection.cursor() as control:
+        control.execute(f'SAVEPOINT {name}')
+        try:
+            yield
+        except Exception:
+            control.execute(f'ROLLBACK TO SAVEPOINT {name}')
+            control.execute(f'RELEASE SAVEPOINT {name}')
+            raise
+        control.execute(f'RELEASE SAVEPOINT {name}')
+
 def execute_with_retry(cursor, sql, params=None, max_retries=5):
     """
-    Execute SQL with retry logic for database busy errors.
+    Execute SQL with retry logic for lock timeouts, deadlocks and
+    serialization failures. Each attempt runs under a savepoint, so a failed
+    statement leaves the surrounding transaction usable.
     """
     for attempt in range(max_retries):
         try:
-            if params:
-                cursor.execute(sql, params)
-            else:
-                cursor.execute(sql)
+            with savepoint(cursor, 'xer_retry'):
+                if params:
+                    cursor.execute(sql, params)
+                else:
+                    cursor.execute(sql)
             return
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e) and attempt < max_retries - 1:
-                wait_time = (attempt + 1) * 0.5  # Exponential backoff
-                print(f"[Database] Database locked, retrying in {wait_time}s (attempt {attempt + 1}/{max_retries})")
+        except RETRYABLE_ERRORS as e:
+            if attempt < max_retries - 1:
+                wait_time = (attempt + 1) * 0.5  # Linear backoff
+                print(f"[Database] Transient error ({e.pgcode}), retrying in {wait_time}s (attempt {attempt + 1}/{max_retries})")
                 time.sleep(wait_time)
                 continue
-            else:
-                raise
+            raise
 
-def get_existing_columns(db_cursor, table_name):
+def get_existing_columns(db_cursor, table_name, schema_changes=None):
     """
-    Get list of existing columns in a table.
+    Get list of existing columns in a table from the schema catalog.
     Returns empty list if table doesn't exist.
     """
+    return list(get_column_types(db_cursor, table_name, schema_changes))
+
+def get_column_types(db_cursor, table_name, schema_changes=None):
+    """
+    Get the type of every existing column in a table, keyed by lowercase name,
+    from the schema catalog. Returns an empty dictionary if the table doesn't exist.
+    """
+    return get_table_columns(db_cursor, table_name, schema_changes) or {}
+
+def alter_column_type(db_cursor, table_name, column, column_type, schema_changes=None):
+    """
+    Widen an existing column to column_type. Returns True on success; fails
+    (and returns False) e.g. when a view depends on the column.
+    """
+    alter_sql = f'ALTER TABLE "{table_name}" ALTER COLUMN "{column}" TYPE {column_type} USING "{column}"::{column_type}'
     try:
-        execute_with_retry(db_cursor, f'PRAGMA table_info("{table_name}")')
-        columns = []
-        for row in db_cursor.fetchall():
-            columns.append(row[1])  # Column name is at index 1
-        return columns
+        execute_with_retry(db_cursor, alter_sql)
+        note_schema_change(db_cursor, table_name, schema_changes)
+        log(f"[Database] Changed column '{column}' of {table_name} to {column_type}")
+        return True
     except Exception as e:
-        print(f"[Database] Error getting columns for table {table_name}: {str(e)}")
+        print(f"[Database] Error changing column '{column}' of {table_name} to {column_type}: {str(e)}")
+        return False
+
+def evolve_column_types(db_cursor, table_name, columns, inferred_types, existing_types, schema_changes=None):
+    """
+    Reconcile inferred types with the types already in the table.
+    A column whose stored type cannot hold the new values is widened (e.g.
+    BIGINT to DOUBLE PRECISION, or anything to TEXT); stored types are never
+    narrowed. Returns the effective type of each column.
+    """
+    effective_types = []
+    for col, inferred_type in zip(columns, inferred_types):
+        existing_type = existing_types.get(col.lower())
+        if existing_type is None:
+            effective_types.append(inferred_type)
+            continue
+        
+        target_type = merge_types(existing_type, inferred_type)
+        if target_type != existing_type and not alter_column_type(
+                db_cursor, table_name, col, target_type, schema_changes):
+            target_type = existing_type
+        effective_types.append(target_type)
+    
+    return effective_types
+
+def widen_nonconforming_columns(db_cursor, table_name, columns, column_types, records, schema_changes=None):
+    """
+    Check a batch against the column types chosen from the first batch and
+    widen any typed column whose values no longer parse. column_types is
+    updated in place.
+    """
+    column_values = None
+    for index, column_type in enumerate(column_types):
+        if column_type == TEXT:
+            continue
+        if column_values is None:
+            column_values = list(zip(*records))
+        if values_conform(column_type, column_values[index]):
+            continue
+        
+        target_type = merge_types(column_type, infer_column_type(columns[index], column_values[index]))
+        if alter_column_type(db_cursor, table_name, columns[index], target_type, schema_changes):
+            column_types[index] = target_type
+
+def add_missing_columns(db_cursor, table_name, required_columns, existing_columns, column_types=None,
+                        schema_changes=None):
+    """
+    Add any missing columns to the table with a single ALTER TABLE.
+    column_types, if given, maps column name to its type (default TEXT).
+    Returns the list of added columns.
+    """
+    existing_lower = set(col.lower() for col in existing_columns)
+    missing_columns = [col for col in required_columns if col.lower() not in existing_lower]
+    
+    if not missing_columns:
         return []
+    
+    log(f"[Database] Adding {len(missing_columns)} missing columns to {table_name}: {missing_columns}")
+    
+    # IF NOT EXISTS keeps this safe when another process added a column since the catalog was read
+    add_clauses = ', '.join(
+        f'ADD COLUMN IF NOT EXISTS "{col}" {(column_types or {}).get(col, TEXT)}'
+        for col in missing_columns
+    )
+    try:
+        execute_with_retry(db_cursor, f'ALTER TABLE "{table_name}" {add_clauses}')
+        note_schema_change(db_cursor, table_name, schema_changes)
+    except Exception as e:
+        print(f"[Database] Error adding columns to table {table_name}: {str(e)}")
+        raise
+    
+    return missing_columns
 
-def add_missing_columns(db_cursor, table_name, required_columns, existing_columns):
+def prepare_table_for_insert(db_cursor, table_name, columns, sample_records=(), schema_changes=None):
     """
-    Add any missing columns to the table.
+    Create or extend a table so it can receive records with the given columns.
+    Column types are inferred from the P6 field suffixes and sample_records,
+    and existing columns are widened if the new file disagrees with them.
+    The schema catalog is consulted first, so a table that already matches
+    needs no DDL or introspection round trips.
+    Returns the final column list (including file_id) and the effective type
+    of each XER column.
     """
-    missing_columns = []
-    existing_lower = [col.lower() for col in existing_columns]
+    # Add file_id to columns if not present
+    final_columns = columns.copy()
+    if 'file_id' not in [col.lower() for col in final_columns]:
+        final_columns.append('file_id')
+    
+    inferred_types = infer_column_types(columns, sample_records)
+    
+    existing_types = get_table_columns(db_cursor, table_name, schema_changes)
+    if existing_types is None:
+        # Create table if it doesn't exist (with initial columns)
+        create_table_if_not_exists(db_cursor, table_name, columns, inferred_types, schema_changes)
+        existing_types = get_column_types(db_cursor, table_name, schema_changes)
+    
+    # Add any missing columns
+    new_column_types = dict(zip(columns, inferred_types))
+    new_column_types['file_id'] = 'INTEGER'
+    add_missing_columns(db_cursor, table_name, final_columns, list(existing_types), new_column_types, schema_changes)
+    
+    # Widen columns whose stored type cannot hold this file's values
+    column_types = evolve_column_types(db_cursor, table_name, columns, inferred_types, existing_types, schema_changes)
+    typed_count = sum(1 for column_type in column_types if column_type != TEXT)
+    log(f"[Database] Table {table_name} ready with {typed_count} typed columns out of {len(columns)}")
+    
+    return final_columns, column_types
+
+def build_row_values(columns, final_columns, records, file_id):
+    """
+    Turn record tuples aligned with `columns` into tuples aligned with
+    final_columns, filling in the file_id column.
+    """
+    if len(final_columns) > len(columns):
+        # file_id was appended after the XER columns
+        file_id_suffix = (file_id,)
+        return [record + file_id_suffix for record in records]
     
-    for col in required_columns:
-        if col.lower() not in existing_lower:
-            missing_columns.append(col)
+    if 'file_id' in columns:
+        index = columns.index('file_id')
+        return [record[:index] + (file_id,) + record[index + 1:] for record in records]
     
-    if missing_columns:
-        print(f"[Database] Adding {len(missing_columns)} missing columns to {table_name}: {missing_columns}")
+    return records
+
+def format_copy_buffer(rows):
+    """
+    Render row tuples as PostgreSQL COPY text format in an in-memory buffer.
+    """
+    buffer = io.StringIO()
+    write = buffer.write
+    for row in rows:
+        write('\t'.join(
+            '\\N' if value is None else str(value).translate(COPY_ESCAPES)
+            for value in row
+        ))
+        write('\n')
+    buffer.seek(0)
+    return buffer
+
+def write_rejects(table_name, file_id, final_columns, rejected):
+    """
+    Append rejected rows to the JSON-lines reject log.
+    `rejected` is a list of (row_values, error_message) pairs.
+    """
+    if not rejected:
+        return
+    
+    try:
+        os.makedirs(os.path.dirname(REJECT_LOG_PATH), exist_ok=True)
+        with open(REJECT_LOG_PATH, 'a', encoding='utf-8') as log_file:
+            for row, error in rejected:
+                log_file.write(json.dumps({
+                    'table': table_name,
+                    'file_id': file_id,
+                    'error': error,
+                    'row': dict(zip(final_columns, row))
+                }, default=str) + '\n')
+        print(f"[Database] Wrote {len(rejected)} rejected rows for {table_name} to {REJECT_LOG_PATH}")
+    except Exception as e:
+        print(f"[Database] Warning: Could not write reject log: {str(e)}")
+
+def insert_rows_with_fallback(db_cursor, table_name, final_columns, rows):
+    """
+    Insert row tuples with multi-row execute_values statements. A page that
+    fails is retried row by row so that only the offending rows are rejected.
+    Returns (inserted_count, rejected) where rejected holds (row, error) pairs.
+    """
+    quoted_columns = ', '.join([f'"{col}"' for col in final_columns])
+    insert_sql = f'INSERT INTO "{table_name}" ({quoted_columns}) VALUES %s'
+    single_sql = f'INSERT INTO "{table_name}" ({quoted_columns}) VALUES ({", ".join(["%s"] * len(final_columns))})'
+    
+    inserted_count = 0
+    rejected = []
+    for start in range(0, len(rows), EXECUTE_VALUES_PAGE_SIZE):
+        page = rows[start:start + EXECUTE_VALUES_PAGE_SIZE]
+        try:
+            with savepoint(db_cursor, 'xer_page'):
+                execute_values(db_cursor, insert_sql, page, page_size=len(page))
+            inserted_count += len(page)
+            continue
+        except Exception:
+            pass
         
-        for col in missing_columns:
+        # Isolate the bad rows in this page; savepoint, insert and release go in one round trip
+        for row in page:
             try:
-                alter_sql = f'ALTER TABLE "{table_name}" ADD COLUMN "{col}" TEXT'
-                execute_with_retry(db_cursor, alter_sql)
-                print(f"[Database] Added column '{col}' to table {table_name}")
+                execute_pipelined(db_cursor, (
+                    ('SAVEPOINT xer_row', None),
+                    (single_sql, row),
+                    ('RELEASE SAVEPOINT xer_row', None)
+                ))
+                inserted_count += 1
             except Exception as e:
-                print(f"[Database] Error adding column '{col}' to table {table_name}: {str(e)}")
-                # Continue with other columns even if one fails
-                continue
-    else:
-        print(f"[Database] All required columns already exist in {table_name}")
+                db_cursor.execute('ROLLBACK TO SAVEPOINT xer_row; RELEASE SAVEPOINT xer_row')
+                error = str(e).strip()
+                if not rejected:  # Show more details for first error
+                    print(f"[Database] Error inserting record into {table_name}: {error}")
+                    print(f"[Database] SQL: {single_sql}")
+                rejected.append((row, error))
+    
+    return inserted_count, rejected
+
+def bulk_load_records(db_cursor, table_name, columns, final_columns, records, file_id, metrics=None,
+                      target=None):
+    """
+    Load a batch of record tuples with COPY FROM STDIN. If COPY fails, the batch
+    is re-sent as execute_values pages and rows that still fail go to the reject
+    log. Building the COPY text is timed as 'type_convert' and sending it as
+    'load' in `metrics`, which also receives the table's rows and COPY bytes.
+    Rows go into `target` if given (a snapshot's staging table, see
+    xer_partitions), otherwise into table_name.
+    Returns (loaded_count, rejected_count, method).
+    """
+    if metrics is None:
+        metrics = IngestMetrics()
+    if target is None:
+        target = table_name
+    
+    with metrics.phase('type_convert'):
+        rows = build_row_values(columns, final_columns, records, file_id)
+        buffer = format_copy_buffer(rows)
+        copy_bytes = buffer.seek(0, io.SEEK_END)
+        buffer.seek(0)
+    quoted_columns = ', '.join([f'"{col}"' for col in final_columns])
+    copy_sql = f'COPY "{target}" ({quoted_columns}) FROM STDIN'
+    
+    with metrics.phase('load'):
+        try:
+            with savepoint(db_cursor, 'xer_copy'):
+                db_cursor.copy_expert(copy_sql, buffer)
+            metrics.count_table(table_name, len(rows), copy_bytes)
+            return len(rows), 0, 'copy'
+        except psycopg2.Error as e:
+            print(f"[Database] COPY into {table_name} failed, falling back to execute_values: {str(e).strip()}")
+        
+        inserted_count, rejected = insert_rows_with_fallback(db_cursor, target, final_columns, rows)
+    write_rejects(table_name, file_id, final_columns, rejected)
+    metrics.count_table(table_name, inserted_count, copy_bytes, len(rejected))
+    return inserted_count, len(rejected), 'execute_values'
+
+def report_load_stats(table_name, stats):
+    """
+    Print the rows/sec summary for one table.
+    """
+    seconds = stats['seconds']
+    rate = stats['rows'] / seconds if seconds > 0 else float(stats['rows'])
+    methods = '+'.join(sorted(stats['methods'])) or 'none'
+    log(f"[Database] Loaded {stats['rows']} records into {table_name} in {seconds:.2f}s "
+        f"({rate:,.0f} rows/sec via {methods}, {stats['rejected']} rejected)")
 
 def insert_table_data(db_cursor, table_name, table_data, file_id):
     """
     Insert records into a specific table with dynamic column addition.
+    Returns the load statistics for the table.
     """
     columns = table_data['columns']
     records = table_data['records']
     
     if not records:
-        print(f"[Database] No records to insert for table {table_name}")
+        log(f"[Database] No records to insert for table {table_name}")
         return
     
     if not columns:
         print(f"[Database] No columns defined for table {table_name}")
         return
     
-    print(f"[Database] Inserting {len(records)} records into {table_name}")
+    log(f"[Database] Inserting {len(records)} records into {table_name}")
     
-    # Add file_id to columns if not present
-    final_columns = columns.copy()
-    if 'file_id' not in [col.lower() for col in final_columns]:
-        final_columns.append('file_id')
+    started = time.perf_counter()
+    final_columns, column_types = prepare_table_for_insert(db_cursor, table_name, columns, records)
+    widen_nonconforming_columns(db_cursor, table_name, columns, column_types, records)
+    loaded, rejected, method = bulk_load_records(db_cursor, table_name, columns, final_columns, records, file_id)
+    stats = {
+        'rows': loaded,
+        'rejected': rejected,
+        'seconds': time.perf_counter() - started,
+        'methods': {method}
+    }
+    report_load_stats(table_name, stats)
+    return stats
+
+def load_xer_batches(db_cursor, batches, file_id, progress=None, schema_changes=None, metrics=None):
+    """
+    Bulk load (table_name, columns, row_batch) chunks as they arrive.
+    Each table is created/extended when its first batch is seen; a table that
+    fails is skipped for the rest of the stream while other tables continue.
+    `progress`, if given, is called with (table_name, table_rows, total_rows)
+    after every batch. DDL is recorded in `schema_changes` for publishing to
+    the schema catalog after commit, and phase times and per-table counters
+    in `metrics`. Returns a dictionary of load statistics per table.
+    """
+    if metrics is None:
+        metrics = IngestMetrics()
+    prepared = {}
+    staging_tables = {}
+    failed_tables = set()
+    table_stats = {}
+    total_rows = 0
     
-    # Create table if it doesn't exist (with initial columns)
-    create_table_if_not_exists(db_cursor, table_name, columns)
+    for table_name, columns, records in batches:
+        if not records or table_name in failed_tables:
+            continue
+        
+        if not columns:
+            print(f"[Database] No columns defined for table {table_name}")
+            continue
+        
+        started = time.perf_counter()
+        try:
+            # Re-prepare if a table shows up again with a different header
+            if table_name not in prepared or prepared[table_name][0] != columns:
+                with metrics.phase('ddl'), savepoint(db_cursor, 'xer_table'):
+                    final_columns, column_types = prepare_table_for_insert(
+                        db_cursor, table_name, columns, records, schema_changes
+                    )
+                    staging = None
+                    if table_name in PARTITIONED_TABLES:
+                        # Loaded into a standalone table that is attached as the snapshot's
+                        # partition after commit (see xer_partitions)
+                        staging = create_snapshot_staging(db_cursor, table_name, file_id)
+                prepared[table_name] = (columns, final_columns, column_types)
+                if staging is not None:
+                    staging_tables[table_name] = staging
+                table_stats.setdefault(table_name, {'rows': 0, 'rejected': 0, 'seconds': 0.0, 'methods': set()})
+            
+            _, final_columns, column_types = prepared[table_name]
+            with metrics.phase('type_convert'):
+                widen_nonconforming_columns(db_cursor, table_name, columns, column_types, records, schema_changes)
+            target = None
+            if table_name in staging_tables:
+                # Columns this ingestion added to or widened on the parent apply to the
+                # staging table too; schema_changes holds the parent as re-read after that DDL
+                target, staging_columns = staging_tables[table_name]
+                parent_columns = (schema_changes or {}).get(table_name)
+                if parent_columns and parent_columns != staging_columns:
+                    with metrics.phase('ddl'):
+                        staging_columns = sync_staging_columns(db_cursor, target, parent_columns, staging_columns)
+                    staging_tables[table_name] = (target, staging_columns)
+            loaded, rejected, method = bulk_load_records(
+                db_cursor, table_name, columns, final_columns, records, file_id, metrics, target
+            )
+        except Exception as e:
+            print(f"[Main] Error processing table {table_name}: {str(e)}")
+            # Continue with other tables even if one fails
+            failed_tables.add(table_name)
+            continue
+        
+        stats = table_stats[table_name]
+        stats['rows'] += loaded
+        stats['rejected'] += rejected
+        stats['seconds'] += time.perf_counter() - started
+        stats['methods'].add(method)
+        total_rows += loaded
+        
+        if progress:
+            progress(table_name, stats['rows'], total_rows)
     
-    # Get existing columns from the table
-    existing_columns = get_existing_columns(db_cursor, table_name)
-    print(f"[Database] Table {table_name} has {len(existing_columns)} existing columns")
+    for table_name, stats in table_stats.items():
+        report_load_stats(table_name, stats)
     
-    # Add any missing columns
-    add_missing_columns(db_cursor, table_name, final_columns, existing_columns)
+    return table_stats
+
+def count_batch_rows(batches, row_counts):
+    """
+    Pass (table_name, columns, row_batch) chunks through unchanged while
+    counting the rows handed to the loader per table in `row_counts`.
+    """
+    for table_name, columns, records in batches:
+        if columns:
+            row_counts[table_name] = row_counts.get(table_name, 0) + len(records)
+        yield table_name, columns, records
+
+def check_row_counts(row_counts, table_stats):
+    """
+    Compare the rows parsed per table with the rows loaded or rejected. Raises
+    RuntimeError naming the tables that lost rows, e.g. because a table failed
+    to load, so the snapshot is rolled back instead of committed incomplete.
+    """
+    mismatches = []
+    for table_name, parsed in sorted(row_counts.items()):
+        stats = table_stats.get(table_name, {'rows': 0, 'rejected': 0})
+        accounted = stats['rows'] + stats['rejected']
+        if accounted != parsed:
+            mismatches.append(f"{table_name} ({accounted:,} of {parsed:,} rows)")
+    if mismatches:
+        raise RuntimeError(f"Row counts do not match the parsed XER file: {', '.join(mismatches)}")
+
+def publish_snapshot(file_id):
+    """
+    Make a committed snapshot visible to readers, which only consider
+    file_metadata rows with published = TRUE. Flipping the flag is a single
+    row update, so dashboards switch from the previous snapshot to this one
+    at once, after its tables, read models and CPM results are in place.
+    """
+    connection = get_connection()
+    try:
+        with connection.cursor() as db_cursor:
+            execute_with_retry(db_cursor, "UPDATE file_metadata SET published = TRUE WHERE file_id = %s", (file_id,))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        return_connection(connection)
+    log(f"[Database] Published file_id {file_id}")
+
+def connections_per_file(parallelism):
+    """Return how many pooled connections one file may hold at once with `parallelism` loaders"""
+    return max(1, parallelism) + FILE_CONNECTION_OVERHEAD
+
+def check_connection_budget(files, parallelism):
+    """
+    Raise ValueError unless `files` ingestions with `parallelism` loaders each
+    fit in the connection pool. get_connection waits for a free connection,
+    but ingestions that each hold some and wait for more can still starve
+    each other until it times out.
+    """
+    needed = files * connections_per_file(parallelism)
+    if needed > POOL_MAX_CONNECTIONS:
+        raise ValueError(
+            f"{files} files x ({max(1, parallelism)} loaders + {FILE_CONNECTION_OVERHEAD}) need {needed} "
+            f"connections but POSTGRES_MAX_CONNECTIONS is {POOL_MAX_CONNECTIONS}"
+        )
+
+def resolve_load_parallelism(connection, parallelism):
+    """
+    Decide how many loader connections to use for one file.
+    Parallel loads commit through two-phase commit, so they need
+    max_prepared_transactions on the server; otherwise load sequentially.
+    """
+    parallelism = max(1, min(parallelism, POOL_MAX_CONNECTIONS - FILE_CONNECTION_OVERHEAD))
+    if parallelism == 1:
+        return 1
     
-    # Get updated column list after adding missing columns
-    updated_columns = get_existing_columns(db_cursor, table_name)
-    print(f"[Database] Table {table_name} now has {len(updated_columns)} columns after updates")
+    with connection.cursor() as cursor:
+        cursor.execute('SHOW max_prepared_transactions')
+        max_prepared = int(cursor.fetchone()[0])
+    connection.rollback()
     
-    # Prepare insert statement with all required columns
-    placeholders = ', '.join(['?' for _ in final_columns])
-    insert_sql = f'INSERT INTO "{table_name}" ({", ".join([f'"{col}"' for col in final_columns])}) VALUES ({placeholders})'
+    if max_prepared < parallelism + 1:
+        print(f"[Database] max_prepared_transactions is {max_prepared}; parallel load needs at least "
+              f"{parallelism + 1} for an atomic commit, loading sequentially instead")
+        return 1
+    return parallelism
+
+def load_xer_batches_parallel(connection, gtrid, batches, file_id, parallelism, progress=None,
+                              schema_changes=None, metrics=None, row_counts=None):
+    """
+    Load batches on `parallelism` threads, each with its own pooled connection.
+    Every table is pinned to one loader thread (the least loaded one when the
+    table first appears), so independent tables load concurrently while rows
+    of one table stay in order. `connection` must have been started with
+    tpc_begin() using the global transaction ID `gtrid`; it is prepared and
+    committed together with all loader connections, so the file is stored
+    atomically or not at all. With `row_counts` (see count_batch_rows), the
+    loaded rows are checked against them before preparing. Returns a
+    dictionary of load statistics per table.
+    """
+    if metrics is None:
+        metrics = IngestMetrics()
+    loader_queues = [queue.Queue(maxsize=DEFAULT_PREFETCH_DEPTH) for _ in range(parallelism)]
+    loader_rows = [0] * parallelism
+    table_loader = {}
+    table_rows = {}
+    progress_lock = threading.Lock()
     
-    # Insert records with retry logic
-    inserted_count = 0
-    for record in records:
-        try:
-            values = []
-            for col in final_columns:
-                if col == 'file_id':
-                    values.append(file_id)
-                else:
-                    values.append(record.get(col))
+    def report_progress(table_name, rows, _):
+        if progress:
+            with progress_lock:
+                table_rows[table_name] = rows
+                progress(table_name, rows, sum(table_rows.values()))
+    
+    def drain(work_queue):
+        while True:
+            item = work_queue.get()
+            if item is None:
+                return
+            yield item
+    
+    def run_loader(index, loader_connection):
+        loader_connection.tpc_begin(loader_connection.xid(XER_TPC_FORMAT_ID, gtrid, f'loader-{index}'))
+        with loader_connection.cursor() as loader_cursor:
+            return load_xer_batches(
+                loader_cursor, drain(loader_queues[index]), file_id, report_progress, schema_changes, metrics
+            )
+    
+    loader_connections = []
+    try:
+        for _ in range(parallelism):
+            loader_connections.append(get_connection())
+        
+        with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix='xer-loader') as executor:
+            futures = [
+                executor.submit(run_loader, index, loader_connection)
+                for index, loader_connection in enumerate(loader_connections)
+            ]
             
-            execute_with_retry(db_cursor, insert_sql, values)
-            inserted_count += 1
+            def dispatch(index, item):
+                # Stop waiting on a queue whose loader has died
+                while True:
+                    if futures[index].done():
+                        futures[index].result()
+                        raise RuntimeError(f"Loader thread {index} stopped unexpectedly")
+                    try:
+                        loader_queues[index].put(item, timeout=0.1)
+                        return
+                    except queue.Full:
+                        continue
             
+            try:
+                for table_name, columns, records in batches:
+                    if table_name not in table_loader:
+                        table_loader[table_name] = loader_rows.index(min(loader_rows))
+                        log(f"[Database] Table {table_name} assigned to loader {table_loader[table_name]}")
+                    index = table_loader[table_name]
+                    loader_rows[index] += len(records)
+                    dispatch(index, (table_name, columns, records))
+            finally:
+                for index in range(parallelism):
+                    if not futures[index].done():
+                        dispatch(index, None)
+            
+            table_stats = {}
+            for future in futures:
+                table_stats.update(future.result())
+        
+        if row_counts is not None:
+            check_row_counts(row_counts, table_stats)
+        
+        # Two-phase commit: nothing is visible until every connection has prepared
+        all_connections = [connection] + loader_connections
+        with metrics.phase('commit'):
+            for tpc_connection in all_connections:
+                tpc_connection.tpc_prepare()
+            for tpc_connection in all_connections:
+                tpc_connection.tpc_commit()
+        log(f"[Database] Committed {len(all_connections)} connections atomically ({gtrid})")
+        return table_stats
+    
+    except Exception:
+        for tpc_connection in [connection] + loader_connections:
+            try:
+                tpc_connection.tpc_rollback()
+            except Exception as e:
+                print(f"[Database] Warning: Could not roll back {gtrid}: {str(e)}")
+        raise
+    finally:
+        for loader_connection in loader_connections:
+            return_connection(loader_connection)
+
+def ingest_xer_file(xer_file_path, original_filename=None, progress=None, parallelism=None,
+                    incremental=None, member=None):
+    """
+    Parse an XER file and stream it into PostgreSQL in a single transaction.
+    The file may be compressed (.xer.gz, .xer.zst) or, with `member`, be one
+    XER file of a zip archive; it is decompressed while it is parsed.
+    The loaded rows are checked against the parsed ones before committing,
+    and the snapshot is only published to readers after the post-ingest
+    stage (see publish_snapshot). With parallelism > 1, tables are loaded on several pooled connections and
+    committed together with two-phase commit. With incremental, tables are
+    hashed first and only changes since the project's previous snapshot are
+    stored (see xer_incremental).
+    Returns a dictionary with the new file_id, the per-table load statistics,
+    the relationship KPIs per project (see xer_kpi), the metrics summary (see
+    xer_metrics), the diff against the previous snapshot (see xer_diff), the
+    manifest of the Parquet export (see xer_columnar) and, for incremental
+    loads, how each table was stored.
+    """
+    if original_filename is None:
+        original_filename = os.path.basename(xer_file_path)
+    metrics = IngestMetrics(original_filename)
+    
+    def make_batches():
+        return iter_xer_batches(xer_file_path, DEFAULT_BATCH_SIZE, metrics, member=member)
+    
+    return ingest_xer_batches(make_batches, original_filename, progress, parallelism, incremental, metrics)
+
+def ingest_xer_archive(xer_file_path, original_filename=None, progress=None, parallelism=None,
+                       incremental=None):
+    """
+    Ingest every XER file of an upload, each as its own snapshot, in archive
+    order (see xer_reader.list_xer_members). Plain and compressed files hold
+    one XER file; zip archives may hold several, e.g. one per project.
+    Snapshots that were loaded stay loaded if a later one fails. Progress
+    totals count the rows of earlier files too.
+    Returns the list of ingest_xer_file results.
+    """
+    results = []
+    rows_before = 0
+    
+    def report_progress(table_name, table_rows, total_rows):
+        progress(table_name, table_rows, rows_before + total_rows)
+    
+    for member, filename in list_xer_members(xer_file_path, original_filename):
+        if member is not None:
+            log(f"[Main] Ingesting {member} from {original_filename or os.path.basename(xer_file_path)}")
+        try:
+            result = ingest_xer_file(
+                xer_file_path, filename, progress and report_progress, parallelism, incremental, member
+            )
+            results.append(result)
+            rows_before += sum(stats['rows'] for stats in result['tables'].values())
         except Exception as e:
-            print(f"[Database] Error inserting record into {table_name}: {str(e)}")
-            if inserted_count == 0:  # Show more details for first error
-                print(f"[Database] Required columns: {final_columns}")
-                print(f"[Database] Existing columns: {updated_columns}")
-                print(f"[Database] SQL: {insert_sql}")
-                print(f"[Database] Sample record keys: {list(record.keys())[:10]}")
-            continue
+            if not results:
+                raise
+            loaded = ', '.join(str(result['file_id']) for result in results)
+            raise RuntimeError(f"Failed to ingest {filename} (file_ids {loaded} were loaded before it): {str(e)}") from e
+    return results
+
+def ingest_xer_batches(make_batches, original_filename, progress=None, parallelism=None,
+                       incremental=None, metrics=None):
+    """
+    Load a stream of (table_name, columns, row_batch) chunks as one XER file.
+    make_batches is called to start a fresh pass over the chunks; incremental
+    loads call it twice (hashing, then loading). This lets callers that
+    produce batches some other way than reading a file skip ingest_xer_file.
+    Phase times and counters are collected in `metrics` and emitted once the
+    file is done (see xer_metrics).
+    Returns the same dictionary as ingest_xer_file.
+    """
+    if parallelism is None:
+        parallelism = DEFAULT_LOAD_PARALLELISM
+    if incremental is None:
+        incremental = DEFAULT_INCREMENTAL
+    if metrics is None:
+        metrics = IngestMetrics(original_filename)
+    metrics.start_pool_wait()
+    incremental_summary = {}
+    kpi_summary = {}
+    wbs_summary = {}
+    schema_changes = {}
+    row_counts = {}
+    
+    project_info = extract_project_info_from_filename(original_filename)
+    log(f"[Main] Using filename: {original_filename}")
+    log(f"[Main] Extracted project info: {project_info}")
     
-    print(f"[Database] Successfully inserted {inserted_count} records into {table_name}")
+    # Connect to PostgreSQL database
+    log(f"[Database] Connecting to PostgreSQL database")
+    connection = get_connection()
+    two_phase = False
+    file_id = None
+    export = None
+    try:
+        parallelism = resolve_load_parallelism(connection, parallelism)
+        if parallelism > 1:
+            gtrid = f'xer-{uuid.uuid4().hex}'
+            connection.tpc_begin(connection.xid(XER_TPC_FORMAT_ID, gtrid, 'metadata'))
+            two_phase = True
+        db_cursor = connection.cursor()
+        
+        # Insert file metadata
+        file_id = insert_file_metadata(db_cursor, original_filename, project_info, schema_changes)
+        metrics.file_id = file_id
+        
+        # Stream tables from the XER file into the database as they are parsed
+        batches = prefetch_batches(make_batches())
+        # KPIs see every row, including the ones incremental loads skip
+        batches = collect_relationship_kpis(db_cursor, batches, file_id, kpi_summary, schema_changes)
+        batches = collect_wbs_hierarchy(db_cursor, batches, file_id, wbs_summary, schema_changes)
+        if COLUMNAR_EXPORT:
+            # Sees every row as well, so each Parquet snapshot is complete
+            export = open_snapshot_export(file_id, original_filename, project_info)
+            if export is not None:
+                batches = collect_columnar_export(batches, export, metrics)
+        if incremental:
+            ensure_snapshot_tables(db_cursor, schema_changes)
+            table_hashes = compute_table_hashes(make_batches())
+            previous_file_id = find_previous_snapshot(db_cursor, project_info['project_name'], file_id)
+            batches = filter_incremental_batches(
+                db_cursor, batches, file_id, table_hashes, previous_file_id, incremental_summary
+            )
+        batches = count_batch_rows(batches, row_counts)
+        
+        if parallelism > 1:
+            log(f"[Main] Loading tables on {parallelism} parallel connections")
+            table_stats = load_xer_batches_parallel(
+                connection, gtrid, batches, file_id, parallelism, progress, schema_changes, metrics, row_counts
+            )
+        else:
+            table_stats = load_xer_batches(db_cursor, batches, file_id, progress, schema_changes, metrics)
+            check_row_counts(row_counts, table_stats)
+            with metrics.phase('commit'):
+                connection.commit()
+        db_cursor.close()
+        publish_schema_changes(schema_changes)
+    except Exception:
+        if export is not None:
+            export.discard()
+        try:
+            if two_phase:
+                connection.tpc_rollback()
+            else:
+                connection.rollback()
+        except psycopg2.Error:
+            pass  # Already rolled back by load_xer_batches_parallel
+        if file_id is not None:
+            try:
+                discard_snapshot_partitions(file_id)
+            except Exception as e:
+                print(f"[Database] Warning: Could not drop the partitions of file_id {file_id}: {str(e)}")
+        raise
+    finally:
+        return_connection(connection)
+    
+    try:
+        with metrics.phase('ddl'):
+            attach_snapshot_partitions(file_id)
+    except Exception:
+        # Committed but unreachable through the partitioned tables, so remove the snapshot whole
+        if export is not None:
+            export.discard()
+        try:
+            drop_snapshots([file_id])
+        except Exception as e:
+            print(f"[Database] Warning: Could not drop unattached file_id {file_id}: {str(e)}")
+        raise
+    
+    log(f"[Main] Successfully processed XER file. File ID: {file_id}")
+    
+    post_ingest = None
+    if DEFAULT_POST_INGEST:
+        # The snapshot is committed but unpublished at this point; a failure here
+        # only leaves stale read models, which `python xer_read_models.py <file_id>` rebuilds
+        try:
+            post_ingest = run_post_ingest(file_id, set(table_stats) | set(incremental_summary), metrics)
+        except Exception as e:
+            print(f"[Main] Warning: Post-ingest stage failed for file_id {file_id}: {str(e)}")
+    
+    cpm = None
+    if DEFAULT_CPM and {'TASK', 'TASKPRED'} & (set(table_stats) | set(incremental_summary)):
+        try:
+            with metrics.phase('cpm'):
+                cpm = run_cpm(file_id)
+        except Exception as e:
+            print(f"[Main] Warning: CPM calculation failed for file_id {file_id}: {str(e)}")
+    
+    diff = None
+    if DEFAULT_DIFF and {'TASK', 'TASKPRED', 'PROJWBS'} & (set(table_stats) | set(incremental_summary)):
+        # Runs before publishing, so dashboards see the snapshot and its diff together
+        try:
+            with metrics.phase('diff'):
+                diff = run_snapshot_diff(file_id)
+        except Exception as e:
+            print(f"[Main] Warning: Schedule diff failed for file_id {file_id}: {str(e)}")
+    
+    columnar = None
+    if export is not None and export.active:
+        try:
+            with metrics.phase('export'):
+                columnar = export.finish()
+        except Exception as e:
+            print(f"[Main] Warning: Parquet export failed for file_id {file_id}: {str(e)}")
+            export.discard()
+    
+    with metrics.phase('publish'):
+        publish_snapshot(file_id)
+    
+    try:
+        # Only cached results of this file's projects (or not scoped to any project) are dropped
+        invalidate_query_cache(
+            set(table_stats) | set(incremental_summary) | set(SNAPSHOT_TABLES),
+            set(kpi_summary) | {project_info['project_name']} - {None},
+            [file_id]
+        )
+    except Exception as e:
+        print(f"[Main] Warning: Could not invalidate the query cache for file_id {file_id}: {str(e)}")
+    
+    summary = metrics.finish()
+    emit_metrics(summary)
+    
+    return {
+        'file_id': file_id,
+        'tables': table_stats,
+        'incremental': incremental_summary,
+        'kpis': kpi_summary,
+        'wbs': wbs_summary,
+        'post_ingest': post_ingest,
+        'cpm': cpm,
+        'diff': diff,
+        'columnar': columnar,
+        'metrics': summary
+    }
 
 def main():
     """
     Main function to parse XER file and insert into database.
     """
     if len(sys.argv) < 3:
-        print("Usage: python parse_xer_content.py <xer_file_path> <database_path> [original_filename]")
+        print("Usage: python parse_xer_content.py <xer_file_path|.xer.gz|.xer.zst|.zip> <database_path> [original_filename]")
         sys.exit(1)
     
     xer_file_path = sys.argv[1]
     database_path = sys.argv[2]
     
-    print(f"[Main] Starting XER parsing process")
-    print(f"[Main] XER file: {xer_file_path}")
-    print(f"[Main] Database: {database_path}")
+    log(f"[Main] Starting XER parsing process")
+    log(f"[Main] XER file: {xer_file_path}")
+    log(f"[Main] Database: {database_path}")
     
     try:
-        # Extract project information from filename
         # Use original filename if available, otherwise use the file path
         if len(sys.argv) > 3:
             original_filename = sys.argv[3]
         else:
             original_filename = os.path.basename(xer_file_path)
         
-        project_info = extract_project_info_from_filename(original_filename)
-        print(f"[Main] Using filename: {original_filename}")
-        print(f"[Main] Extracted project info: {project_info}")
-        
-        # Parse XER file
-        xer_data = parse_xer_file(xer_file_path)
-        
-        # Connect to PostgreSQL database
-        print(f"[Database] Connecting to PostgreSQL database")
-        # Database connection is handled by the config module
-        
-        # Insert file metadata
-        file_id = insert_file_metadata(original_filename, project_info)
-        
-        # Insert data from each table
-        for table_name, table_data in xer_data.items():
-            if table_data['records']:  # Only process tables with data
-                try:
-                    insert_table_data(table_name, table_data, file_id)
-                except Exception as e:
-                    print(f"[Main] Error processing table {table_name}: {str(e)}")
-                    # Continue with other tables even if one fails
-                    continue
-        
-        print(f"[Main] Successfully processed XER file. File ID: {file_id}")
+        ingest_xer_archive(xer_file_path, original_filename)
         
         # Clean up temporary file
         try:
             os.unlink(xer_file_path)
-            print(f"[Main] Cleaned up temporary file: {xer_file_path}")
+            log(f"[Main] Cleaned up temporary file: {xer_file_path}")
         except Exception as e:
             print(f"[Main] Warning: Could not delete temporary file: {str(e)}")
-        print("[Main] XER parsing completed successfully")
+        log("[Main] XER parsing completed successfully")
         
     except Exception as e:
         print(f"[Main] Error during XER parsing: {str(e)}")
         sys.exit(1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -17,8 +17,8 @@ document.addEventListener('DOMContentLoaded', () => {
             showStatus('Please select a file.', 'error');
             return;
         }
-        if (!file.name.toLowerCase().endsWith('.xer')) {
-             showStatus('Invalid file type. Please select a .xer file.', 'error');
+        if (!['.xer', '.xer.gz', '.xer.zst', '.zip'].some(extension => file.name.toLowerCase().endsWith(extension))) {
+             showStatus('Invalid file type. Please select a .xer file (optionally as .xer.gz, .xer.zst or .zip).', 'error');
             return;
         }
 
@@ -8,6 +8,7 @@ const FormData = require('form-data');
 // PostgreSQL database connection
 const db = require('./config/database');
 const { spawn } = require('child_process');
+const net = require('net');
 require('dotenv').config();
 
 // Import Gantt Chart API endpoints
@@ -16,6 +17,9 @@ const ganttApi = require('./api/gantt-endpoints');
 const app = express();
 const PORT = process.env.BACKEND_PORT || 3001; // Use a different port than the frontend dev server
 
+// Snapshots whose ingestion has finished; parse_xer_content.py publishes a file_id only once it is complete
+const PUBLISHED_FILE_IDS = '(SELECT file_id FROM file_metadata WHERE published)';
+
 // Enable JSON parsing for POST requests
 app.use(express.json());
 
@@ -715,8 +719,12 @@ app.get('/api/awp_tasks', async (req, res) => {
     console.log(`${logPrefix} Processing request for project ${projectId}`);
     
     try {
-        // Use PostgreSQL awp_tasks view for AWP hierarchy
-        const awpQuery = `SELECT * FROM awp_tasks WHERE proj_id = $1 ORDER BY task_code`;
+        // Read the materialized AWP rows of the project's latest published snapshot (see xer_read_models.py)
+        const awpQuery = `
+            SELECT * FROM awp_tasks_mv
+            WHERE proj_id = $1
+              AND file_id = (SELECT MAX(file_id) FROM awp_tasks_mv WHERE proj_id = $1 AND file_id IN ${PUBLISHED_FILE_IDS})
+            ORDER BY task_code`;
         
         console.log(`${logPrefix} Executing query for project ${projectId}`);
         
@@ -763,14 +771,18 @@ if (!fs.existsSync(uploadsDir)){
   fs.mkdirSync(uploadsDir);
 }
 
+// XER uploads may be compressed or zipped (several XER files per zip); the parser
+// decompresses them while parsing, so they are stored as uploaded
+const XER_UPLOAD_EXTENSIONS = ['.xer', '.xer.gz', '.xer.zst', '.zip'];
+
 // Configure Multer for XER file uploads
 const xerUpload = multer({ 
   dest: uploadsDir, // Temporary storage path
   limits: { fileSize: 100 * 1024 * 1024 }, // 100MB limit
   fileFilter: (req, file, cb) => {
-    // Accept only .xer files
-    if (!file.originalname.toLowerCase().endsWith('.xer')) {
-      return cb(new Error('Only .xer files are allowed'), false);
+    const name = file.originalname.toLowerCase();
+    if (!XER_UPLOAD_EXTENSIONS.some((extension) => name.endsWith(extension))) {
+      return cb(new Error(`Only ${XER_UPLOAD_EXTENSIONS.join(', ')} files are allowed`), false);
     }
     cb(null, true);
   }
@@ -819,6 +831,131 @@ async function recordUploadHistory(filename, user = 'System', status, message =
      }
 }
 
+// Persistent XER ingestion worker (xer_ingest_worker.py). Uploads are handed to it
+// over its Unix-domain socket; if it is not running we fall back to spawning the parser.
+// The worker only accepts files from the uploads directory.
+const XER_WORKER_SOCKET = process.env.XER_WORKER_SOCKET || path.join(__dirname, 'xer_worker.sock');
+
+// Connection errors meaning no worker is listening: no socket file, or one left behind
+const XER_WORKER_DOWN_CODES = ['ENOENT', 'ECONNREFUSED'];
+
+// Send one request to the ingestion worker and call onMessage for every JSON line it
+// returns. Resolves with the last message once isFinal(message) is true.
+function callXerWorker(request, onMessage = () => {}, isFinal = () => true) {
+  return new Promise((resolve, reject) => {
+    const socket = net.createConnection({ path: XER_WORKER_SOCKET });
+    let buffered = '';
+    let settled = false;
+
+    const finish = (err, message) => {
+      if (settled) return;
+      settled = true;
+      socket.destroy();
+      if (err) reject(err); else resolve(message);
+    };
+
+    socket.setEncoding('utf8');
+    socket.on('connect', () => socket.write(JSON.stringify(request) + '\n'));
+    socket.on('data', (chunk) => {
+      buffered += chunk;
+      let newlineIndex;
+      while ((newlineIndex = buffered.indexOf('\n')) >= 0) {
+        const line = buffered.slice(0, newlineIndex).trim();
+        buffered = buffered.slice(newlineIndex + 1);
+        if (!line) continue;
+        let message;
+        try {
+          message = JSON.parse(line);
+        } catch (parseErr) {
+          return finish(parseErr);
+        }
+        if (message.error && !message.job_id) {
+          return finish(new Error(message.error));
+        }
+        onMessage(message);
+        if (isFinal(message)) {
+          return finish(null, message);
+        }
+      }
+    });
+    socket.on('error', (err) => finish(err));
+    socket.on('close', () => finish(new Error('XER worker closed the connection before the job finished')));
+  });
+}
+
+// Find the JSON metrics summaries that parse_xer_content.py prints when a file is done,
+// one per XER file of the upload, in order
+function parseIngestSummaries(output) {
+  const summaries = [];
+  for (const line of output.trim().split('\n')) {
+    if (!line.startsWith('{')) continue;
+    try {
+      const summary = JSON.parse(line);
+      if (summary.file_id !== undefined && summary.tables) summaries.push(summary);
+    } catch (parseErr) {
+      // Not a summary line
+    }
+  }
+  return summaries;
+}
+
+// API endpoint to check the progress of an XER ingestion job
+app.get('/api/xer/jobs/:jobId', async (req, res) => {
+  const logPrefix = '[Server /api/xer/jobs]';
+  try {
+    const job = await callXerWorker({ action: 'status', job_id: req.params.jobId });
+    res.json({ success: true, job });
+  } catch (error) {
+    console.error(`${logPrefix} Error fetching job ${req.params.jobId}:`, error.message);
+    const status = XER_WORKER_DOWN_CODES.includes(error.code) ? 503 : 404;
+    res.status(status).json({ success: false, error: error.message });
+  }
+});
+
+// API endpoint returning what changed between a snapshot and its base (see xer_diff.py).
+// Defaults to the diff against the project's previous snapshot; ?entity= filters the rows
+// (activity, relationship, wbs) and ?limit= caps them
+app.get('/api/xer/diff/:fileId', async (req, res) => {
+  const logPrefix = '[Server /api/xer/diff]';
+  const fileId = parseInt(req.params.fileId, 10);
+  const baseFileId = req.query.baseFileId ? parseInt(req.query.baseFileId, 10) : null;
+  const limit = Math.min(parseInt(req.query.limit, 10) || 1000, 50000);
+  if (Number.isNaN(fileId) || Number.isNaN(baseFileId)) {
+    return res.status(400).json({ success: false, error: 'fileId and baseFileId must be numbers' });
+  }
+  try {
+    const summaryResult = await db.query(
+      `SELECT * FROM xer_schedule_diff_summary
+       WHERE file_id = $1 AND ($2::bigint IS NULL OR base_file_id = $2)
+         AND file_id IN ${PUBLISHED_FILE_IDS}
+       ORDER BY base_file_id DESC LIMIT 1`,
+      [fileId, baseFileId]
+    );
+    const summary = summaryResult.rows[0];
+    if (!summary) {
+      return res.status(404).json({ success: false, error: `No diff stored for file_id ${fileId}` });
+    }
+    const params = [fileId, summary.base_file_id, limit];
+    let entityFilter = '';
+    if (req.query.entity) {
+      params.push(req.query.entity);
+      entityFilter = ` AND entity = $${params.length}`;
+    }
+    const changesResult = await db.query(
+      `SELECT entity, change_type, entity_key, pred_task_code, field, old_value, new_value, delta
+       FROM xer_schedule_diff
+       WHERE file_id = $1 AND base_file_id = $2${entityFilter}
+       ORDER BY entity, change_type, entity_key, pred_task_code, field
+       LIMIT $3`,
+      params
+    );
+    res.json({ success: true, summary, changes: changesResult.rows });
+  } catch (error) {
+    console.error(`${logPrefix} Error fetching diff for file ${fileId}:`, error.message);
+    res.status(500).json({ success: false, error: 'Failed to fetch schedule diff' });
+  }
+});
+
 // API endpoint to handle XER file upload and parsing
 app.post('/api/xer/upload', xerUpload.single('xerFile'), async (req, res) => {
   const logPrefix = '[Server /api/xer/upload]';
@@ -848,6 +985,36 @@ app.post('/api/xer/upload', xerUpload.single('xerFile'), async (req, res) => {
       return res.status(500).json({ success: false, message: errorMsg });
   }
 
+  // Prefer the long-running ingestion worker, which keeps a warm connection pool
+  try {
+      const job = await callXerWorker(
+          { action: 'submit', path: tempFilePath, filename: originalFilename, cleanup: true, wait: true },
+          (update) => console.log(`${logPrefix} Job ${update.job_id}: ${update.status}, ${update.rows_loaded} rows loaded`),
+          (update) => update.status === 'succeeded' || update.status === 'failed'
+      );
+
+      if (job.status === 'succeeded') {
+          const tableSummary = Object.entries(job.tables).map(([table, rows]) => `${table}: ${rows}`).join(', ');
+          const fileIds = job.file_ids && job.file_ids.length ? job.file_ids : [job.file_id];
+          const responseMessage = `Successfully parsed and inserted data from ${originalFilename}. File ID${fileIds.length > 1 ? 's' : ''}: ${fileIds.join(', ')}. Rows loaded: ${job.rows_loaded} (${tableSummary}).`;
+          console.log(`${logPrefix} ${responseMessage}`);
+          await recordUploadHistory(originalFilename, 'Shrey', 'Success', responseMessage);
+          return res.json({ success: true, message: responseMessage, jobId: job.job_id, fileId: job.file_id, fileIds, files: job.files, metrics: job.metrics });
+      }
+
+      const responseMessage = `XER ingestion job ${job.job_id} failed: ${job.error}`;
+      console.error(`${logPrefix} ${responseMessage}`);
+      await recordUploadHistory(originalFilename, 'Shrey', 'Failure', responseMessage);
+      return res.status(500).json({ success: false, error: responseMessage, jobId: job.job_id });
+  } catch (workerError) {
+      if (!XER_WORKER_DOWN_CODES.includes(workerError.code)) {
+          console.error(`${logPrefix} XER worker error:`, workerError.message);
+          await recordUploadHistory(originalFilename, 'Shrey', 'Failure', workerError.message).catch(e => console.error('Hist err', e));
+          return res.status(500).json({ success: false, error: workerError.message });
+      }
+      console.log(`${logPrefix} XER worker not running on ${XER_WORKER_SOCKET}, spawning parser process.`);
+  }
+
   let pythonOutput = '';
   let pythonError = '';
 
@@ -873,10 +1040,26 @@ app.post('/api/xer/upload', xerUpload.single('xerFile'), async (req, res) => {
 
           if (code === 0 && !pythonError) { // Success only if exit code is 0 AND no stderr output
                historyStatus = 'Success';
-               responseMessage = `Successfully parsed and inserted data from ${originalFilename}. ${pythonOutput.trim()}`;
+               const summaries = parseIngestSummaries(pythonOutput);
+               const summary = summaries.length ? summaries[summaries.length - 1] : null;
+               if (summaries.length) {
+                   const fileSummary = summaries.map((fileSummary) => {
+                       const tableSummary = Object.entries(fileSummary.tables).map(([table, stats]) => `${table}: ${stats.rows}`).join(', ');
+                       return `File ID: ${fileSummary.file_id}${summaries.length > 1 ? ` (${fileSummary.filename})` : ''}. Rows loaded: ${fileSummary.rows} (${tableSummary}) in ${fileSummary.total_seconds}s.`;
+                   }).join(' ');
+                   responseMessage = `Successfully parsed and inserted data from ${originalFilename}. ${fileSummary}`;
+               } else {
+                   responseMessage = `Successfully parsed and inserted data from ${originalFilename}. ${pythonOutput.trim()}`;
+               }
                console.log(`${logPrefix} ${responseMessage}`);
-               await recordUploadHistory(originalFilename, 'Shrey', historyStatus, pythonOutput.trim() + (pythonError ? ` | Error: ${pythonError.trim()}` : '') );
-               res.json({ success: true, message: responseMessage });
+               await recordUploadHistory(originalFilename, 'Shrey', historyStatus, responseMessage);
+               res.json({
+                   success: true,
+                   message: responseMessage,
+                   fileId: summary ? summary.file_id : undefined,
+                   fileIds: summaries.map((fileSummary) => fileSummary.file_id),
+                   metrics: summary
+               });
           } else {
               historyStatus = 'Failure';
               if (pythonError) {
@@ -1056,6 +1239,45 @@ app.get('/api/database/diagnostics', async (req, res) => {
   }
 });
 
+// Tasks of a project's latest snapshot in WBS order, using the precomputed hierarchy (xer_wbs.py)
+// instead of a recursive query. TASK rows come from the latest file that stored them, which
+// for incremental snapshots with an unchanged TASK table is the snapshot they reference.
+// xer_wbs_nodes.proj_id is TEXT while "TASK".proj_id is typed (BIGINT for new installs), so
+// $1 is cast explicitly on both sides; otherwise Postgres infers it as text for both.
+const HIERARCHICAL_GANTT_QUERY = `
+    SELECT
+        t.task_id,
+        t.task_name,
+        CASE
+            WHEN t.status_code IN ('TK_Complete','TK_Active') THEN t.act_start_date
+            ELSE t.target_start_date
+        END AS start_date,
+        CASE
+            WHEN t.status_code IN ('TK_NotStart','TK_Active') THEN t.target_end_date
+            ELSE t.act_end_date
+        END AS end_date,
+        t.status_code,
+        t.driving_path_flag,
+        t.target_drtn_hr_cnt,
+        t.task_code,
+        wbs.wbs_id AS task_wbs_id,
+        wbs.depth - 1 AS wbs_level,
+        wbs.name_path AS wbs_path,
+        repeat('  ', wbs.depth - 1) || wbs.wbs_name AS indented_wbs_name
+    FROM "TASK" t
+    INNER JOIN xer_wbs_nodes wbs
+        ON wbs.wbs_id = t.wbs_id::TEXT
+        AND wbs.file_id = (SELECT MAX(file_id) FROM xer_wbs_nodes WHERE proj_id = $1::TEXT AND file_id IN ${PUBLISHED_FILE_IDS})
+    WHERE t.proj_id::TEXT = $1::TEXT
+      AND t.file_id = (SELECT MAX(file_id) FROM "TASK" WHERE proj_id::TEXT = $1::TEXT AND file_id IN ${PUBLISHED_FILE_IDS})
+    ORDER BY
+        wbs.sort_key,
+        CASE
+            WHEN t.status_code IN ('TK_Complete','TK_Active') THEN t.act_start_date
+            ELSE t.target_start_date
+        END
+`;
+
 // API endpoint for hierarchical Gantt data
 app.get('/api/hierarchical-gantt', async (req, res) => {
     const projectId = req.query.projectId;
@@ -1070,82 +1292,9 @@ app.get('/api/hierarchical-gantt', async (req, res) => {
     console.log(`[API] Hierarchical Gantt: Processing request for project ${projectId}`);
     
     try {
-        // The hierarchical SQL query with parameterized values
-        const hierarchicalQuery = `
-        WITH RECURSIVE WBStructure (wbs_id, parent_wbs_id, wbs_name, level, path) AS (
-            -- Anchor member: Select top-level WBS elements for project
-            SELECT
-                p.wbs_id,
-                p.parent_wbs_id,
-                p.wbs_name,
-                0 AS level,
-                CAST(p.wbs_name AS TEXT) AS path
-            FROM
-                PROJWBS p
-            WHERE p.proj_id = ? AND (
-                p.parent_wbs_id IS NULL
-                OR NOT EXISTS (SELECT 1 FROM PROJWBS parent WHERE parent.wbs_id = p.parent_wbs_id)
-            )
-
-            UNION ALL
-
-            -- Recursive member: Select children WBS elements within project
-            SELECT
-                p_child.wbs_id,
-                p_child.parent_wbs_id,
-                p_child.wbs_name,
-                cte.level + 1,
-                cte.path || ' > ' || p_child.wbs_name
-            FROM
-                PROJWBS p_child
-            INNER JOIN
-                WBStructure cte ON p_child.parent_wbs_id = cte.wbs_id
-            WHERE p_child.proj_id = ?
-        )
-        -- Final selection joining WBS hierarchy with TASK data
-        SELECT
-            -- Task details
-            t.task_id,
-            t.task_name,
-            -- Use CASE statements for date logic based on status_code
-            CASE
-                WHEN t.status_code IN ('TK_Complete','TK_Active') THEN t.act_start_date
-                ELSE t.target_start_date
-            END AS start_date,
-            CASE
-                WHEN t.status_code IN ('TK_NotStart','TK_Active') THEN t.target_end_date
-                ELSE t.act_end_date
-            END AS end_date,
-            t.status_code,
-            t.driving_path_flag,
-            t.target_drtn_hr_cnt,
-            t.task_code,
-
-            -- WBS Hierarchy details from CTE
-            wbs.wbs_id AS task_wbs_id,
-            wbs.level AS wbs_level,
-            wbs.path AS wbs_path,
-            substr('                                                  ', 1, wbs.level * 2) || wbs.wbs_name AS indented_wbs_name
-
-        FROM
-            TASK t
-        INNER JOIN
-            WBStructure wbs ON t.wbs_id = wbs.wbs_id
-        WHERE
-            t.proj_id = ?
-        ORDER BY
-            wbs.path,
-            CASE
-                WHEN t.status_code IN ('TK_Complete','TK_Active') THEN t.act_start_date
-                ELSE t.target_start_date
-            END
-        `;
-        
         console.log(`[API] Hierarchical Gantt: Executing query for project ${projectId}`);
         
-        // Execute the query with parameters
-        // Use PostgreSQL wbs_structure view instead of complex hierarchical query
-        const result = await db.query('SELECT * FROM wbs_structure ORDER BY wbs_path, start_date');
+        const result = await db.query(HIERARCHICAL_GANTT_QUERY, [projectId]);
         const rows = result.rows;
         
         console.log(`[API] Hierarchical Gantt: Query returned ${rows.length} rows for project ${projectId}`);
@@ -1182,82 +1331,9 @@ app.get('/api/wbs-structure', async (req, res) => {
     console.log(`[API] WBS Structure: Processing request for project ${projectId} (no limit)`);
     
     try {
-        // The WBS structure SQL query with parameterized values - same as hierarchical-gantt but without limit
-        const wbsStructureQuery = `
-        WITH RECURSIVE WBStructure (wbs_id, parent_wbs_id, wbs_name, level, path) AS (
-            -- Anchor member: Select top-level WBS elements for project
-            SELECT
-                p.wbs_id,
-                p.parent_wbs_id,
-                p.wbs_name,
-                0 AS level,
-                CAST(p.wbs_name AS TEXT) AS path
-            FROM
-                PROJWBS p
-            WHERE p.proj_id = ? AND (
-                p.parent_wbs_id IS NULL
-                OR NOT EXISTS (SELECT 1 FROM PROJWBS parent WHERE parent.wbs_id = p.parent_wbs_id)
-            )
-
-            UNION ALL
-
-            -- Recursive member: Select children WBS elements within project
-            SELECT
-                p_child.wbs_id,
-                p_child.parent_wbs_id,
-                p_child.wbs_name,
-                cte.level + 1,
-                cte.path || ' > ' || p_child.wbs_name
-            FROM
-                PROJWBS p_child
-            INNER JOIN
-                WBStructure cte ON p_child.parent_wbs_id = cte.wbs_id
-            WHERE p_child.proj_id = ?
-        )
-        -- Final selection joining WBS hierarchy with TASK data
-        SELECT
-            -- Task details
-            t.task_id,
-            t.task_name,
-            -- Use CASE statements for date logic based on status_code
-            CASE
-                WHEN t.status_code IN ('TK_Complete','TK_Active') THEN t.act_start_date
-                ELSE t.target_start_date
-            END AS start_date,
-            CASE
-                WHEN t.status_code IN ('TK_NotStart','TK_Active') THEN t.target_end_date
-                ELSE t.act_end_date
-            END AS end_date,
-            t.status_code,
-            t.driving_path_flag,
-            t.target_drtn_hr_cnt,
-            t.task_code,
-
-            -- WBS Hierarchy details from CTE
-            wbs.wbs_id AS task_wbs_id,
-            wbs.level AS wbs_level,
-            wbs.path AS wbs_path,
-            substr('                                                  ', 1, wbs.level * 2) || wbs.wbs_name AS indented_wbs_name
-
-        FROM
-            TASK t
-        INNER JOIN
-            WBStructure wbs ON t.wbs_id = wbs.wbs_id
-        WHERE
-            t.proj_id = ?
-        ORDER BY
-            wbs.path,
-            CASE
-                WHEN t.status_code IN ('TK_Complete','TK_Active') THEN t.act_start_date
-                ELSE t.target_start_date
-            END
-        `;
-        
         console.log(`[API] WBS Structure: Executing query for project ${projectId}`);
         
-        // Execute the query with parameters
-        // Use PostgreSQL wbs_structure view instead of complex WBS query
-        const result = await db.query('SELECT * FROM wbs_structure ORDER BY wbs_path, start_date');
+        const result = await db.query(HIERARCHICAL_GANTT_QUERY, [projectId]);
         const rows = result.rows;
         
         console.log(`[API] WBS Structure: Query returned ${rows.length} rows for project ${projectId}`);
@@ -1339,29 +1415,46 @@ app.get('/api/schedule/projects', async (req, res) => {
     }
 });
 
+// Materialized activity relationships (xer_read_models.py) of the latest published snapshot of every project
+const LATEST_RELATIONSHIPS = `(
+    SELECT * FROM activity_relationship_mv
+    WHERE (project_id, file_id) IN (
+        SELECT project_id, MAX(file_id) FROM activity_relationship_mv
+        WHERE file_id IN ${PUBLISHED_FILE_IDS}
+        GROUP BY project_id
+    )
+) latest_relationships`;
+
+// KPI rows (xer_kpi.py) of the latest published snapshot of every project
+const LATEST_KPI_SUMMARY = `(
+    SELECT * FROM xer_kpi_summary
+    WHERE (project_id, file_id) IN (
+        SELECT project_id, MAX(file_id) FROM xer_kpi_summary
+        WHERE file_id IN ${PUBLISHED_FILE_IDS}
+        GROUP BY project_id
+    )
+) latest_kpis`;
+
 // Leads KPI endpoint
 app.get('/api/schedule/leads-kpi', async (req, res) => {
     const logPrefix = '[Server /api/schedule/leads-kpi]';
     try {
         const projectId = req.query.project_id;
         
-        // Use PostgreSQL queries from migration script
-        const leadsQuery = `SELECT COUNT(*) as leads_count FROM activity_relationship_view WHERE relationship_status = 'Incomplete' AND CAST(lag AS REAL) < 0` + (projectId && projectId !== 'all' ? ` AND project_id = $1` : '');
-        const remainingQuery = `SELECT COUNT(*) as remaining_count FROM activity_relationship_view WHERE relationship_status = 'Incomplete'` + (projectId && projectId !== 'all' ? ` AND project_id = $1` : '');
-        const totalQuery = `SELECT COUNT(*) as total_count FROM activity_relationship_view` + (projectId && projectId !== 'all' ? ` WHERE project_id = $1` : '');
+        // One indexed lookup of the KPI rows computed at ingestion (see xer_kpi.py)
+        const kpiQuery = `
+            SELECT
+                COALESCE(SUM(leads), 0) as leads_count,
+                COALESCE(SUM(remaining_relationships), 0) as remaining_count,
+                COALESCE(SUM(total_relationships), 0) as total_count
+            FROM ${LATEST_KPI_SUMMARY}` + (projectId && projectId !== 'all' ? ` WHERE project_id = $1` : '');
         
         const params = projectId && projectId !== 'all' ? [projectId] : [];
+        const kpiResult = await db.query(kpiQuery, params);
         
-        // Get leads count, remaining relationships count, and total relationships count
-        const [leadsResult, remainingResult, totalResult] = await Promise.all([
-            db.query(leadsQuery, params),
-            db.query(remainingQuery, params),
-            db.query(totalQuery, params)
-        ]);
-        
-        const leadsCount = leadsResult.rows[0]?.leads_count || 0;
-        const remainingCount = remainingResult.rows[0]?.remaining_count || 0;
-        const totalCount = totalResult.rows[0]?.total_count || 0;
+        const leadsCount = kpiResult.rows[0]?.leads_count || 0;
+        const remainingCount = kpiResult.rows[0]?.remaining_count || 0;
+        const totalCount = kpiResult.rows[0]?.total_count || 0;
         const leadPercentage = remainingCount > 0 ? Math.round((leadsCount * 100.0) / remainingCount * 100) / 100 : 0;
         
         res.json({
@@ -1382,14 +1475,14 @@ app.get('/api/schedule/leads-chart-data', async (req, res) => {
     try {
         const projectId = req.query.project_id;
         
-        // Use PostgreSQL leads chart query from migration script
+        // Use the precomputed relationships of each project's latest snapshot
         let query = `
             SELECT 
                 lag,
                 relationship_type,
                 COUNT(*) as count
-            FROM activity_relationship_view 
-            WHERE relationship_status = 'Incomplete' AND CAST(lag AS REAL) < 0
+            FROM ${LATEST_RELATIONSHIPS}
+            WHERE relationship_status = 'Incomplete' AND lag < 0
         `;
         
         const params = [];
@@ -1414,24 +1507,23 @@ app.get('/api/schedule/leads-percentage-history', async (req, res) => {
     try {
         const projectId = req.query.project_id;
         
-        // Calculate leads percentage history directly from activity_relationship_view
+        // One point per month from the KPI rows of every published snapshot (see xer_kpi.py)
         let query = `
             SELECT
-                TO_CHAR(p.last_recalc_date::DATE, 'YYYY-MM') as date,
-                COUNT(CASE WHEN CAST(a.lag AS REAL) < 0 THEN 1 END) * 100.0 / 
-                NULLIF(COUNT(*), 0) as percentage
-            FROM activity_relationship_view a
-            INNER JOIN project p ON a.project_id = p.proj_id
-            WHERE a.relationship_status = 'Incomplete'
+                TO_CHAR(data_date, 'YYYY-MM') as date,
+                SUM(leads) * 100.0 / NULLIF(SUM(remaining_relationships), 0) as percentage
+            FROM xer_kpi_summary
+            WHERE data_date IS NOT NULL
+              AND file_id IN ${PUBLISHED_FILE_IDS}
         `;
         
         const params = [];
         if (projectId && projectId !== 'all') {
-            query += ` AND a.project_id = $1`;
+            query += ` AND project_id = $1`;
             params.push(projectId);
         }
         
-        query += ` GROUP BY TO_CHAR(p.last_recalc_date::DATE, 'YYYY-MM') ORDER BY date`;
+        query += ` GROUP BY TO_CHAR(data_date, 'YYYY-MM') ORDER BY date`;
 
         const result = await db.query(query, params);
 
@@ -1495,21 +1587,18 @@ app.get('/api/schedule/lags-kpi', async (req, res) => {
     try {
         const projectId = req.query.project_id;
         
-        // Use PostgreSQL lags KPI query from migration script
-        
-        // Convert to PostgreSQL queries
-        const lagsQuery = `SELECT COUNT(*) as lags_count FROM activity_relationship_view WHERE relationship_status = 'Incomplete' AND CAST(lag AS REAL) > 0` + (projectId && projectId !== 'all' ? ` AND project_id = $1` : '');
-        const remainingQuery = `SELECT COUNT(*) as remaining_count FROM activity_relationship_view WHERE relationship_status = 'Incomplete'` + (projectId && projectId !== 'all' ? ` AND project_id = $1` : '');
+        // One indexed lookup of the KPI rows computed at ingestion (see xer_kpi.py)
+        const kpiQuery = `
+            SELECT
+                COALESCE(SUM(lags), 0) as lags_count,
+                COALESCE(SUM(remaining_relationships), 0) as remaining_count
+            FROM ${LATEST_KPI_SUMMARY}` + (projectId && projectId !== 'all' ? ` WHERE project_id = $1` : '');
         
         const queryParams = projectId && projectId !== 'all' ? [projectId] : [];
-        
-        const [result, remainingResult] = await Promise.all([
-            db.query(lagsQuery, queryParams),
-            db.query(remainingQuery, queryParams)
-        ]);
+        const result = await db.query(kpiQuery, queryParams);
         
         const lagsCount = result.rows[0]?.lags_count || 0;
-        const remainingCount = remainingResult.rows[0]?.remaining_count || 0;
+        const remainingCount = result.rows[0]?.remaining_count || 0;
         const lagPercentage = remainingCount > 0 ? Math.round((lagsCount * 100.0) / remainingCount * 100) / 100 : 0;
         
         res.json({
@@ -1562,24 +1651,23 @@ app.get('/api/schedule/lags-percentage-history', async (req, res) => {
     try {
         const projectId = req.query.project_id;
         
-        // Calculate lags percentage history directly from activity_relationship_view
+        // One point per month from the KPI rows of every published snapshot (see xer_kpi.py)
         let query = `
             SELECT
-                TO_CHAR(p.last_recalc_date::DATE, 'YYYY-MM') as date,
-                COUNT(CASE WHEN CAST(a.lag AS REAL) > 0 THEN 1 END) * 100.0 / 
-                NULLIF(COUNT(*), 0) as percentage
-            FROM activity_relationship_view a
-            INNER JOIN project p ON a.project_id = p.proj_id
-            WHERE a.relationship_status = 'Incomplete'
+                TO_CHAR(data_date, 'YYYY-MM') as date,
+                SUM(lags) * 100.0 / NULLIF(SUM(remaining_relationships), 0) as percentage
+            FROM xer_kpi_summary
+            WHERE data_date IS NOT NULL
+              AND file_id IN ${PUBLISHED_FILE_IDS}
         `;
         
         const params = [];
         if (projectId && projectId !== 'all') {
-            query += ` AND a.project_id = $1`;
+            query += ` AND project_id = $1`;
             params.push(projectId);
         }
         
-        query += ` GROUP BY TO_CHAR(p.last_recalc_date::DATE, 'YYYY-MM') ORDER BY date`;
+        query += ` GROUP BY TO_CHAR(data_date, 'YYYY-MM') ORDER BY date`;
 
         const result = await db.query(query, params);
 
@@ -0,0 +1,95 @@
+"""
+Checks that the hierarchical Gantt query of server.js plans against both the
+typed TASK columns of new installs and the TEXT columns of older databases.
+"""
+
+import os
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+psycopg2 = pytest.importorskip('psycopg2')
+
+from config.database import DB_CONFIG
+
+SERVER_JS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'server.js')
+
+def server_constant(source, name, quote):
+    match = re.search(rf"const {name} = {quote}(.*?){quote};", source, re.S)
+    assert match, f"{name} not found in server.js"
+    return match.group(1)
+
+def gantt_query():
+    with open(SERVER_JS, encoding='utf-8') as handle:
+        source = handle.read()
+    published = server_constant(source, 'PUBLISHED_FILE_IDS', "'")
+    return server_constant(source, 'HIERARCHICAL_GANTT_QUERY', '`').replace('${PUBLISHED_FILE_IDS}', published)
+
+@pytest.fixture
+def db_cursor():
+    try:
+        conn = psycopg2.connect(connect_timeout=3, **{k: v for k, v in DB_CONFIG.items() if v})
+    except psycopg2.OperationalError as error:
+        pytest.skip(f"PostgreSQL not reachable: {error}")
+    cursor = conn.cursor()
+    cursor.execute("CREATE SCHEMA gantt_query_test")
+    cursor.execute("SET LOCAL search_path TO gantt_query_test")
+    try:
+        yield cursor
+    finally:
+        conn.rollback()
+        conn.close()
+
+@pytest.mark.parametrize('id_type', ['BIGINT', 'TEXT'])
+def test_gantt_query_runs_for_task_id_type(db_cursor, id_type):
+    db_cursor.execute("CREATE TABLE file_metadata (file_id INTEGER PRIMARY KEY, published BOOLEAN NOT NULL)")
+    db_cursor.execute(f"""
+        CREATE TABLE "TASK" (
+            file_id INTEGER NOT NULL,
+            task_id {id_type},
+            proj_id {id_type},
+            wbs_id {id_type},
+            task_code TEXT,
+            task_name TEXT,
+            status_code TEXT,
+            driving_path_flag TEXT,
+            target_drtn_hr_cnt DOUBLE PRECISION,
+            act_start_date TIMESTAMP,
+            act_end_date TIMESTAMP,
+            target_start_date TIMESTAMP,
+            target_end_date TIMESTAMP
+        )
+    """)
+    db_cursor.execute("""
+        CREATE TABLE xer_wbs_nodes (
+            file_id INTEGER NOT NULL,
+            wbs_id TEXT NOT NULL,
+            proj_id TEXT,
+            wbs_name TEXT,
+            depth INTEGER NOT NULL,
+            name_path TEXT,
+            sort_key TEXT NOT NULL
+        )
+    """)
+    db_cursor.execute("INSERT INTO file_metadata VALUES (1, TRUE), (2, FALSE)")
+    db_cursor.execute("""
+        INSERT INTO xer_wbs_nodes VALUES
+            (1, '10', '7', 'Project', 1, 'Project', '000000'),
+            (1, '11', '7', 'Civil', 2, 'Project > Civil', '000000000000'),
+            (2, '11', '7', 'Civil', 2, 'Project > Civil', '000000000000')
+    """)
+    db_cursor.execute("""
+        INSERT INTO "TASK" (file_id, task_id, proj_id, wbs_id, task_code, task_name, status_code, target_start_date)
+        VALUES (1, '100', '7', '11', 'A100', 'Excavate', 'TK_NotStart', '2025-01-06 08:00'),
+               (1, '101', '8', '11', 'A101', 'Other project', 'TK_NotStart', '2025-01-06 08:00'),
+               (2, '102', '7', '11', 'A102', 'Unpublished', 'TK_NotStart', '2025-01-06 08:00')
+    """)
+
+    db_cursor.execute(f"PREPARE gantt AS {gantt_query()}")
+    db_cursor.execute("EXECUTE gantt(%s)", ('7',))
+    rows = db_cursor.fetchall()
+
+    assert [(str(row[0]), row[1], row[9], row[11]) for row in rows] == [('100', 'Excavate', 1, '  Civil')]
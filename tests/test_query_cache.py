@@ -0,0 +1,107 @@
+"""
+Checks of the query result cache: TTL expiry, LRU eviction and tag invalidation.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import query_cache
+from config.query_cache import QueryCache, file_tag, project_tag, table_tag
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(query_cache, 'time', fake)
+    return fake
+
+def test_entries_expire_after_ttl(clock):
+    cache = QueryCache(ttl_seconds=60)
+    cache.put('q', 'rows', [table_tag('TASK')])
+
+    clock.now += 59
+    assert cache.get('q') == (True, 'rows')
+    clock.now += 1
+    assert cache.get('q') == (False, None)
+
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 0, 'expirations': 1,
+                             'invalidations': 0, 'entries': 0}
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = QueryCache(max_entries=2)
+    cache.put('a', 1, [])
+    cache.put('b', 2, [])
+    cache.get('a')
+    cache.put('c', 3, [])
+
+    assert cache.get('b') == (False, None)
+    assert cache.get('a') == (True, 1)
+    assert cache.get('c') == (True, 3)
+    assert cache.stats()['evictions'] == 1
+
+def test_put_refreshes_ttl_and_recency(clock):
+    cache = QueryCache(max_entries=2, ttl_seconds=60)
+    cache.put('a', 1, [])
+    cache.put('b', 2, [])
+    clock.now += 50
+    cache.put('a', 10, [])
+    cache.put('c', 3, [])
+    clock.now += 50
+
+    assert cache.get('a') == (True, 10)
+    assert cache.get('b') == (False, None)
+
+@pytest.fixture
+def tagged_cache(clock):
+    cache = QueryCache()
+    cache.put('all_tasks', 'a', [table_tag('TASK')])
+    cache.put('p1_tasks', 'b', [table_tag('TASK'), project_tag('P1')])
+    cache.put('p2_tasks', 'c', [table_tag('TASK'), project_tag('P2')])
+    cache.put('file_tasks', 'd', [table_tag('TASK'), file_tag(5)])
+    cache.put('p1_wbs', 'e', [table_tag('PROJWBS'), project_tag('P1')])
+    return cache
+
+def cached_keys(cache):
+    return sorted(cache.entries)
+
+def test_invalidation_keeps_other_projects(tagged_cache):
+    dropped = tagged_cache.invalidate(tables=['TASK'], project_ids=['P1'])
+
+    assert dropped == 2
+    assert cached_keys(tagged_cache) == ['file_tasks', 'p1_wbs', 'p2_tasks']
+
+def test_invalidation_by_file_id(tagged_cache):
+    tagged_cache.invalidate(tables=['TASK'], file_ids=[5])
+
+    assert cached_keys(tagged_cache) == ['p1_tasks', 'p1_wbs', 'p2_tasks']
+
+def test_unscoped_table_invalidation_drops_every_reader(tagged_cache):
+    tagged_cache.invalidate(tables=['TASK'])
+
+    assert cached_keys(tagged_cache) == ['p1_wbs']
+
+def test_scope_only_invalidation(tagged_cache):
+    tagged_cache.invalidate(project_ids=['P1'])
+
+    assert cached_keys(tagged_cache) == ['all_tasks', 'file_tasks', 'p2_tasks']
+    assert tagged_cache.stats()['invalidations'] == 2
+
+def test_relations_follow_postgres_case_folding():
+    query = 'SELECT * FROM "TASK" t JOIN public.Projwbs w ON true, LATERAL (SELECT EXTRACT(YEAR FROM now())) x'
+
+    assert query_cache.extract_relations(query) == {'TASK', 'projwbs'}
+
+def test_cache_key_ignores_formatting():
+    key = query_cache.make_key('SELECT 1\n  FROM "TASK";', [1], 'rows')
+
+    assert key == query_cache.make_key('SELECT 1 FROM "TASK"', [1], 'rows')
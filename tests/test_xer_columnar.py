@@ -0,0 +1,44 @@
+"""
+Checks that widening a column during the Parquet export keeps every row.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+import xer_columnar
+
+COLUMNS = ['task_id', 'task_code', 'target_start_date']
+
+def task_rows(first_id, count, start_date='2025-01-06 08:00'):
+    return [(str(task_id), f'A{task_id}', start_date) for task_id in range(first_id, first_id + count)]
+
+def export_batches(root, batches):
+    export = xer_columnar.SnapshotExport(1, 'T_2025-01-06.xer', {'project_name': 'T'}, root=str(root))
+    for records in batches:
+        export.add('TASK', COLUMNS, records)
+    manifest = export.finish()
+    table = pq.read_table(os.path.join(xer_columnar.snapshot_dir(1, str(root)), 'TASK.parquet'))
+    return manifest['tables']['TASK'], table
+
+def test_widening_before_first_flush_keeps_rows(tmp_path):
+    batches = [task_rows(1, 1), task_rows(2, 1), task_rows(3, 1), task_rows(4, 1, 'not-a-date'), task_rows(5, 1)]
+    entry, table = export_batches(tmp_path, batches)
+
+    assert entry['rows'] == table.num_rows == 5
+    assert entry['columns']['target_start_date'] == 'TEXT'
+    assert sorted(table.column('task_id').to_pylist()) == [1, 2, 3, 4, 5]
+
+def test_widening_after_first_flush_keeps_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(xer_columnar, 'ROW_GROUP_ROWS', 2)
+    batches = [task_rows(1, 2), task_rows(3, 2), task_rows(5, 1, 'not-a-date'), task_rows(6, 1)]
+    entry, table = export_batches(tmp_path, batches)
+
+    assert entry['rows'] == table.num_rows == 6
+    assert entry['columns']['target_start_date'] == 'TEXT'
+    assert sorted(table.column('task_id').to_pylist()) == [1, 2, 3, 4, 5, 6]
@@ -0,0 +1,68 @@
+"""
+Checks of the CPM engine.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+np = pytest.importorskip('numpy')
+
+import xer_cpm
+
+@pytest.mark.parametrize('pred_type, sides', [
+    ('PR_FS', (1, 0)), ('FS', (1, 0)), ('SS', (0, 0)), ('pr_ff', (1, 1)), (' SF ', (0, 1)),
+])
+def test_relationship_types_are_normalized(pred_type, sides):
+    assert xer_cpm.relationship_sides(pred_type) == sides
+
+@pytest.mark.parametrize('pred_type', [None, '', 'PR_XX', 'Finish to Start'])
+def test_unknown_relationship_types_are_not_defaulted(pred_type):
+    assert xer_cpm.relationship_sides(pred_type) is None
+
+def run_network(durations, relationships):
+    """Run CPM on (pred, succ, pred_type, lag) relationships between activity indexes"""
+    sides = [xer_cpm.relationship_sides(pred_type) for _, _, pred_type, _ in relationships]
+    return xer_cpm.compute_cpm(
+        np.array(durations, dtype=np.float64),
+        np.array([pred for pred, _, _, _ in relationships], dtype=np.int64),
+        np.array([succ for _, succ, _, _ in relationships], dtype=np.int64),
+        np.array([side[0] for side in sides], dtype=np.float64),
+        np.array([side[1] for side in sides], dtype=np.float64),
+        np.array([lag for _, _, _, lag in relationships], dtype=np.float64),
+    )
+
+def test_network_with_ss_and_ff_lags():
+    # A(10) -FS-> B(5); A -SS+2-> C(8); C -FF+3-> D(4)
+    # Forward:  A 0-10, B 10-15, C 2-10, D 9-13 (finishes 3h after C); project finish 15
+    # Backward: B 10-15, D 11-15, C 4-12 (finishes 3h before D), A 0-10 (B needs it first)
+    results = run_network([10, 5, 8, 4], [(0, 1, 'PR_FS', 0), (0, 2, 'PR_SS', 2), (2, 3, 'PR_FF', 3)])
+
+    assert results['project_finish'] == 15
+    assert results['early_start'].tolist() == [0, 10, 2, 9]
+    assert results['early_finish'].tolist() == [10, 15, 10, 13]
+    assert results['late_start'].tolist() == [0, 10, 4, 11]
+    assert results['late_finish'].tolist() == [10, 15, 12, 15]
+    assert results['total_float'].tolist() == [0, 0, 2, 2]
+    assert results['free_float'].tolist() == [0, 0, 0, 2]
+    assert results['driving'].tolist() == [True, True, False, False]
+    assert not results['in_cycle'].any()
+
+def test_sf_relationship_and_negative_lag():
+    # A(6) -SF-> B(4): B finishes when A starts, pushed out by 8h; A -FS-2-> C(3) overlaps A's end
+    results = run_network([6, 4, 3], [(0, 1, 'SF', 8), (0, 2, 'FS', -2)])
+
+    assert results['early_start'].tolist() == [0, 4, 4]
+    assert results['early_finish'].tolist() == [6, 8, 7]
+    assert results['total_float'].tolist() == [0, 0, 1]
+
+def test_loops_are_flagged_and_left_unscheduled():
+    results = run_network([2, 3, 5], [(0, 1, 'PR_FS', 0), (1, 0, 'PR_FS', 0)])
+
+    assert results['in_cycle'].tolist() == [True, True, False]
+    assert np.isnan(results['early_start'][:2]).all()
+    assert results['early_finish'][2] == 5
+    assert results['project_finish'] == 5
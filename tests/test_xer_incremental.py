@@ -0,0 +1,89 @@
+"""
+Checks of table hashing and reference detection for incremental ingestion.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import xer_incremental
+
+PROJECT = ('PROJECT', ['proj_id', 'proj_short_name'], [('7', 'P1')])
+TASKS = [('1', 'Dig'), ('2', None), ('3', 'Pour')]
+
+def task_batches(rows, batch_size=2):
+    return [('TASK', ['task_id', 'task_name'], rows[start:start + batch_size])
+            for start in range(0, len(rows), batch_size)]
+
+@pytest.fixture
+def snapshots(monkeypatch):
+    """Record saved table snapshots in memory instead of xer_table_snapshots"""
+    saved = {}
+    monkeypatch.setattr(xer_incremental, 'get_snapshot_hashes', lambda db_cursor, file_id: {
+        table_name: row['hash'] for (snapshot_id, table_name), row in saved.items() if snapshot_id == file_id
+    })
+
+    def save_table_snapshot(db_cursor, file_id, table_name, table_hash, mode, base_file_id, inserted):
+        saved[file_id, table_name] = dict(table_hash, mode=mode, base_file_id=base_file_id, inserted=inserted)
+
+    monkeypatch.setattr(xer_incremental, 'save_table_snapshot', save_table_snapshot)
+    return saved
+
+def ingest(file_id, batches, previous_file_id):
+    hashes = xer_incremental.compute_table_hashes(batches)
+    summary = {}
+    stored = list(xer_incremental.filter_incremental_batches(None, batches, file_id, hashes, previous_file_id, summary))
+    return stored, summary
+
+def test_hash_ignores_batch_boundaries():
+    small = xer_incremental.compute_table_hashes(task_batches(TASKS, 1))
+    large = xer_incremental.compute_table_hashes(task_batches(TASKS, 5))
+
+    assert small == large
+    assert small['TASK']['rows'] == 3
+
+def test_hash_changes_with_content_header_and_order():
+    base = xer_incremental.compute_table_hashes(task_batches(TASKS))['TASK']['hash']
+    variants = [
+        task_batches([('1', 'Dig'), ('2', 'Form'), ('3', 'Pour')]),
+        task_batches(TASKS[::-1]),
+        [('TASK', ['task_id', 'name'], TASKS)],
+        task_batches(TASKS[:2]),
+    ]
+
+    for batches in variants:
+        assert xer_incremental.compute_table_hashes(batches)['TASK']['hash'] != base
+
+def test_first_snapshot_is_stored_in_full(snapshots):
+    batches = [PROJECT] + task_batches(TASKS)
+
+    stored, summary = ingest(1, batches, None)
+
+    assert stored == batches
+    assert summary == {
+        'PROJECT': {'mode': 'full', 'base_file_id': None, 'inserted': 1},
+        'TASK': {'mode': 'full', 'base_file_id': None, 'inserted': 3},
+    }
+
+def test_unchanged_tables_reference_previous_snapshot(snapshots):
+    ingest(1, [PROJECT] + task_batches(TASKS), None)
+    changed_tasks = task_batches(TASKS[:2] + [('3', 'Pour slab')])
+
+    stored, summary = ingest(2, [PROJECT] + changed_tasks, 1)
+
+    assert stored == changed_tasks
+    assert summary['PROJECT'] == {'mode': 'reference', 'base_file_id': 1, 'inserted': 0}
+    assert summary['TASK'] == {'mode': 'full', 'base_file_id': None, 'inserted': 3}
+    assert snapshots[2, 'PROJECT']['hash'] == snapshots[1, 'PROJECT']['hash']
+    assert snapshots[2, 'PROJECT']['rows'] == 1
+
+def test_new_table_is_stored_in_full(snapshots):
+    ingest(1, [PROJECT], None)
+
+    stored, summary = ingest(2, [PROJECT] + task_batches(TASKS), 1)
+
+    assert [name for name, _, _ in stored] == ['TASK', 'TASK']
+    assert summary['TASK']['mode'] == 'full'
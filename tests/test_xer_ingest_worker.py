@@ -0,0 +1,82 @@
+"""
+Checks that the ingestion worker only accepts uploads and keeps its socket private.
+"""
+
+import os
+import sys
+import json
+import stat
+import socket
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import xer_ingest_worker
+
+class RecordingExecutor:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append(args)
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    uploads = tmp_path / 'uploads'
+    uploads.mkdir()
+    monkeypatch.setattr(xer_ingest_worker, 'UPLOAD_DIR', str(uploads))
+    monkeypatch.setattr(xer_ingest_worker, 'executor', RecordingExecutor())
+    monkeypatch.setattr(xer_ingest_worker, 'jobs', {})
+    return uploads
+
+def test_submit_accepts_uploaded_file(upload_dir):
+    upload = upload_dir / 'a1b2c3'
+    upload.write_text('ERMHDR\t19.12\n')
+
+    job = xer_ingest_worker.submit_job(str(upload), 'PLAN_2025-01-06.xer', cleanup=True)
+
+    assert job['path'] == os.path.realpath(upload)
+    assert xer_ingest_worker.executor.submitted == [(job['job_id'],)]
+
+def test_submit_rejects_file_outside_uploads(upload_dir, tmp_path):
+    outside = tmp_path / 'secret.xer'
+    outside.write_text('ERMHDR\t19.12\n')
+
+    for path in (str(outside), str(upload_dir / '..' / 'secret.xer')):
+        with pytest.raises(PermissionError):
+            xer_ingest_worker.submit_job(path, cleanup=True)
+
+    assert outside.exists()
+    assert xer_ingest_worker.executor.submitted == []
+
+def test_submit_rejects_symlink_out_of_uploads(upload_dir, tmp_path):
+    outside = tmp_path / 'secret.xer'
+    outside.write_text('ERMHDR\t19.12\n')
+    (upload_dir / 'link.xer').symlink_to(outside)
+
+    with pytest.raises(PermissionError):
+        xer_ingest_worker.submit_job(str(upload_dir / 'link.xer'), cleanup=True)
+
+def test_socket_is_private(tmp_path):
+    path = str(tmp_path / 'worker.sock')
+    server = xer_ingest_worker.XerWorkerServer(path, xer_ingest_worker.XerJobHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+        with pytest.raises(RuntimeError):
+            xer_ingest_worker.remove_stale_socket(path)
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(path)
+            client.sendall(b'{"action": "ping"}\n')
+            reply = json.loads(client.makefile().readline())
+        assert reply['ok'] is True
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    xer_ingest_worker.remove_stale_socket(path)
+    assert not os.path.exists(path)
@@ -0,0 +1,56 @@
+"""
+Checks that retention finds snapshots that were committed but never published.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+psycopg2 = pytest.importorskip('psycopg2')
+
+from config.database import DB_CONFIG
+import xer_partitions
+
+@pytest.fixture
+def db_cursor():
+    try:
+        conn = psycopg2.connect(connect_timeout=3, **{k: v for k, v in DB_CONFIG.items() if v})
+    except psycopg2.OperationalError as error:
+        pytest.skip(f"PostgreSQL not reachable: {error}")
+    cursor = conn.cursor()
+    cursor.execute("CREATE SCHEMA partitions_test")
+    cursor.execute("SET LOCAL search_path TO partitions_test")
+    try:
+        yield cursor
+    finally:
+        conn.rollback()
+        conn.close()
+
+def test_abandoned_snapshots_are_unpublished_and_old(db_cursor, monkeypatch):
+    monkeypatch.setattr(xer_partitions, 'get_table_columns',
+                        lambda cursor, table: {'published': 'boolean', 'created_at': 'timestamp with time zone'})
+    db_cursor.execute("""
+        CREATE TABLE file_metadata (
+            file_id INTEGER PRIMARY KEY,
+            published BOOLEAN NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL
+        )
+    """)
+    db_cursor.execute("""
+        INSERT INTO file_metadata VALUES
+            (1, TRUE, now() - interval '3 days'),
+            (2, FALSE, now() - interval '3 days'),
+            (3, FALSE, now() - interval '1 hour'),
+            (4, FALSE, now() - interval '25 hours')
+    """)
+
+    assert xer_partitions.find_abandoned_snapshots(db_cursor, 24) == [2, 4]
+    assert xer_partitions.find_abandoned_snapshots(db_cursor, 0.5) == [2, 3, 4]
+
+def test_no_abandoned_snapshots_before_migration(db_cursor, monkeypatch):
+    monkeypatch.setattr(xer_partitions, 'get_table_columns', lambda cursor, table: {'published': 'boolean'})
+
+    assert xer_partitions.find_abandoned_snapshots(db_cursor, 24) == []
@@ -0,0 +1,45 @@
+"""
+Checks that read model columns take the types of their source columns.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import xer_read_models
+
+SOURCE_COLUMNS = {
+    'TASK': {
+        'task_id': 'BIGINT', 'proj_id': 'BIGINT', 'task_code': 'TEXT', 'task_name': 'TEXT',
+        'target_drtn_hr_cnt': 'DOUBLE PRECISION', 'target_start_date': 'TIMESTAMP', 'status_code': 'TEXT'
+    },
+    'TASKPRED': {'task_id': 'BIGINT', 'pred_task_id': 'BIGINT', 'lag_hr_cnt': 'DOUBLE PRECISION'},
+}
+
+def column_types(monkeypatch, read_model):
+    monkeypatch.setattr(xer_read_models, 'get_table_columns', lambda db_cursor, table: SOURCE_COLUMNS.get(table))
+    return dict(xer_read_models.read_model_column_types(None, read_model))
+
+def test_awp_tasks_keep_source_types(monkeypatch):
+    types = column_types(monkeypatch, 'awp_tasks_mv')
+
+    assert types['task_id'] == types['proj_id'] == 'BIGINT'
+    assert types['target_start_date'] == 'TIMESTAMP'
+    assert types['target_drtn_hr_cnt'] == 'DOUBLE PRECISION'
+    assert types['guid'] == 'TEXT'
+
+def test_activity_relationships_map_renamed_columns(monkeypatch):
+    types = column_types(monkeypatch, 'activity_relationship_mv')
+
+    assert types['project_id'] == 'BIGINT'
+    assert types['lag'] == 'DOUBLE PRECISION'
+    assert types['original_duration'] == 'DOUBLE PRECISION'
+    assert types['relationship_type'] == 'TEXT'
+    assert types['predecessor_activity_duration'] == 'DOUBLE PRECISION'
+    assert types['lead_or_lag'] == 'TEXT'
+
+def test_missing_source_table_falls_back_to_text(monkeypatch):
+    types = column_types(monkeypatch, 'wbs_structure_mv')
+
+    assert set(types.values()) == {'TEXT'}
@@ -0,0 +1,123 @@
+"""
+Checks of the streaming XER reader.
+"""
+
+import os
+import sys
+import gzip
+import zipfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import xer_reader
+
+def read_tables(path, **kwargs):
+    tables = {}
+    for table_name, columns, records in xer_reader.iter_xer_batches(str(path), **kwargs):
+        entry = tables.setdefault(table_name, {'columns': columns, 'rows': []})
+        entry['rows'].extend(records)
+    return tables
+
+def write_gzip(path, text, encoding):
+    with gzip.open(path, 'wb') as file:
+        file.write(text.encode(encoding))
+
+def task_lines(names):
+    return ''.join(f'%R\t{index}\t{name}\n' for index, name in enumerate(names, 1))
+
+P6_EXPORT = (
+    'ERMHDR\t19.12\n'
+    '%T\tPROJECT\n%F\tproj_id\tproj_short_name\n%R\t7\tP1\n'
+    '%T\tTASK\n%F\ttask_id\tproj_id\ttask_name\n'
+    '%R\t1\t7\tDig\n%R\t2\t7\t\n%R\t3\t7\tPour\n'
+    '%E\n'
+)
+
+HEADER_EXPORT = (
+    'ERMHDR\t19.12\n'
+    'TASK\tTASK_ID\tPROJ_ID\tTask Name\n'
+    'TASK\t1\t7\tDig\n'
+    'TASK\t2\tNULL\t\n'
+    'TASKPRED\tTASK_PRED_ID\tTASK_ID\tPRED_TASK_ID\tPRED_TYPE\n'
+    'TASKPRED\t9\t2\t1\tFS\n'
+)
+
+def write_export(path, text, container):
+    if container == 'gzip':
+        write_gzip(path, text, 'utf-8')
+    elif container == 'zip':
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('exports/P1_2025-01-06.xer', text)
+    else:
+        path.write_text(text, encoding='utf-8')
+
+def test_tokenize_rows_splits_well_formed_runs():
+    rows = xer_reader.tokenize_rows('%R\t1\tA\n%R\t2\t\n', 3)
+
+    assert rows == [(None, '1', 'A'), (None, '2', None)]
+
+def test_tokenize_rows_strips_pads_and_cuts():
+    rows = xer_reader.tokenize_rows('%R\t1\t A \n\n%R\t2\n%R\t3\tC\tX\n', 3)
+
+    assert rows == [(None, '1', 'A'), (None, '2', None), (None, '3', 'C')]
+
+@pytest.mark.parametrize('container', ['xer', 'gzip', 'zip'])
+def test_p6_layout(tmp_path, container):
+    path = tmp_path / 'upload'
+    write_export(path, P6_EXPORT, container)
+
+    batches = list(xer_reader.iter_xer_batches(str(path), batch_size=2))
+
+    assert [(name, len(records)) for name, _, records in batches] == [('PROJECT', 1), ('TASK', 2), ('TASK', 1)]
+    tables = read_tables(path)
+    assert tables['TASK']['columns'] == ['col_0', 'task_id', 'proj_id', 'task_name']
+    assert [row[1:] for row in tables['TASK']['rows']] == [('1', '7', 'Dig'), ('2', '7', None), ('3', '7', 'Pour')]
+
+@pytest.mark.parametrize('container', ['xer', 'gzip', 'zip'])
+def test_header_layout(tmp_path, container):
+    path = tmp_path / 'upload'
+    write_export(path, HEADER_EXPORT, container)
+
+    tables = read_tables(path)
+
+    assert tables['TASK'] == {
+        'columns': ['task_id', 'proj_id', 'task_name'],
+        'rows': [('1', '7', 'Dig'), ('2', None, None)],
+    }
+    assert tables['TASKPRED']['rows'] == [('9', '2', '1', 'FS')]
+
+def test_tables_filter_skips_other_tables(tmp_path):
+    path = tmp_path / 'P1_2025-01-06.xer'
+    path.write_text(P6_EXPORT, encoding='utf-8')
+
+    assert list(read_tables(path, tables=['PROJECT'])) == ['PROJECT']
+
+def test_zip_members_are_listed(tmp_path):
+    path = tmp_path / 'upload'
+    write_export(path, P6_EXPORT, 'zip')
+
+    members = xer_reader.list_xer_members(str(path), 'upload.zip')
+
+    assert members == [('exports/P1_2025-01-06.xer', 'P1_2025-01-06.xer')]
+    assert list(read_tables(path, member=members[0][0])) == ['PROJECT', 'TASK']
+
+def test_compressed_file_uses_one_encoding(tmp_path, monkeypatch):
+    monkeypatch.setattr(xer_reader, 'READ_BLOCK_SIZE', 64)
+    # 'é' first appears where it is also valid UTF-8 ('Ã©'), the cp1252-only byte comes much later
+    names = ['CafÃ©'] + ['Plain'] * 20 + ['Naïve']
+    path = tmp_path / 'T_2025-01-06.xer.gz'
+    write_gzip(path, '%T\tTASK\n%F\ttask_id\ttask_name\n' + task_lines(names) + '%E\n', 'cp1252')
+
+    rows = read_tables(path)['TASK']['rows']
+
+    assert [row[-1] for row in rows] == names
+
+def test_compressed_utf8_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(xer_reader, 'READ_BLOCK_SIZE', 64)
+    names = ['Plain'] * 20 + ['Béton – øst']
+    path = tmp_path / 'T_2025-01-06.xer.gz'
+    write_gzip(path, '%T\tTASK\n%F\ttask_id\ttask_name\n' + task_lines(names) + '%E\n', 'utf-8')
+
+    assert [row[-1] for row in read_tables(path)['TASK']['rows']] == names
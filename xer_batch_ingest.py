@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Batch ingestion of many XER files.
+Files from directories, glob patterns or explicit paths are ingested by a
+bounded set of loader processes. Each process parses one file at a time and
+streams its batches straight into PostgreSQL on its own pooled connections,
+so memory stays bounded by the batch size whatever the file sizes are, and
+parsing still runs on several cores. Compressed files (.xer.gz, .xer.zst) are
+decompressed while they are parsed, and every XER file in a .zip archive is
+ingested as its own snapshot. A JSON manifest records every finished file so
+an interrupted run can be resumed without loading anything twice.
+
+Usage:
+    python xer_batch_ingest.py <directory|glob|file> [...] [--manifest PATH]
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Only the reader is imported at module level: config.database opens a connection
+# pool on import, which the parent process does not need.
+from xer_reader import list_xer_members
+
+DEFAULT_MANIFEST_PATH = os.getenv('XER_BATCH_MANIFEST', 'xer_ingest_manifest.json')
+
+# Files ingested at the same time, each by its own loader process
+DEFAULT_LOADERS = int(os.getenv('XER_BATCH_LOADERS', '4'))
+
+MANIFEST_VERSION = 1
+
+# Files picked up from directories; P6 exports often use an upper case extension
+XER_FILE_PATTERNS = ('*.xer', '*.XER', '*.xer.gz', '*.xer.zst', '*.zip')
+
+# Separates an archive path from a member name in manifest keys
+MEMBER_SEPARATOR = '!'
+
+def find_xer_files(inputs, recursive=False):
+    """
+    Expand directories, glob patterns and file paths into a sorted list of
+    absolute XER file paths (plain, compressed or zip archives) without
+    duplicates.
+    """
+    found = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            directory = os.path.join(item, '**') if recursive else item
+            matches = []
+            for pattern in XER_FILE_PATTERNS:
+                matches += glob.glob(os.path.join(directory, pattern), recursive=recursive)
+        elif os.path.isfile(item):
+            matches = [item]
+        else:
+            matches = glob.glob(item, recursive=True)
+            if not matches:
+                print(f"[Batch] Warning: Nothing matches {item}")
+        found.update(os.path.abspath(path) for path in matches if os.path.isfile(path))
+    return sorted(found)
+
+def expand_xer_files(paths):
+    """
+    Return (key, path, member, filename) for every XER file in `paths`: one
+    per plain or compressed file, one per XER file of a zip archive. The key
+    identifies the file in the manifest (path!member for archive members).
+    Unreadable archives are reported and skipped.
+    """
+    items = []
+    for path in paths:
+        try:
+            members = list_xer_members(path)
+        except Exception as e:
+            print(f"[Batch] Warning: Skipping {path}: {str(e)}")
+            continue
+        for member, filename in members:
+            key = path if member is None else f"{path}{MEMBER_SEPARATOR}{member}"
+            items.append((key, path, member, filename))
+    return items
+
+def file_signature(path):
+    """Return the size and modification time used to detect changed files"""
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+def load_manifest(manifest_path):
+    """Read a batch manifest, or return an empty one if it does not exist"""
+    if not os.path.exists(manifest_path):
+        return {'version': MANIFEST_VERSION, 'files': {}}
+    with open(manifest_path, 'r', encoding='utf-8') as manifest_file:
+        manifest = json.load(manifest_file)
+    manifest.setdefault('files', {})
+    return manifest
+
+def save_manifest(manifest_path, manifest):
+    """Write the manifest atomically so an interrupted run never leaves it truncated"""
+    directory = os.path.dirname(os.path.abspath(manifest_path))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{manifest_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+def is_done(manifest, key, path):
+    """Return True if the manifest has a successful load of the file (key) in the current state of path"""
+    entry = manifest['files'].get(key)
+    if not entry or entry.get('status') != 'done':
+        return False
+    signature = file_signature(path)
+    return entry.get('size') == signature['size'] and entry.get('mtime') == signature['mtime']
+
+def load_xer_file(path, member, filename, parallelism, incremental):
+    """
+    Parse and load one XER file (or member of a zip archive) in a loader
+    process. Batches are streamed into the database as they are parsed.
+    Returns the file_id, row count, load time and phase times.
+    """
+    from parse_xer_content import ingest_xer_file
+
+    started = time.perf_counter()
+    result = ingest_xer_file(path, filename, parallelism=parallelism, incremental=incremental, member=member)
+    return {
+        'file_id': result['file_id'],
+        'rows': sum(stats['rows'] for stats in result['tables'].values()),
+        'seconds': time.perf_counter() - started,
+        'phases': result['metrics']['phases']
+    }
+
+def format_rate(amount, seconds):
+    """Return amount per second, guarding against zero durations"""
+    return amount / seconds if seconds > 0 else 0.0
+
+def run_batch(items, manifest_path, loaders, parallelism=1, incremental=None):
+    """
+    Load the given files (see expand_xer_files) on `loaders` processes,
+    updating the manifest after every file. Returns aggregate statistics for
+    the run; the bytes of an archive are counted once however many files it
+    holds.
+    """
+    manifest = load_manifest(manifest_path)
+    totals = {'done': 0, 'failed': 0, 'rows': 0, 'bytes': 0}
+    counted_paths = set()
+
+    started = time.perf_counter()
+    # Spawned rather than forked so loader processes never inherit pooled connections
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=loaders, mp_context=context) as load_pool:
+        futures = {
+            load_pool.submit(load_xer_file, path, member, filename, parallelism, incremental): (key, path, filename)
+            for key, path, member, filename in items
+        }
+        for future in as_completed(futures):
+            key, path, filename = futures.pop(future)
+            signature = file_signature(path)
+            entry = dict(signature, status='failed', file_id=None, rows=0)
+            try:
+                loaded = future.result()
+                megabytes = signature['size'] / (1024 * 1024)
+                entry.update(
+                    status='done',
+                    file_id=loaded['file_id'],
+                    rows=loaded['rows'],
+                    load_seconds=round(loaded['seconds'], 3),
+                    phases=loaded['phases'],
+                    finished_at=time.time()
+                )
+                print(f"[Batch] {filename}: {loaded['rows']:,} rows, {megabytes:.1f} MB "
+                      f"in {loaded['seconds']:.2f}s, {format_rate(loaded['rows'], loaded['seconds']):,.0f} rows/s, "
+                      f"{format_rate(megabytes, loaded['seconds']):.1f} MB/s (file_id {loaded['file_id']})")
+            except Exception as e:
+                entry['error'] = str(e)
+                print(f"[Batch] Failed to ingest {key}: {str(e)}")
+
+            manifest['files'][key] = entry
+            save_manifest(manifest_path, manifest)
+            totals[entry['status']] += 1
+            if entry['status'] == 'done':
+                totals['rows'] += entry['rows']
+                if path not in counted_paths:
+                    counted_paths.add(path)
+                    totals['bytes'] += signature['size']
+
+    totals['seconds'] = time.perf_counter() - started
+    return totals
+
+def main():
+    """
+    Ingest every XER file matched by the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description='Ingest a directory or glob of XER files')
+    parser.add_argument('inputs', nargs='+', help='Directories, glob patterns or XER files (.xer, .xer.gz, .xer.zst, .zip)')
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST_PATH,
+                        help='JSON file recording finished files, used to resume interrupted runs')
+    parser.add_argument('--recursive', action='store_true', help='Search directories recursively')
+    parser.add_argument('--loaders', type=int, default=DEFAULT_LOADERS,
+                        help='Loader processes, each parsing and loading one file at a time')
+    parser.add_argument('--load-parallelism', type=int, default=1,
+                        help='Loader connections per file (see XER_LOAD_PARALLELISM)')
+    parser.add_argument('--incremental', action='store_true', default=None,
+                        help='Store only changes since the previous snapshot of each project')
+    parser.add_argument('--no-resume', action='store_true',
+                        help='Ingest every file even if the manifest lists it as done')
+    args = parser.parse_args()
+
+    from parse_xer_content import check_connection_budget
+
+    loaders = max(1, args.loaders)
+    parallelism = max(1, args.load_parallelism)
+    try:
+        # Each file holds its loader connections plus its own and one for DDL/publishing
+        check_connection_budget(loaders, parallelism)
+    except ValueError as e:
+        print(f"[Batch] Error: {str(e)}; lower --loaders or --load-parallelism")
+        return 1
+
+    items = expand_xer_files(find_xer_files(args.inputs, args.recursive))
+    if not args.no_resume:
+        manifest = load_manifest(args.manifest)
+        remaining = [item for item in items if not is_done(manifest, item[0], item[1])]
+        if len(remaining) < len(items):
+            print(f"[Batch] Skipping {len(items) - len(remaining)} files already ingested "
+                  f"according to {args.manifest}")
+        items = remaining
+
+    if not items:
+        print("[Batch] No XER files to ingest")
+        return 0
+
+    print(f"[Batch] Ingesting {len(items)} files with {loaders} loader processes")
+    totals = run_batch(items, args.manifest, loaders, parallelism, args.incremental)
+
+    megabytes = totals['bytes'] / (1024 * 1024)
+    print(f"[Batch] Finished: {totals['done']} files ingested, {totals['failed']} failed, "
+          f"{totals['rows']:,} rows, {megabytes:.1f} MB in {totals['seconds']:.2f}s "
+          f"({format_rate(totals['rows'], totals['seconds']):,.0f} rows/s, "
+          f"{format_rate(megabytes, totals['seconds']):.1f} MB/s)")
+    return 1 if totals['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Columnar export of XER snapshots for analytics.
+While a file is ingested, its parsed batches are also written as one
+zstd-compressed Parquet file per table, with the column types of xer_types
+(BIGINT -> int64, DOUBLE PRECISION and NUMERIC -> float64, TIMESTAMP ->
+timestamp[us], TEXT -> string), next to a manifest.json describing them:
+
+    <XER_COLUMNAR_DIR>/file_id=<file_id>/manifest.json
+    <XER_COLUMNAR_DIR>/file_id=<file_id>/<TABLE>.parquet
+
+A snapshot is written to a hidden staging directory and renamed into place
+once the ingestion has committed, so readers never see half an export. The
+export sees every row of the file, including the ones incremental loads skip,
+so each snapshot's files are self-contained. Snapshots ingested before the
+export was enabled are exported from the database with `export`.
+
+read_snapshot_table and read_snapshot_arrays load selected columns of many
+snapshots as one Arrow table (or NumPy arrays) with a leading file_id
+column, reading the Parquet files through memory maps, so cross-snapshot
+aggregates (float trends, lead history, progress curves) run in-process
+without querying PostgreSQL.
+
+pyarrow is optional: it is imported when an export or read starts, and
+ingestion skips the export with a warning if it is missing. The readers need
+no database connection; config.database is only imported to export
+snapshots from the database.
+
+Usage:
+    python xer_columnar.py export <file_id> [...]
+    python xer_columnar.py list [project_name]
+"""
+
+import os
+import sys
+import json
+import uuid
+import shutil
+from datetime import datetime
+
+from xer_types import TEXT, BIGINT, DOUBLE, NUMERIC, TIMESTAMP, infer_column_types, infer_column_type, merge_types
+from xer_metrics import log
+
+# Write each ingested snapshot as Parquet files (needs pyarrow)
+COLUMNAR_EXPORT = os.getenv('XER_COLUMNAR_EXPORT', 'false').lower() == 'true'
+
+# Root directory of the exported snapshots
+COLUMNAR_DIR = os.getenv(
+    'XER_COLUMNAR_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'columnar')
+)
+
+# Rows buffered per table before they are written as one Parquet row group
+ROW_GROUP_ROWS = 128 * 1024
+
+COMPRESSION = 'zstd'
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+SNAPSHOT_PREFIX = 'file_id='
+
+# Rows per fetch when exporting a snapshot from the database
+EXPORT_FETCH_ROWS = 10000
+
+def require_pyarrow():
+    """Import pyarrow and pyarrow.parquet, or explain how to install them"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Columnar export requires the pyarrow package (pip install pyarrow)")
+    return pyarrow, pyarrow.parquet
+
+def arrow_type(pa, column_type):
+    """Return the Arrow type a column of an xer_types type is stored as"""
+    if column_type == BIGINT:
+        return pa.int64()
+    if column_type in (DOUBLE, NUMERIC):
+        return pa.float64()
+    if column_type == TIMESTAMP:
+        return pa.timestamp('us')
+    return pa.string()
+
+def snapshot_dir(file_id, root=None):
+    """Return the directory holding one snapshot's export"""
+    return os.path.join(root or COLUMNAR_DIR, f'{SNAPSHOT_PREFIX}{file_id}')
+
+class TableWriter:
+    """
+    Writes the batches of one table to a Parquet file. Column types are
+    inferred from the first batch; when a later batch does not convert, the
+    column is widened with merge_types and the rows written so far are
+    rewritten with the wider type, like widen_nonconforming_columns does for
+    the database tables.
+    """
+
+    def __init__(self, pa, pq, path, columns, records):
+        self.pa = pa
+        self.pq = pq
+        self.path = path
+        self.columns = list(columns)
+        self.column_types = infer_column_types(self.columns, records)
+        self.pending = []
+        self.pending_rows = 0
+        self.rows = 0
+        self.writer = None
+
+    def schema(self):
+        return self.pa.schema([
+            (name, arrow_type(self.pa, column_type)) for name, column_type in zip(self.columns, self.column_types)
+        ])
+
+    def convert(self, records):
+        """Turn record tuples into a RecordBatch, widening columns that do not convert"""
+        pa = self.pa
+        column_values = list(zip(*records))
+        arrays = []
+        for index, values in enumerate(column_values[:len(self.columns)]):
+            strings = pa.array(values, type=pa.string())
+            while True:
+                target = arrow_type(pa, self.column_types[index])
+                try:
+                    arrays.append(strings.cast(target))
+                    break
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    self.widen(index, infer_column_type(self.columns[index], values))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema())
+
+    def widen(self, index, inferred_type):
+        """Widen one column to hold inferred_type and recast what was already converted"""
+        current_type = self.column_types[index]
+        widened = merge_types(current_type, inferred_type)
+        # Arrow's parsers are stricter than the xer_types patterns in a few corners
+        self.column_types[index] = widened if widened != current_type else TEXT
+        log(f"[Columnar] Widened {os.path.basename(self.path)} column {self.columns[index]} "
+            f"from {current_type} to {self.column_types[index]}")
+        schema = self.schema()
+        self.pending = [batch.cast(schema) for batch in self.pending]
+        if self.writer is not None:
+            self.writer.close()
+            written = self.pq.read_table(self.path).cast(schema)
+            self.writer = self.pq.ParquetWriter(self.path, schema, compression=COMPRESSION)
+            self.writer.write_table(written, row_group_size=ROW_GROUP_ROWS)
+
+    def add(self, records):
+        """Buffer a batch of records; full row groups are written out"""
+        if not records:
+            return
+        # Converting may widen a column, which replaces self.pending
+        batch = self.convert(records)
+        self.pending.append(batch)
+        self.pending_rows += len(records)
+        self.rows += len(records)
+        if self.pending_rows >= ROW_GROUP_ROWS:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        table = self.pa.Table.from_batches(self.pending, schema=self.schema())
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema, compression=COMPRESSION)
+        self.writer.write_table(table, row_group_size=ROW_GROUP_ROWS)
+        self.pending = []
+        self.pending_rows = 0
+
+    def close(self):
+        """Write the remaining rows and return the table's manifest entry"""
+        self.flush()
+        if self.writer is None:
+            # A table without rows still gets a file, so its columns are known
+            self.writer = self.pq.ParquetWriter(self.path, self.schema(), compression=COMPRESSION)
+        self.writer.close()
+        self.writer = None
+        return {
+            'file': os.path.basename(self.path),
+            'rows': self.rows,
+            'bytes': os.path.getsize(self.path),
+            'columns': dict(zip(self.columns, self.column_types))
+        }
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+class SnapshotExport:
+    """
+    The Parquet export of one snapshot. Tables are written into a staging
+    directory as their batches arrive; finish() writes the manifest and
+    renames the directory into place, discard() removes it.
+    """
+
+    def __init__(self, file_id, filename=None, project_info=None, source='ingest', root=None):
+        self.pa, self.pq = require_pyarrow()
+        self.file_id = file_id
+        self.filename = filename
+        self.project_info = project_info or {}
+        self.source = source
+        self.root = root or COLUMNAR_DIR
+        self.staging_dir = os.path.join(self.root, f'.{SNAPSHOT_PREFIX}{file_id}.{uuid.uuid4().hex}')
+        self.writers = {}
+        self.active = True
+        os.makedirs(self.staging_dir)
+
+    def add(self, table_name, columns, records):
+        """Append a batch of (table_name, columns, records) from the batch stream"""
+        writer = self.writers.get(table_name)
+        if writer is None:
+            path = os.path.join(self.staging_dir, f'{table_name}.parquet')
+            writer = self.writers[table_name] = TableWriter(self.pa, self.pq, path, columns, records)
+        elif list(columns) != writer.columns:
+            raise ValueError(f"Table {table_name} appears twice with different columns")
+        writer.add(records)
+
+    def finish(self):
+        """Close all tables, write the manifest and publish the export; returns the manifest"""
+        tables = {table_name: writer.close() for table_name, writer in self.writers.items()}
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'file_id': self.file_id,
+            'filename': self.filename,
+            'project_name': self.project_info.get('project_name'),
+            'snapshot_date': self.project_info.get('snapshot_date'),
+            'source': self.source,
+            'exported_at': datetime.now().isoformat(timespec='seconds'),
+            'tables': tables
+        }
+        with open(os.path.join(self.staging_dir, MANIFEST_NAME), 'w', encoding='utf-8') as handle:
+            json.dump(manifest, handle, indent=2)
+
+        target_dir = snapshot_dir(self.file_id, self.root)
+        if os.path.exists(target_dir):
+            shutil.rmtree(target_dir)
+        os.replace(self.staging_dir, target_dir)
+        self.active = False
+
+        rows = sum(table['rows'] for table in tables.values())
+        size = sum(table['bytes'] for table in tables.values())
+        log(f"[Columnar] file_id {self.file_id}: {len(tables)} tables, {rows} rows, "
+            f"{size / (1024 * 1024):.1f} MB in {target_dir}")
+        return manifest
+
+    def discard(self):
+        """Drop a partial export"""
+        for writer in self.writers.values():
+            writer.abort()
+        self.writers = {}
+        self.active = False
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+def open_snapshot_export(file_id, filename=None, project_info=None):
+    """
+    Start the export of an ingested file, or return None (with a warning)
+    if it cannot be written, so ingestion goes on without it.
+    """
+    try:
+        return SnapshotExport(file_id, filename, project_info)
+    except Exception as e:
+        print(f"[Columnar] Warning: Skipping the Parquet export of file_id {file_id}: {str(e)}")
+        return None
+
+def collect_columnar_export(batches, export, metrics=None):
+    """
+    Pass a batch stream through unchanged while writing it to `export`.
+    A failing export is reported and discarded; the batches keep flowing
+    to the database either way.
+    """
+    for table_name, columns, records in batches:
+        if export.active:
+            try:
+                if metrics is not None:
+                    with metrics.phase('export'):
+                        export.add(table_name, columns, records)
+                else:
+                    export.add(table_name, columns, records)
+            except Exception as e:
+                print(f"[Columnar] Warning: Parquet export of file_id {export.file_id} failed: {str(e)}")
+                export.discard()
+        yield table_name, columns, records
+
+def get_xer_tables(db_cursor):
+    """Return the tables loaded from XER files; they keep the upper-case names of the export"""
+    from xer_partitions import PARTITIONED_TABLES, get_snapshot_tables
+
+    tables = set(get_snapshot_tables(db_cursor)) | set(PARTITIONED_TABLES)
+    return sorted(name for name in tables if name == name.upper())
+
+def export_snapshot_from_database(file_id, root=None):
+    """
+    Export a snapshot that is already in the database. Incremental snapshots
+    read unchanged tables from the snapshot they reference. Returns the
+    manifest.
+    """
+    from config.database import get_connection, return_connection, stream_query_batches
+    from xer_schema import get_table_columns
+    from xer_read_models import resolve_source_file_id, column_expr
+
+    connection = get_connection()
+    sources = []
+    try:
+        with connection.cursor() as db_cursor:
+            db_cursor.execute(
+                "SELECT file_name, project_name, snapshot_date FROM file_metadata WHERE file_id = %s",
+                (file_id,)
+            )
+            row = db_cursor.fetchone()
+            if row is None:
+                raise ValueError(f"file_id {file_id} does not exist")
+            filename, project_name, snapshot_date = row
+            for table_name in get_xer_tables(db_cursor):
+                table_columns = get_table_columns(db_cursor, table_name)
+                if not table_columns:
+                    continue
+                sources.append((table_name, table_columns, resolve_source_file_id(db_cursor, file_id, table_name)))
+        connection.rollback()
+    finally:
+        return_connection(connection)
+
+    project_info = {'project_name': project_name, 'snapshot_date': snapshot_date}
+    export = SnapshotExport(file_id, filename, project_info, source='database', root=root)
+    try:
+        for table_name, table_columns, source_file_id in sources:
+            columns = [column for column in table_columns if column != 'file_id']
+            query = (
+                f'SELECT {", ".join(column_expr("t", table_columns, column) for column in columns)} '
+                f'FROM "{table_name}" t WHERE t.file_id = %s'
+            )
+            for rows in stream_query_batches(query, (source_file_id,), EXPORT_FETCH_ROWS):
+                export.add(table_name, columns, rows)
+        return export.finish()
+    except Exception:
+        export.discard()
+        raise
+
+def read_manifest(directory):
+    """Return the manifest of an exported snapshot directory, or None"""
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), encoding='utf-8') as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return None
+
+def list_snapshots(project_name=None, file_ids=None, root=None):
+    """Return the manifests of the exported snapshots, ordered by file_id"""
+    root = root or COLUMNAR_DIR
+    if not os.path.isdir(root):
+        return []
+    wanted = set(file_ids) if file_ids is not None else None
+    manifests = []
+    for entry in os.listdir(root):
+        if not entry.startswith(SNAPSHOT_PREFIX):
+            continue
+        manifest = read_manifest(os.path.join(root, entry))
+        if manifest is None:
+            continue
+        if wanted is not None and manifest['file_id'] not in wanted:
+            continue
+        if project_name is not None and manifest.get('project_name') != project_name:
+            continue
+        manifests.append(manifest)
+    return sorted(manifests, key=lambda manifest: manifest['file_id'])
+
+def read_snapshot_table(table_name, columns=None, file_ids=None, project_name=None, root=None):
+    """
+    Load columns of one table from many exported snapshots into a single
+    Arrow table whose first column is file_id. The Parquet files are read
+    through memory maps. Snapshots without the table are skipped and columns
+    missing from a snapshot read as nulls; a column stored with different
+    types across snapshots is promoted to a common type.
+    """
+    pa, pq = require_pyarrow()
+    root = root or COLUMNAR_DIR
+    tables = []
+    for manifest in list_snapshots(project_name, file_ids, root):
+        entry = manifest['tables'].get(table_name)
+        if entry is None:
+            continue
+        selected = None
+        if columns is not None:
+            selected = [column for column in columns if column in entry['columns'] and column != 'file_id']
+        path = os.path.join(snapshot_dir(manifest['file_id'], root), entry['file'])
+        table = pq.read_table(path, columns=selected, memory_map=True)
+        table = table.add_column(0, 'file_id', pa.repeat(pa.scalar(manifest['file_id'], pa.int64()), table.num_rows))
+        tables.append(table)
+
+    if not tables:
+        return None
+    combined = pa.concat_tables(tables, promote_options='permissive')
+    if columns is not None:
+        # Requested order; columns no snapshot has are left out
+        combined = combined.select(['file_id'] + [column for column in columns if column in combined.column_names])
+    return combined
+
+def read_snapshot_arrays(table_name, columns, file_ids=None, project_name=None, root=None):
+    """
+    Like read_snapshot_table, but returns {column: numpy array}, including
+    file_id. Nulls in numeric columns become NaN, timestamps datetime64 and
+    text an object array.
+    """
+    table = read_snapshot_table(table_name, columns, file_ids, project_name, root)
+    if table is None:
+        return {}
+    return {name: table.column(name).to_numpy() for name in table.column_names}
+
+def main():
+    """
+    Export snapshots from the database or list the exported ones.
+    """
+    if len(sys.argv) < 2 or sys.argv[1] not in ('export', 'list'):
+        print("Usage: python xer_columnar.py export <file_id> [...] | list [project_name]")
+        return 1
+
+    if sys.argv[1] == 'export':
+        if len(sys.argv) < 3:
+            print("Usage: python xer_columnar.py export <file_id> [...]")
+            return 1
+        for file_id in map(int, sys.argv[2:]):
+            manifest = export_snapshot_from_database(file_id)
+            rows = sum(table['rows'] for table in manifest['tables'].values())
+            print(f"[Columnar] Exported file_id {file_id}: {len(manifest['tables'])} tables, {rows} rows")
+        return 0
+
+    project_name = sys.argv[2] if len(sys.argv) > 2 else None
+    for manifest in list_snapshots(project_name):
+        rows = sum(table['rows'] for table in manifest['tables'].values())
+        print(f"{manifest['file_id']}\t{manifest.get('project_name') or ''}\t{manifest.get('filename') or ''}\t"
+              f"{len(manifest['tables'])} tables\t{rows} rows")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
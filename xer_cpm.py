@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Critical path method (CPM) engine for XER snapshots.
+Recomputes early/late dates, total/free float and the driving path of a
+snapshot from TASK and TASKPRED, instead of trusting the float values the
+XER was exported with.
+
+The network is held as NumPy arrays: relationships are sorted into a CSR
+(compressed sparse row) adjacency keyed by predecessor, and the forward pass
+walks it in topological levels (Kahn's algorithm), relaxing all outgoing
+relationships of a level in one vectorized step. The backward pass replays
+the same levels in reverse. Activities that are never reached belong to (or
+follow) a relationship loop and are reported instead of scheduled.
+
+Dates are working-hour offsets from the data date: calendars, constraints
+and out-of-sequence progress are not modelled. Completed activities have
+zero remaining duration; others use remain_drtn_hr_cnt, falling back to
+target_drtn_hr_cnt.
+
+Usage:
+    python xer_cpm.py <file_id> [...]
+"""
+
+import io
+import sys
+import time
+import numpy as np
+
+from config.database import get_connection, return_connection
+from xer_schema import get_table_columns, note_schema_change, publish_schema_changes
+from xer_types import NUMERIC_TYPES
+from xer_read_models import resolve_source_file_id
+from xer_metrics import log
+
+# P6 relationship types as (predecessor side is its finish, successor side is its finish)
+RELATIONSHIP_SIDES = {
+    'PR_FS': (1, 0),
+    'PR_SS': (0, 0),
+    'PR_FF': (1, 1),
+    'PR_SF': (0, 1),
+}
+
+# Exports in the header layout (see xer_reader) may use the bare codes
+RELATIONSHIP_TYPE_ALIASES = {
+    'FS': 'PR_FS',
+    'SS': 'PR_SS',
+    'FF': 'PR_FF',
+    'SF': 'PR_SF',
+}
+
+# Slack (in hours) below which a relationship counts as driving
+FLOAT_TOLERANCE = 1e-6
+
+# Characters that must be escaped in PostgreSQL COPY text format
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+RESULT_COLUMNS = (
+    'file_id', 'task_id', 'task_code', 'early_start_hr', 'early_finish_hr', 'late_start_hr',
+    'late_finish_hr', 'total_float_hr_cnt', 'free_float_hr_cnt', 'driving_path_flag', 'in_cycle',
+    'imported_total_float_hr_cnt', 'imported_free_float_hr_cnt'
+)
+
+def build_csr(pred_index, node_count):
+    """
+    Return (indptr, order) of a CSR adjacency keyed by predecessor: the
+    relationships of node i are order[indptr[i]:indptr[i + 1]].
+    """
+    order = np.argsort(pred_index, kind='stable')
+    indptr = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pred_index, minlength=node_count), out=indptr[1:])
+    return indptr, order
+
+def gather_edges(indptr, nodes):
+    """Return the CSR positions of every outgoing relationship of nodes"""
+    starts = indptr[nodes]
+    counts = indptr[nodes + 1] - starts
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+
+def compute_cpm(durations, pred_index, succ_index, pred_finish, succ_finish, lags):
+    """
+    Run the forward and backward passes over an activity network.
+    All arguments are NumPy arrays: durations per activity, and per
+    relationship the predecessor/successor indexes, whether each side is
+    anchored at the activity's finish (see RELATIONSHIP_SIDES) and the lag.
+    Returns a dictionary of per-activity arrays; activities caught in or
+    behind a loop have NaN dates and in_cycle set.
+    """
+    node_count = len(durations)
+    indptr, order = build_csr(pred_index, node_count)
+    edge_pred = pred_index[order]
+    edge_succ = succ_index[order]
+    edge_a = pred_finish[order]
+    edge_b = succ_finish[order]
+    edge_lag = lags[order]
+
+    # Forward pass, one topological level at a time
+    indegree = np.bincount(edge_succ, minlength=node_count)
+    early_start = np.zeros(node_count)
+    level = np.full(node_count, -1, dtype=np.int64)
+    levels = []
+    frontier = np.flatnonzero(indegree == 0)
+    while frontier.size:
+        level[frontier] = len(levels)
+        levels.append(frontier)
+        edges = gather_edges(indptr, frontier)
+        if not edges.size:
+            break
+        preds = edge_pred[edges]
+        succs = edge_succ[edges]
+        candidate = (early_start[preds] + edge_a[edges] * durations[preds] + edge_lag[edges]
+                     - edge_b[edges] * durations[succs])
+        np.maximum.at(early_start, succs, candidate)
+        np.subtract.at(indegree, succs, 1)
+        succs = np.unique(succs)
+        frontier = succs[indegree[succs] == 0]
+
+    in_cycle = level < 0
+    early_finish = early_start + durations
+    scheduled = ~in_cycle
+    project_finish = float(early_finish[scheduled].max()) if scheduled.any() else 0.0
+
+    # Relationships between scheduled activities; anything touching a loop is ignored
+    valid = scheduled[edge_pred] & scheduled[edge_succ]
+    slack = ((early_start[edge_succ] + edge_b * durations[edge_succ])
+             - (early_start[edge_pred] + edge_a * durations[edge_pred]) - edge_lag)
+    driving_edge = valid & (slack <= FLOAT_TOLERANCE)
+
+    # Backward pass over the same levels in reverse; successors are always final first
+    late_finish = np.full(node_count, project_finish)
+    driving = scheduled & (early_finish >= project_finish - FLOAT_TOLERANCE)
+    for frontier in reversed(levels):
+        edges = gather_edges(indptr, frontier)
+        edges = edges[valid[edges]]
+        if not edges.size:
+            continue
+        preds = edge_pred[edges]
+        succs = edge_succ[edges]
+        target = (late_finish[succs] - (1 - edge_b[edges]) * durations[succs] - edge_lag[edges]
+                  + (1 - edge_a[edges]) * durations[preds])
+        np.minimum.at(late_finish, preds, target)
+        on_path = driving_edge[edges] & driving[succs]
+        driving[preds[on_path]] = True
+    late_start = late_finish - durations
+
+    # Free float: the smallest slack to any successor, or to the project finish
+    free_float = project_finish - early_finish
+    np.minimum.at(free_float, edge_pred[valid], slack[valid])
+
+    results = {
+        'early_start': early_start,
+        'early_finish': early_finish,
+        'late_start': late_start,
+        'late_finish': late_finish,
+        'total_float': late_start - early_start,
+        'free_float': free_float,
+    }
+    for values in results.values():
+        values[in_cycle] = np.nan
+    results['driving'] = driving
+    results['in_cycle'] = in_cycle
+    results['project_finish'] = project_finish
+    return results
+
+def numeric_expr(table_columns, column):
+    """Select a column as DOUBLE PRECISION, mapping missing or non-numeric values to NULL"""
+    column_type = table_columns.get(column)
+    if column_type is None:
+        return 'NULL::DOUBLE PRECISION'
+    if column_type in NUMERIC_TYPES:
+        return f'"{column}"::DOUBLE PRECISION'
+    return (f'CASE WHEN "{column}" ~ \'^\\s*-?([0-9]+\\.?[0-9]*|\\.[0-9]+)([eE][-+]?[0-9]+)?\\s*$\' '
+            f'THEN "{column}"::DOUBLE PRECISION END')
+
+def text_expr(table_columns, column):
+    """Select a column as TEXT, or NULL if the export does not have it"""
+    return f'"{column}"::TEXT' if column in table_columns else 'NULL::TEXT'
+
+def relationship_sides(pred_type):
+    """Return the RELATIONSHIP_SIDES of a P6 or bare relationship type, or None if it is unknown"""
+    if pred_type is None:
+        return None
+    code = pred_type.strip().upper()
+    return RELATIONSHIP_SIDES.get(RELATIONSHIP_TYPE_ALIASES.get(code, code))
+
+def load_network(db_cursor, file_id):
+    """
+    Read the activities and relationships of a snapshot into NumPy arrays.
+    Relationships of an unknown type are left out and counted per type in
+    'unknown_types'. Returns None if the snapshot has no usable TASK/TASKPRED
+    data.
+    """
+    task_columns = get_table_columns(db_cursor, 'TASK') or {}
+    pred_columns = get_table_columns(db_cursor, 'TASKPRED') or {}
+    if 'task_id' not in task_columns or not {'task_id', 'pred_task_id'} <= set(pred_columns):
+        return None
+
+    task_file_id = resolve_source_file_id(db_cursor, file_id, 'TASK')
+    pred_file_id = resolve_source_file_id(db_cursor, file_id, 'TASKPRED')
+
+    db_cursor.execute(f"""
+        SELECT "task_id"::TEXT, {text_expr(task_columns, 'task_code')}, {text_expr(task_columns, 'status_code')},
+               {numeric_expr(task_columns, 'remain_drtn_hr_cnt')}, {numeric_expr(task_columns, 'target_drtn_hr_cnt')},
+               {numeric_expr(task_columns, 'total_float_hr_cnt')}, {numeric_expr(task_columns, 'free_float_hr_cnt')}
+        FROM "TASK"
+        WHERE file_id = %s AND "task_id" IS NOT NULL
+    """, (task_file_id,))
+    tasks = db_cursor.fetchall()
+
+    task_index = {}
+    for position, row in enumerate(tasks):
+        task_index[row[0]] = position
+    if len(task_index) < len(tasks):
+        # Keep the last row of duplicated task_ids, as the index above does
+        tasks = [row for position, row in enumerate(tasks) if task_index[row[0]] == position]
+        task_index = {row[0]: position for position, row in enumerate(tasks)}
+
+    durations = np.array([
+        0.0 if status == 'TK_Complete' else (remaining if remaining is not None else (target or 0.0))
+        for _, _, status, remaining, target, _, _ in tasks
+    ], dtype=np.float64)
+    np.maximum(durations, 0.0, out=durations)
+
+    db_cursor.execute(f"""
+        SELECT "task_id"::TEXT, "pred_task_id"::TEXT, {text_expr(pred_columns, 'pred_type')},
+               {numeric_expr(pred_columns, 'lag_hr_cnt')}
+        FROM "TASKPRED"
+        WHERE file_id = %s
+    """, (pred_file_id,))
+
+    pred_index, succ_index, pred_finish, succ_finish, lags = [], [], [], [], []
+    external = 0
+    unknown_types = {}
+    for succ_id, pred_id, pred_type, lag in db_cursor.fetchall():
+        succ_position = task_index.get(succ_id)
+        pred_position = task_index.get(pred_id)
+        if succ_position is None or pred_position is None:
+            # Relationship to an activity of another project that is not in this file
+            external += 1
+            continue
+        sides = relationship_sides(pred_type)
+        if sides is None:
+            unknown_types[pred_type] = unknown_types.get(pred_type, 0) + 1
+            continue
+        pred_index.append(pred_position)
+        succ_index.append(succ_position)
+        pred_finish.append(sides[0])
+        succ_finish.append(sides[1])
+        lags.append(lag or 0.0)
+
+    return {
+        'tasks': tasks,
+        'durations': durations,
+        'pred_index': np.array(pred_index, dtype=np.int64),
+        'succ_index': np.array(succ_index, dtype=np.int64),
+        'pred_finish': np.array(pred_finish, dtype=np.float64),
+        'succ_finish': np.array(succ_finish, dtype=np.float64),
+        'lags': np.array(lags, dtype=np.float64),
+        'external': external,
+        'unknown_types': unknown_types
+    }
+
+def ensure_result_table(db_cursor, schema_changes=None):
+    """Create xer_cpm_results unless the schema catalog already knows it"""
+    if get_table_columns(db_cursor, 'xer_cpm_results', schema_changes) is not None:
+        return
+    db_cursor.execute("""
+        CREATE TABLE IF NOT EXISTS xer_cpm_results (
+            file_id INTEGER NOT NULL,
+            task_id TEXT NOT NULL,
+            task_code TEXT,
+            early_start_hr DOUBLE PRECISION,
+            early_finish_hr DOUBLE PRECISION,
+            late_start_hr DOUBLE PRECISION,
+            late_finish_hr DOUBLE PRECISION,
+            total_float_hr_cnt DOUBLE PRECISION,
+            free_float_hr_cnt DOUBLE PRECISION,
+            driving_path_flag TEXT,
+            in_cycle BOOLEAN NOT NULL DEFAULT FALSE,
+            imported_total_float_hr_cnt DOUBLE PRECISION,
+            imported_free_float_hr_cnt DOUBLE PRECISION,
+            PRIMARY KEY (file_id, task_id)
+        )
+    """)
+    note_schema_change(db_cursor, 'xer_cpm_results', schema_changes)
+
+def format_number(value):
+    """Format a float for COPY, with NaN and None as NULL"""
+    if value is None or value != value:
+        return '\\N'
+    return repr(float(value))
+
+def save_results(db_cursor, file_id, tasks, results):
+    """Replace the CPM results of a snapshot using COPY"""
+    lines = []
+    columns = [results[key].tolist() for key in
+               ('early_start', 'early_finish', 'late_start', 'late_finish', 'total_float', 'free_float')]
+    driving = results['driving'].tolist()
+    in_cycle = results['in_cycle'].tolist()
+    for position, (task_id, task_code, _, _, _, total_float, free_float) in enumerate(tasks):
+        fields = [str(file_id), task_id.translate(COPY_ESCAPES),
+                  '\\N' if task_code is None else task_code.translate(COPY_ESCAPES)]
+        fields += [format_number(values[position]) for values in columns]
+        fields.append('\\N' if in_cycle[position] else ('Y' if driving[position] else 'N'))
+        fields.append('t' if in_cycle[position] else 'f')
+        fields += [format_number(total_float), format_number(free_float)]
+        lines.append('\t'.join(fields))
+
+    db_cursor.execute("DELETE FROM xer_cpm_results WHERE file_id = %s", (file_id,))
+    buffer = io.StringIO('\n'.join(lines) + '\n' if lines else '')
+    db_cursor.copy_expert(f"COPY xer_cpm_results ({', '.join(RESULT_COLUMNS)}) FROM STDIN", buffer)
+
+def run_cpm(file_id):
+    """
+    Recompute the schedule of one snapshot and store it in xer_cpm_results.
+    Returns a summary dictionary, or None if the snapshot has no network.
+    """
+    connection = get_connection()
+    schema_changes = {}
+    try:
+        db_cursor = connection.cursor()
+        network = load_network(db_cursor, file_id)
+        if network is None:
+            connection.rollback()
+            return None
+
+        if network['unknown_types']:
+            counts = ', '.join(f"{pred_type!r}: {count}" for pred_type, count in sorted(
+                network['unknown_types'].items(), key=lambda item: -item[1]))
+            print(f"[CPM] Warning: {sum(network['unknown_types'].values())} relationships of file_id {file_id} "
+                  f"have an unknown type and were not scheduled ({counts})")
+
+        started = time.perf_counter()
+        results = compute_cpm(
+            network['durations'], network['pred_index'], network['succ_index'],
+            network['pred_finish'], network['succ_finish'], network['lags']
+        )
+        seconds = time.perf_counter() - started
+
+        cycle_codes = [network['tasks'][i][1] or network['tasks'][i][0]
+                       for i in np.flatnonzero(results['in_cycle'])[:10]]
+        if cycle_codes:
+            print(f"[CPM] Warning: {int(results['in_cycle'].sum())} activities are in or behind a "
+                  f"relationship loop and were not scheduled, e.g. {', '.join(cycle_codes)}")
+
+        ensure_result_table(db_cursor, schema_changes)
+        save_results(db_cursor, file_id, network['tasks'], results)
+        connection.commit()
+        publish_schema_changes(schema_changes)
+        db_cursor.close()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        return_connection(connection)
+
+    summary = {
+        'activities': len(network['tasks']),
+        'relationships': len(network['lags']),
+        'external_relationships': network['external'],
+        'unknown_relationships': sum(network['unknown_types'].values()),
+        'project_finish_hr': results['project_finish'],
+        'driving_activities': int(results['driving'].sum()),
+        'cycle_activities': int(results['in_cycle'].sum()),
+        'seconds': round(seconds, 3)
+    }
+    log(f"[CPM] file_id {file_id}: {summary['activities']} activities, {summary['relationships']} "
+        f"relationships scheduled in {seconds:.2f}s, finish at {summary['project_finish_hr']:.1f}h, "
+        f"{summary['driving_activities']} on the driving path")
+    return summary
+
+def main():
+    """
+    Recompute CPM results for the given file_ids.
+    """
+    if len(sys.argv) < 2:
+        print("Usage: python xer_cpm.py <file_id> [...]")
+        return 1
+
+    for file_id in sys.argv[1:]:
+        run_cpm(int(file_id))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
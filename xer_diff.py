@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Snapshot-to-snapshot schedule diff for XER files.
+Compares a snapshot (file_id) with an earlier one (base_file_id), usually
+the previous snapshot of the same project, and stores what changed so the
+slip and variance dashboards read precomputed rows instead of joining two
+snapshots of the TEXT tables.
+
+Rows are matched on the P6 natural keys, which stay stable across exports:
+activities on task_code, relationships on their (predecessor task_code,
+successor task_code) pair and WBS nodes on wbs_id. Each table is compared in
+one linear pass: the base snapshot is streamed into a hash index of key ->
+compared values, then the new snapshot is streamed and probed against it;
+whatever is left in the index afterwards was removed. Both sides are read
+from server-side cursors (config.database.stream_query_batches), so only the
+index of one snapshot is held in memory.
+
+Every added or removed row and every changed field becomes one
+xer_schedule_diff row; numeric fields carry the difference and date fields
+the shift in hours (positive = later). An activity whose finish (actual,
+else early, else planned) moves also gets a 'finish' row, which is what the
+slip charts plot. xer_schedule_diff_summary holds one row of counts per
+pair of snapshots.
+
+Usage:
+    python xer_diff.py <file_id> [base_file_id]
+"""
+
+import io
+import sys
+import time
+from datetime import datetime
+
+from config.database import get_connection, return_connection, stream_query_batches
+from xer_schema import get_table_columns, note_schema_change, publish_schema_changes
+from xer_read_models import resolve_source_file_id, column_expr
+from xer_metrics import log
+
+# Compared columns per entity; missing columns read as NULL
+ACTIVITY_FIELDS = (
+    'task_name', 'wbs_id', 'status_code', 'task_type', 'target_start_date', 'target_end_date',
+    'act_start_date', 'act_end_date', 'early_start_date', 'early_end_date', 'total_float_hr_cnt'
+)
+DURATION_FIELDS = ('target_drtn_hr_cnt', 'remain_drtn_hr_cnt')
+RELATIONSHIP_FIELDS = ('pred_type', 'lag_hr_cnt')
+WBS_FIELDS = ('wbs_short_name', 'wbs_name', 'parent_wbs_id', 'status_code')
+
+# Fields whose difference is stored as a number (hours, for the _hr_cnt columns)
+NUMERIC_FIELDS = ('total_float_hr_cnt', 'target_drtn_hr_cnt', 'remain_drtn_hr_cnt', 'lag_hr_cnt')
+
+# An activity's finish is the first of these that is set
+FINISH_FIELDS = ('act_end_date', 'early_end_date', 'target_end_date')
+
+# Diff rows sent per COPY
+COPY_BATCH_ROWS = 10000
+
+# Characters that must be escaped in PostgreSQL COPY text format
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+DIFF_COLUMNS = (
+    'file_id', 'base_file_id', 'entity', 'change_type', 'entity_key', 'pred_task_code',
+    'field', 'old_value', 'new_value', 'delta'
+)
+
+SUMMARY_COLUMNS = (
+    'activities_added', 'activities_removed', 'activities_changed', 'durations_changed', 'finishes_slipped',
+    'finishes_improved', 'relationships_added', 'relationships_removed', 'relationships_changed',
+    'wbs_added', 'wbs_removed', 'wbs_changed'
+)
+
+def ensure_diff_tables(db_cursor, schema_changes=None):
+    """Create xer_schedule_diff and xer_schedule_diff_summary unless the schema catalog already knows them"""
+    if get_table_columns(db_cursor, 'xer_schedule_diff', schema_changes) is None:
+        db_cursor.execute("""
+            CREATE TABLE IF NOT EXISTS xer_schedule_diff (
+                file_id INTEGER NOT NULL,
+                base_file_id INTEGER NOT NULL,
+                entity TEXT NOT NULL,
+                change_type TEXT NOT NULL,
+                entity_key TEXT NOT NULL,
+                pred_task_code TEXT,
+                field TEXT,
+                old_value TEXT,
+                new_value TEXT,
+                delta DOUBLE PRECISION
+            )
+        """)
+        db_cursor.execute("""
+            CREATE INDEX IF NOT EXISTS xer_schedule_diff_file_idx
+            ON xer_schedule_diff (file_id, base_file_id, entity, change_type)
+        """)
+        note_schema_change(db_cursor, 'xer_schedule_diff', schema_changes)
+
+    if get_table_columns(db_cursor, 'xer_schedule_diff_summary', schema_changes) is None:
+        counters = ',\n                '.join(f'{column} INTEGER NOT NULL DEFAULT 0' for column in SUMMARY_COLUMNS)
+        db_cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS xer_schedule_diff_summary (
+                file_id INTEGER NOT NULL,
+                base_file_id INTEGER NOT NULL,
+                computed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                {counters},
+                PRIMARY KEY (file_id, base_file_id)
+            )
+        """)
+        note_schema_change(db_cursor, 'xer_schedule_diff_summary', schema_changes)
+
+def find_previous_published_snapshot(db_cursor, file_id):
+    """Return the latest published snapshot of the same project before file_id, or None"""
+    db_cursor.execute("""
+        SELECT MAX(previous.file_id)
+        FROM file_metadata current
+        JOIN file_metadata previous ON previous.project_name = current.project_name
+        WHERE current.file_id = %s AND previous.file_id < current.file_id AND previous.published
+    """, (file_id,))
+    row = db_cursor.fetchone()
+    return row[0] if row else None
+
+def to_number(value):
+    """Parse an XER number, returning None for empty or malformed values"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+def to_datetime(value):
+    """Parse an XER date ('2025-01-06 08:00', or a TIMESTAMP read as text), or None"""
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+
+def field_delta(field, old_value, new_value):
+    """Return the numeric difference of a changed field (hours for dates), or None"""
+    if field in NUMERIC_FIELDS:
+        old_number, new_number = to_number(old_value), to_number(new_value)
+        if old_number is not None and new_number is not None:
+            return new_number - old_number
+        return None
+    if field.endswith('_date') or field == 'finish':
+        old_date, new_date = to_datetime(old_value), to_datetime(new_value)
+        if old_date is not None and new_date is not None:
+            return (new_date - old_date).total_seconds() / 3600
+    return None
+
+def finish_of(values, positions):
+    """Return an activity's finish: the first of FINISH_FIELDS that is set"""
+    for field in FINISH_FIELDS:
+        value = values[positions[field]]
+        if value is not None:
+            return value
+    return None
+
+class DiffWriter:
+    """
+    Collect diff rows and COPY them into xer_schedule_diff every
+    COPY_BATCH_ROWS rows, so a large diff never sits in memory.
+    """
+
+    def __init__(self, db_cursor, file_id, base_file_id):
+        self.db_cursor = db_cursor
+        self.prefix = f'{file_id}\t{base_file_id}\t'
+        self.lines = []
+        self.rows = 0
+
+    def add(self, entity, change_type, entity_key, pred_task_code=None, field=None,
+            old_value=None, new_value=None, delta=None):
+        """Queue one diff row, sending the queue once it is full"""
+        fields = [
+            entity, change_type, entity_key.translate(COPY_ESCAPES),
+            '\\N' if pred_task_code is None else pred_task_code.translate(COPY_ESCAPES),
+            '\\N' if field is None else field,
+            '\\N' if old_value is None else old_value.translate(COPY_ESCAPES),
+            '\\N' if new_value is None else new_value.translate(COPY_ESCAPES),
+            '\\N' if delta is None else repr(float(delta))
+        ]
+        self.lines.append(self.prefix + '\t'.join(fields))
+        if len(self.lines) >= COPY_BATCH_ROWS:
+            self.flush()
+
+    def flush(self):
+        """COPY the queued rows"""
+        if not self.lines:
+            return
+        buffer = io.StringIO('\n'.join(self.lines) + '\n')
+        self.db_cursor.copy_expert(f"COPY xer_schedule_diff ({', '.join(DIFF_COLUMNS)}) FROM STDIN", buffer)
+        self.rows += len(self.lines)
+        self.lines = []
+
+def stream_table(table_name, table_columns, source_file_id, key_columns, fields):
+    """
+    Yield batches of (key values..., field values...) tuples, as TEXT, of
+    one snapshot of a table, read from a server-side cursor.
+    """
+    select_list = ', '.join(column_expr('t', table_columns, column) for column in (*key_columns, *fields))
+    yield from stream_query_batches(
+        f'SELECT {select_list} FROM "{table_name}" t WHERE t.file_id = %s', (source_file_id,)
+    )
+
+def build_index(rows, counts):
+    """
+    Return the hash index {(key, pred_task_code): values} of the base
+    snapshot's (key, pred_task_code, values) rows. Like compare_rows, the
+    first row of a duplicated key is kept and the others are counted.
+    """
+    index = {}
+    for key, pred_task_code, values in rows:
+        index_key = (key, pred_task_code)
+        if index_key in index:
+            counts['duplicates'] += 1
+            continue
+        index[index_key] = values
+    return index
+
+def compare_rows(writer, entity, fields, old_index, new_rows, counts, on_changed=None):
+    """
+    Probe the new snapshot's rows, (key, pred_task_code, values) triples,
+    against old_index ({(key, pred_task_code): values}) in one pass and
+    write added/changed rows. Matched keys are removed from old_index, so
+    what is left afterwards was removed. on_changed(key, old, new) is called
+    for every matched row whose values differ.
+    """
+    seen = set()
+    for key, pred_task_code, values in new_rows:
+        index_key = (key, pred_task_code)
+        if index_key in seen:
+            counts['duplicates'] += 1
+            continue
+        seen.add(index_key)
+        old_values = old_index.pop(index_key, None)
+        if old_values is None:
+            counts['added'] += 1
+            writer.add(entity, 'added', key, pred_task_code)
+            continue
+        if old_values == values:
+            continue
+        counts['changed'] += 1
+        for position, field in enumerate(fields):
+            if old_values[position] != values[position]:
+                writer.add(
+                    entity, 'changed', key, pred_task_code, field, old_values[position], values[position],
+                    field_delta(field, old_values[position], values[position])
+                )
+        if on_changed is not None:
+            on_changed(key, old_values, values)
+
+def write_removed(writer, entity, old_index, counts):
+    """Write a 'removed' row for every key left in old_index"""
+    for key, pred_task_code in old_index:
+        counts['removed'] += 1
+        writer.add(entity, 'removed', key, pred_task_code)
+
+def new_counts():
+    """Return zeroed added/removed/changed/duplicates counters"""
+    return {'added': 0, 'removed': 0, 'changed': 0, 'duplicates': 0}
+
+def diff_activities(writer, task_columns, file_ids, summary):
+    """
+    Diff TASK on task_code. Returns the task_id -> task_code maps of the
+    base and new snapshots, which the relationship diff needs.
+    """
+    fields = ACTIVITY_FIELDS + DURATION_FIELDS
+    positions = {field: position for position, field in enumerate(fields)}
+    counts = new_counts()
+    finish_moves = {'slipped': 0, 'improved': 0, 'durations': 0}
+
+    def rows_of(source_file_id, code_map):
+        for rows in stream_table('TASK', task_columns, source_file_id, ['task_id', 'task_code'], fields):
+            for row in rows:
+                task_id, task_code = row[0], row[1]
+                key = task_code if task_code is not None else f'#{task_id}'
+                if task_id is not None:
+                    code_map[task_id] = key
+                yield key, None, row[2:]
+
+    def on_changed(key, old_values, values):
+        if any(old_values[positions[field]] != values[positions[field]] for field in DURATION_FIELDS):
+            finish_moves['durations'] += 1
+        old_finish, new_finish = finish_of(old_values, positions), finish_of(values, positions)
+        if old_finish != new_finish:
+            delta = field_delta('finish', old_finish, new_finish)
+            writer.add('activity', 'changed', key, None, 'finish', old_finish, new_finish, delta)
+            if delta is not None and delta > 0:
+                finish_moves['slipped'] += 1
+            elif delta is not None and delta < 0:
+                finish_moves['improved'] += 1
+
+    base_map, new_map = {}, {}
+    old_index = build_index(rows_of(file_ids['base'], base_map), counts)
+    compare_rows(writer, 'activity', fields, old_index, rows_of(file_ids['new'], new_map), counts, on_changed)
+    write_removed(writer, 'activity', old_index, counts)
+
+    summary.update(
+        activities_added=counts['added'], activities_removed=counts['removed'],
+        activities_changed=counts['changed'], durations_changed=finish_moves['durations'],
+        finishes_slipped=finish_moves['slipped'], finishes_improved=finish_moves['improved']
+    )
+    if counts['duplicates']:
+        print(f"[Diff] Warning: {counts['duplicates']} activities share a task_code with another "
+              f"activity of the same snapshot; only the first of each was compared")
+    return base_map, new_map
+
+def diff_relationships(writer, pred_columns, file_ids, code_maps, summary):
+    """Diff TASKPRED on (predecessor task_code, successor task_code)"""
+    counts = new_counts()
+    external = 0
+
+    def rows_of(source_file_id, code_map):
+        nonlocal external
+        for rows in stream_table('TASKPRED', pred_columns, source_file_id, ['task_id', 'pred_task_id'],
+                                 RELATIONSHIP_FIELDS):
+            for row in rows:
+                succ_code, pred_code = code_map.get(row[0]), code_map.get(row[1])
+                if succ_code is None or pred_code is None:
+                    # Relationship to an activity of another project that is not in this file
+                    external += 1
+                    continue
+                yield succ_code, pred_code, row[2:]
+
+    old_index = build_index(rows_of(file_ids['base'], code_maps[0]), counts)
+    compare_rows(writer, 'relationship', RELATIONSHIP_FIELDS, old_index,
+                 rows_of(file_ids['new'], code_maps[1]), counts)
+    write_removed(writer, 'relationship', old_index, counts)
+
+    summary.update(
+        relationships_added=counts['added'], relationships_removed=counts['removed'],
+        relationships_changed=counts['changed']
+    )
+    if external:
+        log(f"[Diff] Skipped {external} relationships to activities outside the snapshots")
+
+def diff_wbs(writer, wbs_columns, file_ids, summary):
+    """Diff PROJWBS on wbs_id"""
+    counts = new_counts()
+
+    def rows_of(source_file_id):
+        for rows in stream_table('PROJWBS', wbs_columns, source_file_id, ['wbs_id'], WBS_FIELDS):
+            for row in rows:
+                if row[0] is not None:
+                    yield row[0], None, row[1:]
+
+    old_index = build_index(rows_of(file_ids['base']), counts)
+    compare_rows(writer, 'wbs', WBS_FIELDS, old_index, rows_of(file_ids['new']), counts)
+    write_removed(writer, 'wbs', old_index, counts)
+
+    summary.update(wbs_added=counts['added'], wbs_removed=counts['removed'], wbs_changed=counts['changed'])
+
+def resolve_pair(db_cursor, file_id, base_file_id, table_name):
+    """
+    Return {'base': ..., 'new': ...} source file_ids of a table for both
+    snapshots.
+    """
+    return {
+        'base': resolve_source_file_id(db_cursor, base_file_id, table_name),
+        'new': resolve_source_file_id(db_cursor, file_id, table_name)
+    }
+
+def run_snapshot_diff(file_id, base_file_id=None):
+    """
+    Diff a snapshot against base_file_id (default: the previous published
+    snapshot of the same project) and store the result, replacing an earlier
+    diff of the same pair. Returns the summary counts, or None if there is
+    nothing to compare with.
+    """
+    connection = get_connection()
+    schema_changes = {}
+    started = time.perf_counter()
+    try:
+        db_cursor = connection.cursor()
+        if base_file_id is None:
+            base_file_id = find_previous_published_snapshot(db_cursor, file_id)
+            if base_file_id is None:
+                log(f"[Diff] file_id {file_id} has no earlier published snapshot to compare with")
+                connection.rollback()
+                return None
+
+        task_columns = get_table_columns(db_cursor, 'TASK') or {}
+        pred_columns = get_table_columns(db_cursor, 'TASKPRED') or {}
+        wbs_columns = get_table_columns(db_cursor, 'PROJWBS') or {}
+
+        ensure_diff_tables(db_cursor, schema_changes)
+        db_cursor.execute(
+            "DELETE FROM xer_schedule_diff WHERE file_id = %s AND base_file_id = %s", (file_id, base_file_id)
+        )
+        writer = DiffWriter(db_cursor, file_id, base_file_id)
+        summary = dict.fromkeys(SUMMARY_COLUMNS, 0)
+
+        task_ids = resolve_pair(db_cursor, file_id, base_file_id, 'TASK') if 'task_id' in task_columns else None
+        if task_ids is not None:
+            code_maps = diff_activities(writer, task_columns, task_ids, summary)
+            pred_ids = None
+            if {'task_id', 'pred_task_id'} <= set(pred_columns):
+                pred_ids = resolve_pair(db_cursor, file_id, base_file_id, 'TASKPRED')
+            if pred_ids is not None:
+                diff_relationships(writer, pred_columns, pred_ids, code_maps, summary)
+            del code_maps
+
+        wbs_ids = resolve_pair(db_cursor, file_id, base_file_id, 'PROJWBS') if 'wbs_id' in wbs_columns else None
+        if wbs_ids is not None:
+            diff_wbs(writer, wbs_columns, wbs_ids, summary)
+
+        writer.flush()
+        columns = ', '.join(SUMMARY_COLUMNS)
+        db_cursor.execute(f"""
+            INSERT INTO xer_schedule_diff_summary (file_id, base_file_id, computed_at, {columns})
+            VALUES (%s, %s, CURRENT_TIMESTAMP, {', '.join(['%s'] * len(SUMMARY_COLUMNS))})
+            ON CONFLICT (file_id, base_file_id) DO UPDATE SET
+                computed_at = EXCLUDED.computed_at,
+                {', '.join(f'{column} = EXCLUDED.{column}' for column in SUMMARY_COLUMNS)}
+        """, [file_id, base_file_id] + [summary[column] for column in SUMMARY_COLUMNS])
+        connection.commit()
+        publish_schema_changes(schema_changes)
+        db_cursor.close()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        return_connection(connection)
+
+    seconds = time.perf_counter() - started
+    summary.update(file_id=file_id, base_file_id=base_file_id, rows=writer.rows, seconds=round(seconds, 3))
+    log(f"[Diff] file_id {file_id} vs {base_file_id}: {summary['activities_added']} activities added, "
+        f"{summary['activities_removed']} removed, {summary['activities_changed']} changed "
+        f"({summary['finishes_slipped']} finishes slipped), {summary['relationships_added']} relationships "
+        f"added, {summary['relationships_removed']} removed; {writer.rows} diff rows in {seconds:.2f}s")
+    return summary
+
+def main():
+    """
+    Diff a snapshot against the given base, or against the previous snapshot of its project.
+    """
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python xer_diff.py <file_id> [base_file_id]")
+        return 1
+
+    file_id = int(sys.argv[1])
+    base_file_id = int(sys.argv[2]) if len(sys.argv) == 3 else None
+    summary = run_snapshot_diff(file_id, base_file_id)
+    if summary is None:
+        print(f"[Diff] Nothing to compare file_id {file_id} with")
+        return 1
+    print(f"[Diff] {summary}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""
+Incremental snapshot ingestion for XER files.
+Weekly schedule updates mostly repeat the previous snapshot, so tables are
+hashed before loading: a table that is byte-identical to the previous
+published snapshot of the same project is recorded as a reference to it
+instead of being stored again; every other table is stored in full.
+
+xer_table_snapshots.base_file_id points a referenced table at the snapshot
+it repeats, so its rows are found by following that chain back to a
+snapshot stored in 'full' mode (see xer_read_models.resolve_source_file_id).
+Tables therefore always read back whole, and the views, read models, CPM,
+diff and exports need nothing beyond that lookup.
+"""
+
+import hashlib
+
+from xer_schema import get_table_columns, note_schema_change
+from xer_metrics import log
+
+FIELD_SEPARATOR = '\x1f'
+ROW_SEPARATOR = '\x1e'
+
+SNAPSHOT_TABLES = ('xer_table_snapshots',)
+
+def ensure_snapshot_tables(db_cursor, schema_changes=None):
+    """
+    Create the companion tables that describe how each snapshot table is stored.
+    Skipped entirely when the schema catalog already knows all of them.
+    """
+    if all(get_table_columns(db_cursor, table, schema_changes) is not None for table in SNAPSHOT_TABLES):
+        return
+
+    db_cursor.execute("""
+        CREATE TABLE IF NOT EXISTS xer_table_snapshots (
+            file_id INTEGER NOT NULL,
+            table_name TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            storage_mode TEXT NOT NULL CHECK (storage_mode IN ('full', 'reference')),
+            base_file_id INTEGER,
+            inserted_rows INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (file_id, table_name)
+        )
+    """)
+    for table in SNAPSHOT_TABLES:
+        note_schema_change(db_cursor, table, schema_changes)
+
+def row_text(record):
+    """Serialize a record tuple for hashing"""
+    return FIELD_SEPARATOR.join(['' if value is None else value for value in record])
+
+def compute_table_hashes(batches):
+    """
+    Hash every table of a batch stream.
+    Returns {table_name: {'hash': ..., 'rows': ...}}; the hash covers the
+    column header and all rows in file order.
+    """
+    hashers = {}
+    row_counts = {}
+    for table_name, columns, records in batches:
+        hasher = hashers.get(table_name)
+        if hasher is None:
+            hasher = hashers[table_name] = hashlib.blake2b(digest_size=32)
+            hasher.update(FIELD_SEPARATOR.join(columns).encode('utf-8'))
+            row_counts[table_name] = 0
+        hasher.update(ROW_SEPARATOR.join([row_text(record) for record in records]).encode('utf-8'))
+        hasher.update(ROW_SEPARATOR.encode('utf-8'))
+        row_counts[table_name] += len(records)
+
+    return {
+        table_name: {'hash': hasher.hexdigest(), 'rows': row_counts[table_name]}
+        for table_name, hasher in hashers.items()
+    }
+
+def find_previous_snapshot(db_cursor, project_name, file_id):
+    """
+    Return the file_id of the latest earlier published snapshot of the same
+    project that has table hashes recorded, or None. Unpublished snapshots
+    may still be loading or may have been abandoned, so they are never
+    referenced.
+    """
+    db_cursor.execute("""
+        SELECT MAX(fm.file_id)
+        FROM file_metadata fm
+        WHERE fm.project_name = %s
+          AND fm.file_id < %s
+          AND fm.published
+          AND EXISTS (SELECT 1 FROM xer_table_snapshots ts WHERE ts.file_id = fm.file_id)
+    """, (project_name, file_id))
+    return db_cursor.fetchone()[0]
+
+def get_snapshot_hashes(db_cursor, file_id):
+    """Return {table_name: content_hash} recorded for a snapshot"""
+    db_cursor.execute(
+        "SELECT table_name, content_hash FROM xer_table_snapshots WHERE file_id = %s",
+        (file_id,)
+    )
+    return dict(db_cursor.fetchall())
+
+def save_table_snapshot(db_cursor, file_id, table_name, table_hash, mode, base_file_id, inserted):
+    """Record how one table of a snapshot is stored"""
+    db_cursor.execute("""
+        INSERT INTO xer_table_snapshots
+            (file_id, table_name, content_hash, row_count, storage_mode, base_file_id, inserted_rows)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, (file_id, table_name, table_hash['hash'], table_hash['rows'], mode, base_file_id, inserted))
+
+def filter_incremental_batches(db_cursor, batches, file_id, table_hashes, previous_file_id, summary=None):
+    """
+    Yield only the tables of a batch stream that need to be stored.
+    Tables whose hash matches the previous snapshot are skipped and recorded as
+    references; all other tables are passed through in full. Bookkeeping rows
+    are written on db_cursor once the stream ends, so they commit in the same
+    transaction as the data. Per-table outcomes are collected in `summary` if
+    a dictionary is given.
+    """
+    previous_hashes = get_snapshot_hashes(db_cursor, previous_file_id) if previous_file_id else {}
+    summary = summary if summary is not None else {}
+    tables = {}
+
+    for table_name, columns, records in batches:
+        state = tables.get(table_name)
+        if state is None:
+            if previous_hashes.get(table_name) == table_hashes[table_name]['hash']:
+                mode = 'reference'
+                log(f"[Incremental] {table_name} unchanged, referencing file_id {previous_file_id}")
+            else:
+                mode = 'full'
+            state = tables[table_name] = {'mode': mode, 'inserted': 0}
+
+        if state['mode'] == 'reference':
+            continue
+
+        state['inserted'] += len(records)
+        yield table_name, columns, records
+
+    for table_name, state in tables.items():
+        base_file_id = previous_file_id if state['mode'] == 'reference' else None
+        save_table_snapshot(
+            db_cursor, file_id, table_name, table_hashes[table_name], state['mode'],
+            base_file_id, state['inserted']
+        )
+        summary[table_name] = {
+            'mode': state['mode'],
+            'base_file_id': base_file_id,
+            'inserted': state['inserted']
+        }
+        log(f"[Incremental] {table_name}: {state['mode']}, {state['inserted']} rows stored")
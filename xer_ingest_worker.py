@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Long-running XER ingestion worker.
+Keeps one warm PostgreSQL connection pool and accepts ingestion jobs over a
+Unix-domain socket, so uploads no longer pay for interpreter startup and pool
+creation on every file.
+
+The socket is created with 0600 permissions, so only the worker's own user
+(the one the Node server runs as) can submit jobs. Submitted paths must
+resolve to a file inside the uploads directory; anything else is rejected
+before it is read or deleted.
+
+Protocol: one JSON object per line in each direction.
+    {"action": "submit", "path": "...", "filename": "...", "cleanup": true, "wait": false}
+    {"action": "status", "job_id": "..."}
+    {"action": "wait", "job_id": "..."}
+    {"action": "ping"}
+"submit" replies with the queued job; "wait" (or "submit" with "wait": true)
+keeps the connection open and sends a job snapshot on every progress update
+until the job is finished.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import argparse
+import threading
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+
+from config.database import POOL_MAX_CONNECTIONS
+from parse_xer_content import DEFAULT_LOAD_PARALLELISM, ingest_xer_archive, connections_per_file
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+WORKER_SOCKET = os.getenv('XER_WORKER_SOCKET', os.path.join(BASE_DIR, 'xer_worker.sock'))
+WORKER_CONCURRENCY = int(os.getenv('XER_WORKER_CONCURRENCY', '4'))
+
+# Only files in this directory (where server.js stores uploads) are ingested
+UPLOAD_DIR = os.getenv('XER_UPLOAD_DIR', os.path.join(BASE_DIR, 'uploads'))
+
+# Finished jobs are kept this long for status queries
+JOB_RETENTION_SECONDS = int(os.getenv('XER_JOB_RETENTION_SECONDS', '3600'))
+
+FINISHED_STATUSES = ('succeeded', 'failed')
+
+jobs = {}
+jobs_changed = threading.Condition()
+executor = None
+
+def job_snapshot(job):
+    """Return a JSON-serializable copy of a job"""
+    return {key: value for key, value in job.items() if not key.startswith('_')}
+
+def update_job(job_id, **changes):
+    """Apply changes to a job and wake up anyone waiting on it"""
+    with jobs_changed:
+        job = jobs[job_id]
+        job.update(changes)
+        job['_version'] += 1
+        jobs_changed.notify_all()
+
+def prune_jobs():
+    """Forget finished jobs older than JOB_RETENTION_SECONDS"""
+    cutoff = time.time() - JOB_RETENTION_SECONDS
+    with jobs_changed:
+        expired = [
+            job_id for job_id, job in jobs.items()
+            if job['status'] in FINISHED_STATUSES and job['finished_at'] < cutoff
+        ]
+        for job_id in expired:
+            del jobs[job_id]
+
+def run_job(job_id):
+    """Ingest the XER files of a queued job and record its outcome"""
+    with jobs_changed:
+        job = dict(jobs[job_id])
+
+    update_job(job_id, status='running', started_at=time.time())
+
+    def report_progress(table_name, table_rows, total_rows):
+        with jobs_changed:
+            tables_done = jobs[job_id]['tables']
+        tables_done = dict(tables_done, **{table_name: table_rows})
+        update_job(job_id, current_table=table_name, rows_loaded=total_rows, tables=tables_done)
+
+    try:
+        results = ingest_xer_archive(job['path'], job['filename'], progress=report_progress)
+        tables = {}
+        for result in results:
+            for name, stats in result['tables'].items():
+                tables[name] = tables.get(name, 0) + stats['rows']
+        update_job(
+            job_id,
+            status='succeeded',
+            file_id=results[-1]['file_id'],
+            file_ids=[result['file_id'] for result in results],
+            files=[
+                {'filename': result['metrics']['filename'], 'file_id': result['file_id'], 'metrics': result['metrics']}
+                for result in results
+            ],
+            tables=tables,
+            rows_loaded=sum(tables.values()),
+            rejected_rows=sum(stats['rejected'] for result in results for stats in result['tables'].values()),
+            metrics=results[-1]['metrics'],
+            current_table=None,
+            finished_at=time.time()
+        )
+    except Exception as e:
+        print(f"[Worker] Job {job_id} failed: {str(e)}")
+        update_job(job_id, status='failed', error=str(e), finished_at=time.time())
+    finally:
+        if job['cleanup']:
+            try:
+                os.unlink(job['path'])
+            except OSError as e:
+                print(f"[Worker] Warning: Could not delete temporary file: {str(e)}")
+
+def resolve_upload_path(path):
+    """
+    Return the real path of an uploaded file, following symlinks.
+    Raises PermissionError unless it is inside UPLOAD_DIR.
+    """
+    if not path:
+        raise FileNotFoundError("XER file not found: no path given")
+    upload_dir = os.path.realpath(UPLOAD_DIR)
+    resolved = os.path.realpath(path)
+    if os.path.commonpath([resolved, upload_dir]) != upload_dir:
+        raise PermissionError(f"XER file is not in the uploads directory: {path}")
+    if not os.path.isfile(resolved):
+        raise FileNotFoundError(f"XER file not found: {path}")
+    return resolved
+
+def submit_job(path, filename=None, cleanup=False):
+    """Queue an uploaded XER file for ingestion and return the new job"""
+    path = resolve_upload_path(path)
+
+    prune_jobs()
+    job_id = uuid.uuid4().hex
+    job = {
+        'job_id': job_id,
+        'path': path,
+        'filename': filename or os.path.basename(path),
+        'cleanup': bool(cleanup),
+        'status': 'queued',
+        'file_id': None,
+        'file_ids': [],
+        'files': [],
+        'current_table': None,
+        'rows_loaded': 0,
+        'rejected_rows': 0,
+        'tables': {},
+        'metrics': None,
+        'error': None,
+        'submitted_at': time.time(),
+        'started_at': None,
+        'finished_at': None,
+        '_version': 0
+    }
+    with jobs_changed:
+        jobs[job_id] = job
+        snapshot = job_snapshot(job)
+
+    executor.submit(run_job, job_id)
+    print(f"[Worker] Queued job {job_id} for {job['filename']}")
+    return snapshot
+
+def get_job(job_id):
+    """Return a snapshot of a job, or None if it is unknown"""
+    with jobs_changed:
+        job = jobs.get(job_id)
+        return job_snapshot(job) if job else None
+
+def watch_job(job_id, timeout=30):
+    """
+    Yield job snapshots whenever the job changes, ending with its final state.
+    A snapshot is also yielded every `timeout` seconds as a keep-alive.
+    """
+    seen_version = -1
+    while True:
+        with jobs_changed:
+            job = jobs.get(job_id)
+            if job is None:
+                return
+            if job['_version'] == seen_version and job['status'] not in FINISHED_STATUSES:
+                jobs_changed.wait(timeout)
+                job = jobs.get(job_id)
+                if job is None:
+                    return
+            seen_version = job['_version']
+            snapshot = job_snapshot(job)
+
+        yield snapshot
+        if snapshot['status'] in FINISHED_STATUSES:
+            return
+
+class XerJobHandler(socketserver.StreamRequestHandler):
+    """Serve newline-delimited JSON requests from one client connection"""
+
+    def send(self, message):
+        self.wfile.write((json.dumps(message, default=str) + '\n').encode('utf-8'))
+        self.wfile.flush()
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                action = request.get('action')
+
+                if action == 'ping':
+                    self.send({'ok': True, 'concurrency': WORKER_CONCURRENCY, 'jobs': len(jobs)})
+                elif action == 'submit':
+                    job = submit_job(request.get('path'), request.get('filename'), request.get('cleanup', False))
+                    if request.get('wait'):
+                        for snapshot in watch_job(job['job_id']):
+                            self.send(snapshot)
+                    else:
+                        self.send(job)
+                elif action == 'status':
+                    job = get_job(request.get('job_id'))
+                    self.send(job if job else {'error': f"Unknown job: {request.get('job_id')}"})
+                elif action == 'wait':
+                    if get_job(request.get('job_id')) is None:
+                        self.send({'error': f"Unknown job: {request.get('job_id')}"})
+                    for snapshot in watch_job(request.get('job_id')):
+                        self.send(snapshot)
+                else:
+                    self.send({'error': f"Unknown action: {action}"})
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            except Exception as e:
+                self.send({'error': str(e)})
+
+class XerWorkerServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # Create the socket file unreadable by other users from the start
+        previous_umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(previous_umask)
+        os.chmod(self.server_address, 0o600)
+
+def remove_stale_socket(path):
+    """
+    Delete a socket file left behind by a worker that is no longer running.
+    Raises RuntimeError if another worker is still listening on it.
+    """
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"Another XER worker is already listening on {path}")
+
+def main():
+    """
+    Start the ingestion worker and serve until interrupted.
+    """
+    global executor, WORKER_CONCURRENCY
+
+    parser = argparse.ArgumentParser(description='Long-running XER ingestion worker')
+    parser.add_argument('--socket', default=WORKER_SOCKET, help='Path of the Unix-domain socket to listen on')
+    parser.add_argument('--concurrency', type=int, default=WORKER_CONCURRENCY,
+                        help='Maximum number of uploads ingested at the same time')
+    args = parser.parse_args()
+
+    WORKER_CONCURRENCY = max(1, args.concurrency)
+    # Each job holds its loaders plus FILE_CONNECTION_OVERHEAD connections at once
+    per_job = connections_per_file(DEFAULT_LOAD_PARALLELISM)
+    fitting = max(1, POOL_MAX_CONNECTIONS // per_job)
+    if WORKER_CONCURRENCY > fitting:
+        print(f"[Worker] Warning: {WORKER_CONCURRENCY} jobs x {per_job} connections exceed "
+              f"POSTGRES_MAX_CONNECTIONS ({POOL_MAX_CONNECTIONS}); running {fitting} jobs at a time")
+        WORKER_CONCURRENCY = fitting
+    executor = ThreadPoolExecutor(max_workers=WORKER_CONCURRENCY, thread_name_prefix='xer-job')
+
+    remove_stale_socket(args.socket)
+    with XerWorkerServer(args.socket, XerJobHandler) as server:
+        print(f"[Worker] Listening on {args.socket} with concurrency {WORKER_CONCURRENCY}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("[Worker] Shutting down")
+        finally:
+            executor.shutdown(wait=True)
+            os.unlink(args.socket)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
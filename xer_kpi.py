@@ -0,0 +1,182 @@
+"""
+Relationship KPI summaries for XER snapshots.
+The schedule dashboards count leads, lags and relationship types over the
+remaining (not fully completed) relationships of a project, and bucket
+activities by total float. Those numbers are computed here in one pass over
+the parsed TASK/TASKPRED batches while the file is ingested, and stored as
+one xer_kpi_summary row per project and file_id, so the KPI endpoints and
+trend charts read a handful of rows instead of scanning every relationship.
+"""
+
+from psycopg2.extras import execute_values
+
+from xer_schema import get_table_columns, note_schema_change
+from xer_types import TIMESTAMP, values_conform
+from xer_metrics import log
+
+# Same working day and thresholds as the Float Analysis chart (public/js/modules/floatAnalysis.js)
+HOURS_PER_DAY = 8
+NEAR_CRITICAL_DAYS = 15
+MODERATE_FLOAT_DAYS = 39
+
+RELATIONSHIP_TYPE_COLUMNS = {
+    'PR_FS': 'remaining_fs',
+    'PR_SS': 'remaining_ss',
+    'PR_FF': 'remaining_ff',
+    'PR_SF': 'remaining_sf',
+}
+
+KPI_COLUMNS = (
+    'activities', 'remaining_activities', 'total_relationships', 'remaining_relationships',
+    'leads', 'lags', 'remaining_fs', 'remaining_ss', 'remaining_ff', 'remaining_sf',
+    'float_negative', 'float_critical', 'float_near_critical', 'float_moderate', 'float_excessive'
+)
+
+def ensure_kpi_table(db_cursor, schema_changes=None):
+    """Create xer_kpi_summary unless the schema catalog already knows it"""
+    if get_table_columns(db_cursor, 'xer_kpi_summary', schema_changes) is not None:
+        return
+    counters = ',\n            '.join(f'{column} INTEGER NOT NULL DEFAULT 0' for column in KPI_COLUMNS)
+    db_cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS xer_kpi_summary (
+            file_id INTEGER NOT NULL,
+            project_id TEXT NOT NULL,
+            data_date TIMESTAMP,
+            {counters},
+            PRIMARY KEY (file_id, project_id)
+        )
+    """)
+    db_cursor.execute("""
+        CREATE INDEX IF NOT EXISTS xer_kpi_summary_project_idx
+        ON xer_kpi_summary (project_id, file_id)
+    """)
+    note_schema_change(db_cursor, 'xer_kpi_summary', schema_changes)
+
+def to_float(value):
+    """Parse an XER number, returning None for empty or malformed values"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+def float_bucket(total_float):
+    """Return the KPI column of an activity's total float (hours); missing float counts as zero"""
+    days = (total_float or 0.0) / HOURS_PER_DAY
+    if days < 0:
+        return 'float_negative'
+    if days == 0:
+        return 'float_critical'
+    if days <= NEAR_CRITICAL_DAYS:
+        return 'float_near_critical'
+    if days <= MODERATE_FLOAT_DAYS:
+        return 'float_moderate'
+    return 'float_excessive'
+
+def column_positions(columns, names):
+    """Return {name: tuple position} for the names present in a batch header"""
+    lowered = [col.lower() for col in columns]
+    return {name: lowered.index(name) for name in names if name in lowered}
+
+def collect_relationship_kpis(db_cursor, batches, file_id, summary=None, schema_changes=None):
+    """
+    Pass a batch stream through unchanged while computing its KPIs.
+    A relationship belongs to the project of its successor activity and is
+    only counted when both activities are in the file, like the inner joins
+    of activity_relationship_view; it is remaining unless both activities
+    are complete. The KPI rows are written on db_cursor once the stream ends,
+    so they commit in the same transaction as the data. Per-project KPIs are
+    collected in `summary` if a dictionary is given.
+    """
+    summary = summary if summary is not None else {}
+    tasks = {}
+    data_dates = {}
+    pending = []
+
+    def project_kpis(project_id):
+        kpis = summary.get(project_id)
+        if kpis is None:
+            kpis = summary[project_id] = dict.fromkeys(KPI_COLUMNS, 0)
+        return kpis
+
+    def count_relationship(succ_id, pred_id, pred_type, lag):
+        succ = tasks.get(succ_id)
+        pred = tasks.get(pred_id)
+        if succ is None or pred is None:
+            return False
+        kpis = project_kpis(succ[0])
+        kpis['total_relationships'] += 1
+        if succ[1] and pred[1]:
+            return True
+        kpis['remaining_relationships'] += 1
+        lag = to_float(lag)
+        if lag is not None and lag < 0:
+            kpis['leads'] += 1
+        elif lag is not None and lag > 0:
+            kpis['lags'] += 1
+        type_column = RELATIONSHIP_TYPE_COLUMNS.get(pred_type)
+        if type_column:
+            kpis[type_column] += 1
+        return True
+
+    for table_name, columns, records in batches:
+        if table_name == 'TASK':
+            positions = column_positions(columns, ('task_id', 'proj_id', 'status_code', 'total_float_hr_cnt'))
+            if 'task_id' in positions and 'proj_id' in positions:
+                id_pos, proj_pos = positions['task_id'], positions['proj_id']
+                status_pos = positions.get('status_code')
+                float_pos = positions.get('total_float_hr_cnt')
+                for record in records:
+                    if record[id_pos] is None or record[proj_pos] is None:
+                        continue
+                    complete = status_pos is not None and record[status_pos] == 'TK_Complete'
+                    tasks[record[id_pos]] = (record[proj_pos], complete)
+                    kpis = project_kpis(record[proj_pos])
+                    kpis['activities'] += 1
+                    if not complete:
+                        kpis['remaining_activities'] += 1
+                    kpis[float_bucket(to_float(record[float_pos]) if float_pos is not None else None)] += 1
+        elif table_name == 'TASKPRED':
+            positions = column_positions(columns, ('task_id', 'pred_task_id', 'pred_type', 'lag_hr_cnt'))
+            if 'task_id' in positions and 'pred_task_id' in positions:
+                succ_pos, pred_pos = positions['task_id'], positions['pred_task_id']
+                type_pos = positions.get('pred_type')
+                lag_pos = positions.get('lag_hr_cnt')
+                for record in records:
+                    relationship = (
+                        record[succ_pos], record[pred_pos],
+                        record[type_pos] if type_pos is not None else None,
+                        record[lag_pos] if lag_pos is not None else None
+                    )
+                    # TASKPRED normally follows TASK; keep rows whose activities are not known yet
+                    if not count_relationship(*relationship):
+                        pending.append(relationship)
+        elif table_name == 'PROJECT':
+            positions = column_positions(columns, ('proj_id', 'last_recalc_date'))
+            if 'proj_id' in positions and 'last_recalc_date' in positions:
+                for record in records:
+                    data_date = record[positions['last_recalc_date']]
+                    if data_date is not None and values_conform(TIMESTAMP, (data_date,)):
+                        data_dates[record[positions['proj_id']]] = data_date
+
+        yield table_name, columns, records
+
+    for relationship in pending:
+        count_relationship(*relationship)
+
+    if not summary:
+        return
+
+    ensure_kpi_table(db_cursor, schema_changes)
+    db_cursor.execute("DELETE FROM xer_kpi_summary WHERE file_id = %s", (file_id,))
+    execute_values(db_cursor, f"""
+        INSERT INTO xer_kpi_summary (file_id, project_id, data_date, {', '.join(KPI_COLUMNS)})
+        VALUES %s
+    """, [
+        (file_id, project_id, data_dates.get(project_id)) + tuple(kpis[column] for column in KPI_COLUMNS)
+        for project_id, kpis in summary.items()
+    ])
+    for project_id, kpis in summary.items():
+        log(f"[KPI] Project {project_id}: {kpis['total_relationships']} relationships, "
+            f"{kpis['remaining_relationships']} remaining, {kpis['leads']} leads, {kpis['lags']} lags")
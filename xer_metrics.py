@@ -0,0 +1,183 @@
+"""
+Ingestion metrics for XER files.
+An IngestMetrics object collects, for one file, the time spent in each
+phase of the pipeline (read, tokenize, type_convert, ddl, load, commit,
+index, analyze, refresh, cpm, diff, export, publish), rows and COPY bytes per table, and how long the
+ingestion waited on config.database.get_connection. Phase times are summed
+over threads, so with parallel loaders they can add up to more than the
+wall-clock total.
+
+At the end of an ingestion the summary is emitted once, as a single JSON
+line or as a Prometheus textfile (for node_exporter's textfile collector),
+instead of the per-table progress lines, which are only printed when
+XER_VERBOSE is true.
+
+This module must not import config.database at module level: the reader
+uses it in parser subprocesses that never open a connection pool.
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Print per-table progress lines in addition to the summary
+VERBOSE = os.getenv('XER_VERBOSE', 'false').lower() == 'true'
+
+# 'json' (one line on stdout or appended to XER_METRICS_FILE), 'prometheus' or 'none'
+METRICS_FORMAT = os.getenv('XER_METRICS_FORMAT', 'json').lower()
+
+# Destination of the summary; the Prometheus textfile is replaced atomically
+METRICS_FILE = os.getenv('XER_METRICS_FILE')
+
+PHASES = ('read', 'tokenize', 'type_convert', 'ddl', 'load', 'commit', 'index', 'analyze', 'refresh', 'cpm', 'diff', 'export', 'publish')
+
+PROMETHEUS_PREFIX = 'xer_ingest'
+
+def log(message):
+    """Print a progress message when XER_VERBOSE is enabled"""
+    if VERBOSE:
+        print(message)
+
+class IngestMetrics:
+    """
+    Thread-safe phase timers and per-table counters for one ingestion.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.file_id = None
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.tables = {}
+        self.pool_wait = {'acquisitions': 0, 'wait_seconds': 0.0}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._pool_baseline = None
+        self.total_seconds = None
+
+    def add_time(self, phase, seconds):
+        """Add seconds to a phase"""
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, phase):
+        """Time a block as part of a phase"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - started)
+
+    def count_table(self, table_name, rows=0, copy_bytes=0, rejected=0):
+        """Add loaded rows, COPY bytes and rejected rows to a table"""
+        with self._lock:
+            table = self.tables.get(table_name)
+            if table is None:
+                table = self.tables[table_name] = {'rows': 0, 'bytes': 0, 'rejected': 0}
+            table['rows'] += rows
+            table['bytes'] += copy_bytes
+            table['rejected'] += rejected
+
+    def start_pool_wait(self):
+        """Remember the calling thread's pool wait counters; connections it takes from now on are counted"""
+        from config.database import get_pool_wait_stats
+        self._pool_baseline = get_pool_wait_stats(current_thread=True)
+
+    def stop_pool_wait(self):
+        """Record the pool waits of the calling thread since start_pool_wait"""
+        if self._pool_baseline is None:
+            return
+        from config.database import get_pool_wait_stats
+        current = get_pool_wait_stats(current_thread=True)
+        with self._lock:
+            for key in self.pool_wait:
+                self.pool_wait[key] += current[key] - self._pool_baseline[key]
+        self._pool_baseline = None
+
+    def finish(self):
+        """Stop the wall clock and return the summary"""
+        self.stop_pool_wait()
+        self.total_seconds = time.perf_counter() - self._started
+        return self.to_dict()
+
+    def to_dict(self):
+        """Return a JSON-serializable summary"""
+        with self._lock:
+            rows = sum(table['rows'] for table in self.tables.values())
+            total = self.total_seconds if self.total_seconds is not None else time.perf_counter() - self._started
+            return {
+                'filename': self.filename,
+                'file_id': self.file_id,
+                'total_seconds': round(total, 4),
+                'rows': rows,
+                'bytes': sum(table['bytes'] for table in self.tables.values()),
+                'rows_per_second': round(rows / total, 1) if total > 0 else None,
+                'phases': {phase: round(seconds, 4) for phase, seconds in self.phases.items()},
+                'tables': {name: dict(table) for name, table in sorted(self.tables.items())},
+                'pool_wait': {
+                    'acquisitions': self.pool_wait['acquisitions'],
+                    'wait_seconds': round(self.pool_wait['wait_seconds'], 6)
+                }
+            }
+
+def format_prometheus(summary):
+    """Render a summary in the Prometheus text exposition format"""
+    # Labelled by phase/table only, so every file updates the same series
+    lines = [
+        f'# HELP {PROMETHEUS_PREFIX}_phase_seconds Seconds spent in each ingestion phase of the last XER file',
+        f'# TYPE {PROMETHEUS_PREFIX}_phase_seconds gauge',
+    ]
+    for phase, seconds in summary['phases'].items():
+        lines.append(f'{PROMETHEUS_PREFIX}_phase_seconds{{phase="{phase}"}} {seconds}')
+    for metric, key, help_text in (
+        ('table_rows', 'rows', 'Rows loaded per table'),
+        ('table_bytes', 'bytes', 'COPY bytes sent per table'),
+        ('table_rejected_rows', 'rejected', 'Rows rejected per table'),
+    ):
+        lines.append(f'# HELP {PROMETHEUS_PREFIX}_{metric} {help_text} for the last XER file')
+        lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{metric} gauge')
+        for table_name, table in summary['tables'].items():
+            lines.append(f'{PROMETHEUS_PREFIX}_{metric}{{table="{table_name}"}} {table[key]}')
+    for metric, value, help_text in (
+        ('file_id', summary['file_id'], 'file_id of the last XER ingestion'),
+        ('total_seconds', summary['total_seconds'], 'Wall-clock seconds of the last XER ingestion'),
+        ('rows', summary['rows'], 'Rows loaded by the last XER ingestion'),
+        ('pool_acquisitions', summary['pool_wait']['acquisitions'], 'Connections taken from the pool'),
+        ('pool_wait_seconds', summary['pool_wait']['wait_seconds'], 'Seconds spent waiting for pooled connections'),
+        ('last_success_timestamp_seconds', round(time.time(), 3), 'Unix time the last XER ingestion finished'),
+    ):
+        lines.append(f'# HELP {PROMETHEUS_PREFIX}_{metric} {help_text}')
+        lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{metric} gauge')
+        lines.append(f'{PROMETHEUS_PREFIX}_{metric} {value}')
+    return '\n'.join(lines) + '\n'
+
+def emit_metrics(summary, metrics_format=None, metrics_file=None):
+    """
+    Write an ingestion summary in the configured format.
+    JSON goes to stdout as one line, or is appended to the metrics file;
+    Prometheus output replaces the metrics file atomically.
+    """
+    metrics_format = metrics_format or METRICS_FORMAT
+    metrics_file = metrics_file or METRICS_FILE
+    if metrics_format == 'none':
+        return
+
+    if metrics_format == 'prometheus':
+        text = format_prometheus(summary)
+        if not metrics_file:
+            print(text, end='')
+            return
+        temp_path = f'{metrics_file}.{os.getpid()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as handle:
+            handle.write(text)
+        os.replace(temp_path, metrics_file)
+        return
+
+    line = json.dumps(summary, default=str)
+    if metrics_file:
+        with open(metrics_file, 'a', encoding='utf-8') as handle:
+            handle.write(line + '\n')
+    else:
+        print(line)
@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+"""
+Snapshot partitioning and retention for the large XER tables.
+TASK, TASKPRED, PROJWBS and TASKRSRC grow by a whole schedule per upload,
+so they are created as LIST partitioned tables keyed on file_id with one
+partition per snapshot ("TASK_file_42"). Queries on a file_id only scan that
+snapshot's partition, and dropping a snapshot drops its partitions instead of
+deleting its rows from one large heap.
+
+CREATE TABLE ... PARTITION OF locks the parent table exclusively, which would
+make every upload wait for (and block) loads and dashboard reads of it. An
+ingestion therefore loads each snapshot into a standalone table with the
+parent's columns and a CHECK (file_id = N) constraint (create_snapshot_staging),
+and attach_snapshot_partitions attaches it after the ingestion commits with
+ATTACH PARTITION, which only takes SHARE UPDATE EXCLUSIVE on the parent and,
+thanks to the constraint, does not scan the rows. The snapshot is published
+after that. Tables created before partitioning was introduced keep working
+unpartitioned until they are migrated.
+
+Retention drops the partitions of the large tables; the small XER tables,
+read models, KPIs and CPM results are not partitioned, so their rows are
+still removed with DELETE. It also removes snapshots that were committed but
+never published (an ingestion interrupted between committing and
+publish_snapshot) once they are older than XER_ABANDONED_SNAPSHOT_HOURS, so
+their partitions do not leak.
+
+Usage:
+    python xer_partitions.py drop <file_id> [...]
+    python xer_partitions.py retain <snapshots_per_project>
+    python xer_partitions.py cleanup
+    python xer_partitions.py migrate [table ...]
+"""
+
+import os
+import sys
+
+from config.database import get_connection, return_connection, invalidate_query_cache
+from xer_schema import get_table_columns, note_schema_change, normalize_pg_type
+from xer_metrics import log
+
+# Create the large XER tables partitioned by file_id
+PARTITION_SNAPSHOTS = os.getenv('XER_PARTITION_SNAPSHOTS', 'true').lower() == 'true'
+
+PARTITIONED_TABLES = ('TASK', 'TASKPRED', 'PROJWBS', 'TASKRSRC')
+
+# Unpublished snapshots older than this are abandoned ingestions; a running one
+# is published within minutes of committing
+ABANDONED_SNAPSHOT_HOURS = float(os.getenv('XER_ABANDONED_SNAPSHOT_HOURS', '24'))
+
+# Tables with a file_id column that retention does not clear with the other
+# snapshot tables: file_metadata rows are deleted last, once the data is gone
+RETENTION_EXCLUDED_TABLES = ('file_metadata',)
+
+def partition_name(table_name, file_id):
+    """Return the name of a snapshot's partition of a table"""
+    return f'{table_name}_file_{"null" if file_id is None else file_id}'
+
+def partition_clause(table_name):
+    """Return the PARTITION BY clause for a new table, or '' if it is not partitioned"""
+    if PARTITION_SNAPSHOTS and table_name in PARTITIONED_TABLES:
+        return ' PARTITION BY LIST (file_id)'
+    return ''
+
+def get_partitioned_tables(db_cursor):
+    """Return the names of the partitioned tables of the current schema"""
+    db_cursor.execute("""
+        SELECT c.relname
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema() AND c.relkind = 'p'
+    """)
+    return {row[0] for row in db_cursor.fetchall()}
+
+def get_snapshot_partitions(db_cursor, file_ids):
+    """
+    Return {(table_name, file_id): partition_name} for the existing partitions
+    of the given snapshots, including staging tables not attached yet.
+    """
+    candidates = {
+        partition_name(table_name, file_id): (table_name, file_id)
+        for table_name in get_partitioned_tables(db_cursor)
+        for file_id in file_ids
+    }
+    if not candidates:
+        return {}
+    db_cursor.execute("""
+        SELECT c.relname
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema() AND c.relkind = 'r' AND c.relname = ANY(%s)
+    """, (list(candidates),))
+    return {candidates[row[0]]: row[0] for row in db_cursor.fetchall()}
+
+def ensure_snapshot_partition(db_cursor, table_name, file_id):
+    """
+    Create the partition of a snapshot if table_name is partitioned and the
+    partition does not exist yet. Locks the parent exclusively, so it is only
+    used where the parent is locked anyway (migrate_table). Returns the
+    partition name, or None for unpartitioned tables.
+    """
+    name = partition_name(table_name, file_id)
+    db_cursor.execute(
+        "SELECT c.relkind = 'p', to_regclass(%s) IS NOT NULL FROM pg_class c WHERE c.oid = to_regclass(%s)",
+        (f'"{name}"', f'"{table_name}"')
+    )
+    row = db_cursor.fetchone()
+    if row is None or not row[0]:
+        return None
+    if not row[1]:
+        bound = 'NULL' if file_id is None else int(file_id)
+        db_cursor.execute(f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table_name}" FOR VALUES IN ({bound})')
+        log(f"[Partitions] Created partition {name}")
+    return name
+
+def read_column_types(db_cursor, table_name):
+    """Return {column_name: SQL type} of a table as PostgreSQL spells it"""
+    db_cursor.execute("""
+        SELECT attname, format_type(atttypid, atttypmod)
+        FROM pg_attribute
+        WHERE attrelid = to_regclass(%s) AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum
+    """, (f'"{table_name}"',))
+    return dict(db_cursor.fetchall())
+
+def create_snapshot_staging(db_cursor, table_name, file_id):
+    """
+    Create the standalone table a snapshot of a partitioned table is loaded
+    into: the parent's columns plus CHECK (file_id = N), so attaching it later
+    needs no validation scan. Only the new table is locked. Returns
+    (name, {column: type}) with types as xer_types names, or None if
+    table_name is not partitioned.
+    """
+    db_cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", (f'"{table_name}"',))
+    row = db_cursor.fetchone()
+    if row is None or not row[0]:
+        return None
+    name = partition_name(table_name, file_id)
+    db_cursor.execute(
+        f'CREATE TABLE IF NOT EXISTS "{name}" (LIKE "{table_name}" INCLUDING DEFAULTS, '
+        f'CONSTRAINT "{name}_bound" CHECK (file_id IS NOT NULL AND file_id = {int(file_id)}))'
+    )
+    log(f"[Partitions] Loading {table_name} of file_id {file_id} into {name}")
+    columns = {column.lower(): normalize_pg_type(column_type)
+               for column, column_type in read_column_types(db_cursor, name).items()}
+    return name, columns
+
+def sync_staging_columns(db_cursor, name, parent_columns, staging_columns):
+    """
+    Give a staging table the columns and types its parent has gained since it
+    was created (columns added or widened by this or another ingestion).
+    Returns the staging table's columns afterwards.
+    """
+    if parent_columns == staging_columns:
+        return staging_columns
+    for column, column_type in parent_columns.items():
+        current_type = staging_columns.get(column)
+        if current_type is None:
+            db_cursor.execute(f'ALTER TABLE "{name}" ADD COLUMN "{column}" {column_type}')
+        elif current_type != column_type:
+            db_cursor.execute(
+                f'ALTER TABLE "{name}" ALTER COLUMN "{column}" TYPE {column_type} USING "{column}"::{column_type}'
+            )
+    return dict(parent_columns)
+
+def copy_parent_indexes(db_cursor, table_name, name):
+    """
+    Build the parent's indexes on a staging table, so ATTACH PARTITION adopts
+    them instead of building them while it holds the parent's lock.
+    """
+    db_cursor.execute("""
+        SELECT pg_get_indexdef(i.indexrelid), i.indisunique
+        FROM pg_index i
+        WHERE i.indrelid = to_regclass(%s)
+    """, (f'"{table_name}"',))
+    for definition, unique in db_cursor.fetchall():
+        method_and_columns = definition[definition.index(' USING '):]
+        db_cursor.execute(f'CREATE {"UNIQUE " if unique else ""}INDEX ON "{name}"{method_and_columns}')
+
+def attach_snapshot_partitions(file_id):
+    """
+    Attach the staging tables a committed ingestion loaded into their
+    partitioned parents, in one short transaction. Indexes are built first;
+    the parents are then locked in name order (SHARE UPDATE EXCLUSIVE, which
+    does not block reads or loads), the staging tables are brought up to
+    their current columns and attached. Returns the partitions attached.
+    """
+    connection = get_connection()
+    try:
+        with connection.cursor() as db_cursor:
+            staged = sorted(
+                (table_name, name) for (table_name, _), name in get_snapshot_partitions(db_cursor, [file_id]).items()
+                if table_name in PARTITIONED_TABLES
+            )
+            db_cursor.execute(
+                "SELECT relname FROM pg_class WHERE relname = ANY(%s) AND relispartition",
+                ([name for _, name in staged],)
+            )
+            attached = {row[0] for row in db_cursor.fetchall()}
+            staged = [(table_name, name) for table_name, name in staged if name not in attached]
+            for table_name, name in staged:
+                copy_parent_indexes(db_cursor, table_name, name)
+            for table_name, name in staged:
+                db_cursor.execute(f'LOCK TABLE "{table_name}" IN SHARE UPDATE EXCLUSIVE MODE')
+            for table_name, name in staged:
+                sync_staging_columns(
+                    db_cursor, name, read_column_types(db_cursor, table_name), read_column_types(db_cursor, name)
+                )
+                db_cursor.execute(
+                    f'ALTER TABLE "{table_name}" ATTACH PARTITION "{name}" FOR VALUES IN ({int(file_id)})'
+                )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        return_connection(connection)
+    if staged:
+        log(f"[Partitions] Attached {', '.join(name for _, name in staged)}")
+    return [name for _, name in staged]
+
+def drop_snapshot_partitions(db_cursor, file_ids):
+    """Drop the partitions of the given snapshots; returns the tables they belonged to"""
+    partitions = get_snapshot_partitions(db_cursor, file_ids)
+    for name in sorted(partitions.values()):
+        db_cursor.execute(f'DROP TABLE "{name}"')
+    return {table_name for table_name, _ in partitions}
+
+def discard_snapshot_partitions(file_id):
+    """Drop the partitions created for an ingestion that was rolled back"""
+    connection = get_connection()
+    try:
+        with connection.cursor() as db_cursor:
+            drop_snapshot_partitions(db_cursor, [file_id])
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        return_connection(connection)
+
+def get_snapshot_tables(db_cursor):
+    """Return the unpartitioned tables of the current schema that have a file_id column"""
+    db_cursor.execute("""
+        SELECT c.relname
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        JOIN pg_attribute a ON a.attrelid = c.oid AND a.attname = 'file_id' AND NOT a.attisdropped
+        WHERE n.nspname = current_schema() AND c.relkind = 'r' AND NOT c.relispartition
+    """)
+    return {row[0] for row in db_cursor.fetchall()} - set(RETENTION_EXCLUDED_TABLES)
+
+def find_expired_snapshots(db_cursor, keep):
+    """Return the file_ids of all but the latest `keep` published snapshots of each project"""
+    db_cursor.execute("""
+        SELECT file_id
+        FROM (
+            SELECT file_id, ROW_NUMBER() OVER (PARTITION BY project_name ORDER BY file_id DESC) AS position
+            FROM file_metadata
+            WHERE published
+        ) ranked
+        WHERE position > %s
+        ORDER BY file_id
+    """, (keep,))
+    return [row[0] for row in db_cursor.fetchall()]
+
+def find_abandoned_snapshots(db_cursor, hours=ABANDONED_SNAPSHOT_HOURS):
+    """Return the file_ids of unpublished snapshots committed more than `hours` ago"""
+    metadata_columns = get_table_columns(db_cursor, 'file_metadata') or {}
+    if not {'published', 'created_at'} <= set(metadata_columns):
+        return []
+    db_cursor.execute("""
+        SELECT file_id
+        FROM file_metadata
+        WHERE NOT published
+          AND created_at < now() - make_interval(secs => %s)
+        ORDER BY file_id
+    """, (hours * 3600,))
+    return [row[0] for row in db_cursor.fetchall()]
+
+def find_referenced_snapshots(db_cursor, file_ids):
+    """
+    Return the file_ids among `file_ids` that a remaining incremental
+    snapshot still reads from (see xer_incremental), directly or through
+    another such snapshot.
+    """
+    if get_table_columns(db_cursor, 'xer_table_snapshots') is None:
+        return set()
+    dropping = set(file_ids)
+    kept = set()
+    while True:
+        db_cursor.execute("""
+            SELECT DISTINCT base_file_id
+            FROM xer_table_snapshots
+            WHERE storage_mode <> 'full'
+              AND base_file_id = ANY(%s)
+              AND NOT file_id = ANY(%s)
+        """, (list(dropping), list(dropping)))
+        referenced = {row[0] for row in db_cursor.fetchall()}
+        if not referenced:
+            return kept
+        kept |= referenced
+        dropping -= referenced
+
+def drop_snapshots(file_ids):
+    """
+    Remove snapshots: their partitions are dropped, and their rows in the
+    unpartitioned tables with a file_id column (small XER tables, read
+    models, KPIs, CPM results) and in file_metadata are deleted, all in one
+    transaction. Snapshots that later incremental snapshots still read from
+    are kept. Returns the file_ids removed.
+    """
+    connection = get_connection()
+    try:
+        with connection.cursor() as db_cursor:
+            kept = find_referenced_snapshots(db_cursor, file_ids)
+            for file_id in sorted(kept):
+                print(f"[Partitions] Keeping file_id {file_id}: later incremental snapshots read from it")
+            file_ids = sorted(set(file_ids) - kept)
+            if not file_ids:
+                connection.rollback()
+                return []
+
+            tables = get_snapshot_tables(db_cursor)
+            for table_name in sorted(tables):
+                db_cursor.execute(f'DELETE FROM "{table_name}" WHERE file_id = ANY(%s)', (file_ids,))
+            db_cursor.execute("DELETE FROM file_metadata WHERE file_id = ANY(%s)", (file_ids,))
+            # Dropping a partition locks its parent exclusively, so do it last and commit right away
+            tables |= drop_snapshot_partitions(db_cursor, file_ids)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        return_connection(connection)
+
+    log(f"[Partitions] Dropped {len(file_ids)} snapshots: {', '.join(map(str, file_ids))}")
+    try:
+        invalidate_query_cache(tables | {'file_metadata'}, file_ids=file_ids)
+    except Exception as e:
+        print(f"[Partitions] Warning: Could not invalidate the query cache: {str(e)}")
+    return file_ids
+
+def retain_snapshots(keep=None, abandoned_hours=ABANDONED_SNAPSHOT_HOURS):
+    """
+    Drop all but the latest `keep` published snapshots of each project (all
+    of them are kept if keep is None), and unpublished snapshots older than
+    abandoned_hours. Returns the file_ids removed.
+    """
+    if keep is not None and keep < 1:
+        raise ValueError(f"At least one snapshot per project must be kept, got {keep}")
+    connection = get_connection()
+    try:
+        with connection.cursor() as db_cursor:
+            expired = find_expired_snapshots(db_cursor, keep) if keep is not None else []
+            abandoned = find_abandoned_snapshots(db_cursor, abandoned_hours)
+        connection.rollback()
+    finally:
+        return_connection(connection)
+    if abandoned:
+        print(f"[Partitions] Removing {len(abandoned)} snapshots that were never published: "
+              f"{', '.join(map(str, abandoned))}")
+    file_ids = sorted(set(expired) | set(abandoned))
+    return drop_snapshots(file_ids) if file_ids else []
+
+def get_dependent_views(db_cursor, table_name):
+    """
+    Return (name, relkind, definition) of the views that depend on a table,
+    directly or through other views, in the order they can be recreated.
+    """
+    db_cursor.execute("""
+        WITH RECURSIVE dependents(oid, depth) AS (
+            SELECT r.ev_class, 1
+            FROM pg_depend d
+            JOIN pg_rewrite r ON r.oid = d.objid
+            WHERE d.refobjid = to_regclass(%s) AND r.ev_class <> d.refobjid
+            UNION ALL
+            SELECT r.ev_class, dependents.depth + 1
+            FROM dependents
+            JOIN pg_depend d ON d.refobjid = dependents.oid
+            JOIN pg_rewrite r ON r.oid = d.objid
+            WHERE r.ev_class <> d.refobjid
+        )
+        SELECT c.relname, c.relkind, pg_get_viewdef(c.oid)
+        FROM dependents
+        JOIN pg_class c ON c.oid = dependents.oid
+        GROUP BY c.oid, c.relname, c.relkind
+        ORDER BY MAX(dependents.depth)
+    """, (f'"{table_name}"',))
+    return db_cursor.fetchall()
+
+def migrate_table(table_name):
+    """
+    Convert an unpartitioned XER table into a partitioned one, moving each
+    snapshot's rows into its own partition. Views that depend on the table
+    are dropped and recreated from their definitions (grants on them are not
+    kept). Runs in one transaction that locks the table for its duration.
+    Returns the number of partitions created, or None if there was nothing to do.
+    """
+    connection = get_connection()
+    try:
+        with connection.cursor() as db_cursor:
+            db_cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (f'"{table_name}"',))
+            row = db_cursor.fetchone()
+            if row is None or row[0] != 'r':
+                connection.rollback()
+                return None
+
+            views = get_dependent_views(db_cursor, table_name)
+            for name, relkind, _ in reversed(views):
+                kind = 'MATERIALIZED VIEW' if relkind == 'm' else 'VIEW'
+                db_cursor.execute(f'DROP {kind} IF EXISTS "{name}"')
+
+            legacy_name = f'{table_name}_unpartitioned'
+            db_cursor.execute(f'ALTER TABLE "{table_name}" RENAME TO "{legacy_name}"')
+            db_cursor.execute(
+                f'CREATE TABLE "{table_name}" (LIKE "{legacy_name}" INCLUDING DEFAULTS) PARTITION BY LIST (file_id)'
+            )
+            db_cursor.execute(f'SELECT DISTINCT file_id FROM "{legacy_name}"')
+            file_ids = [row[0] for row in db_cursor.fetchall()]
+            for file_id in file_ids:
+                ensure_snapshot_partition(db_cursor, table_name, file_id)
+            db_cursor.execute(f'INSERT INTO "{table_name}" SELECT * FROM "{legacy_name}"')
+            db_cursor.execute(f'DROP TABLE "{legacy_name}"')
+
+            for name, relkind, definition in views:
+                kind = 'MATERIALIZED VIEW' if relkind == 'm' else 'VIEW'
+                db_cursor.execute(f'CREATE {kind} "{name}" AS {definition}')
+            note_schema_change(db_cursor, table_name)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        return_connection(connection)
+
+    print(f"[Partitions] Migrated {table_name} into {len(file_ids)} partitions")
+    return len(file_ids)
+
+def migrate_tables(table_names=PARTITIONED_TABLES):
+    """
+    Partition existing tables and rebuild their indexes on the partitioned
+    tables. Returns {table_name: partitions created}.
+    """
+    from xer_read_models import XER_TABLE_INDEXES, ensure_indexes
+
+    migrated = {}
+    for table_name in table_names:
+        partitions = migrate_table(table_name)
+        if partitions is not None:
+            migrated[table_name] = partitions
+    if migrated:
+        connection = get_connection()
+        try:
+            ensure_indexes(connection, {name: XER_TABLE_INDEXES[name] for name in migrated if name in XER_TABLE_INDEXES})
+        finally:
+            return_connection(connection)
+        invalidate_query_cache(migrated)
+    return migrated
+
+def main():
+    """
+    Drop snapshots by file_id, apply a per-project retention count, remove
+    abandoned unpublished snapshots, or partition existing tables.
+    """
+    usage = ("Usage: python xer_partitions.py drop <file_id> [...] | retain <snapshots_per_project> | "
+             "cleanup | migrate [table ...]")
+    if len(sys.argv) < 2 or sys.argv[1] not in ('drop', 'retain', 'cleanup', 'migrate'):
+        print(usage)
+        return 1
+
+    command, arguments = sys.argv[1], sys.argv[2:]
+    if command == 'drop':
+        if not arguments:
+            print(usage)
+            return 1
+        dropped = drop_snapshots([int(file_id) for file_id in arguments])
+    elif command == 'retain':
+        if len(arguments) != 1:
+            print(usage)
+            return 1
+        dropped = retain_snapshots(int(arguments[0]))
+    elif command == 'cleanup':
+        dropped = retain_snapshots()
+    else:
+        migrated = migrate_tables(arguments or PARTITIONED_TABLES)
+        print(f"[Partitions] Partitioned tables: {migrated or 'none'}")
+        return 0
+
+    print(f"[Partitions] Removed snapshots: {', '.join(map(str, dropped)) or 'none'}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+Post-ingest stage for XER snapshots.
+Builds the indexes the schedule dashboards join on and maintains materialized
+read models of the views in create_views.sql (activity_relationship_view,
+awp_tasks, wbs_structure). The read models are plain tables keyed by file_id:
+refreshing a snapshot replaces only that file_id's rows in one transaction,
+so readers keep seeing the previous rows until it commits and ingestions of
+other files never wait on each other, unlike REFRESH MATERIALIZED VIEW which
+recomputes every project.
+
+Usage:
+    python xer_read_models.py <file_id> [...]
+"""
+
+import sys
+import psycopg2
+
+from config.database import get_connection, return_connection, execute_pipelined
+from xer_schema import get_table_columns, note_schema_change, publish_schema_changes
+from xer_types import TEXT, DOUBLE
+from xer_partitions import get_partitioned_tables, get_snapshot_partitions
+from xer_metrics import IngestMetrics, log
+
+# Indexes on ingested XER tables; tuples are column lists, created only when all columns exist
+XER_TABLE_INDEXES = {
+    'TASK': (('file_id', 'task_id'), ('task_id',), ('proj_id',)),
+    'TASKPRED': (('file_id',), ('task_id',), ('pred_task_id',), ('proj_id',)),
+    'PROJWBS': (('file_id',), ('wbs_id',), ('parent_wbs_id',), ('proj_id',)),
+}
+
+# Ingested tables each read model is built from
+READ_MODEL_SOURCES = {
+    'activity_relationship_mv': ('TASK', 'TASKPRED'),
+    'awp_tasks_mv': ('TASK',),
+    'wbs_structure_mv': ('PROJWBS',),
+}
+
+ACTIVITY_RELATIONSHIP_COLUMNS = (
+    'activity_id', 'project_id', 'activity_name', 'original_duration', 'activity_status',
+    'activity_id2', 'activity_name2', 'activity_status2', 'lag', 'driving', 'free_float',
+    'relationship_type', 'predecessor_activity_duration', 'relationship_status',
+    'excessive_lag', 'lags', 'lead', 'lead_or_lag'
+)
+
+AWP_TASK_COLUMNS = (
+    'task_id', 'proj_id', 'task_code', 'task_name', 'target_drtn_hr_cnt', 'status_code',
+    'driving_path_flag', 'free_float_hr_cnt', 'total_float_hr_cnt', 'target_start_date',
+    'target_end_date', 'act_start_date', 'act_end_date', 'phys_complete_pct',
+    'remain_drtn_hr_cnt', 'early_start_date', 'early_end_date', 'late_start_date',
+    'late_end_date', 'suspend_date', 'resume_date', 'cstr_date', 'cstr_type', 'priority_type',
+    'guid', 'tmpl_guid', 'clndr_id', 'rsrc_id', 'total_qty', 'target_qty', 'remain_qty',
+    'target_cost', 'act_cost', 'remain_cost', 'target_equip_qty', 'act_equip_qty',
+    'remain_equip_qty'
+)
+
+WBS_STRUCTURE_COLUMNS = (
+    'wbs_id', 'parent_wbs_id', 'proj_id', 'obs_id', 'seq_num', 'status_code', 'wbs_short_name',
+    'wbs_name', 'proj_node_flag', 'sum_data_flag', 'status_date', 'start_date', 'end_date',
+    'expect_end_date', 'guid', 'tmpl_guid', 'orig_cost', 'indep_remain_total_cost',
+    'ann_dscnt_rate_pct', 'dscnt_period_type', 'indep_remain_work_qty', 'anticip_start_date',
+    'anticip_end_date', 'ev_user_pct', 'ev_etc_user_value', 'orig_start_date', 'orig_end_date',
+    'target_start_date', 'target_end_date', 'schedule_pct', 'ev_compute_type',
+    'ev_etc_compute_type'
+)
+
+# Stops the WBS recursion on corrupt exports whose parent links form a cycle
+MAX_WBS_DEPTH = 100
+
+# Source column of every activity_relationship_mv column copied from TASK/TASKPRED
+ACTIVITY_RELATIONSHIP_SOURCES = {
+    'activity_id': ('TASK', 'task_code'),
+    'project_id': ('TASK', 'proj_id'),
+    'activity_name': ('TASK', 'task_name'),
+    'original_duration': ('TASK', 'target_drtn_hr_cnt'),
+    'activity_status': ('TASK', 'status_code'),
+    'activity_id2': ('TASK', 'task_code'),
+    'activity_name2': ('TASK', 'task_name'),
+    'activity_status2': ('TASK', 'status_code'),
+    'lag': ('TASKPRED', 'lag_hr_cnt'),
+    'driving': ('TASK', 'driving_path_flag'),
+    'free_float': ('TASK', 'free_float_hr_cnt'),
+    'relationship_type': ('TASKPRED', 'pred_type'),
+}
+
+# Read model columns computed during the refresh rather than copied
+COMPUTED_COLUMN_TYPES = {
+    'predecessor_activity_duration': DOUBLE,
+}
+
+READ_MODEL_INDEXES = {
+    'activity_relationship_mv': (('file_id',), ('project_id', 'file_id')),
+    'awp_tasks_mv': (('file_id',), ('proj_id', 'file_id')),
+    'wbs_structure_mv': (('file_id',), ('proj_id', 'file_id')),
+}
+
+def index_name(table_name, columns):
+    """Return the name used for an index on table_name(columns)"""
+    return f"{table_name.lower()}_{'_'.join(columns)}_idx"
+
+def get_valid_indexes(db_cursor):
+    """Return {index_name: is_valid} for the indexes of the current schema"""
+    db_cursor.execute("""
+        SELECT c.relname, i.indisvalid
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema()
+    """)
+    return dict(db_cursor.fetchall())
+
+def ensure_indexes(connection, index_specs):
+    """
+    Create missing indexes with CREATE INDEX CONCURRENTLY so that loads into
+    the same tables are not blocked while they build. Partitioned tables
+    cannot be indexed concurrently; their indexes are built once with a plain
+    CREATE INDEX and every partition created later inherits them.
+    index_specs maps table names to column tuples; indexes whose columns are
+    not all present are skipped. Returns the names of the indexes created.
+    """
+    created = []
+    previous_autocommit = connection.autocommit
+    connection.autocommit = True
+    try:
+        db_cursor = connection.cursor()
+        existing = get_valid_indexes(db_cursor)
+        partitioned = get_partitioned_tables(db_cursor)
+        for table_name, column_sets in index_specs.items():
+            table_columns = get_table_columns(db_cursor, table_name)
+            if table_columns is None:
+                continue
+            for columns in column_sets:
+                if not all(col in table_columns for col in columns):
+                    continue
+                name = index_name(table_name, columns)
+                if existing.get(name):
+                    continue
+                concurrently = '' if table_name in partitioned else ' CONCURRENTLY'
+                try:
+                    if name in existing:
+                        # Left INVALID by an interrupted concurrent build
+                        db_cursor.execute(f'DROP INDEX{concurrently} IF EXISTS "{name}"')
+                    quoted_columns = ', '.join(f'"{col}"' for col in columns)
+                    db_cursor.execute(
+                        f'CREATE INDEX{concurrently} IF NOT EXISTS "{name}" ON "{table_name}" ({quoted_columns})'
+                    )
+                    created.append(name)
+                    log(f"[ReadModels] Created index {name}")
+                except psycopg2.Error as e:
+                    # Usually another ingestion building the same index at the same time
+                    print(f"[ReadModels] Warning: Could not create index {name}: {str(e)}")
+        db_cursor.close()
+    finally:
+        connection.autocommit = previous_autocommit
+    return created
+
+def read_model_column_types(db_cursor, read_model):
+    """
+    Return [(column, type)] of a read model. Copied columns take the type of
+    their source column in the ingested tables, so ids, dates, floats and lag
+    keep the types the loader gave them; missing source columns are TEXT.
+    """
+    if read_model == 'activity_relationship_mv':
+        sources = {
+            column: ACTIVITY_RELATIONSHIP_SOURCES.get(column) for column in ACTIVITY_RELATIONSHIP_COLUMNS
+        }
+    elif read_model == 'awp_tasks_mv':
+        sources = {column: ('TASK', column) for column in AWP_TASK_COLUMNS}
+    else:
+        sources = {column: ('PROJWBS', column) for column in WBS_STRUCTURE_COLUMNS}
+
+    source_columns = {table: get_table_columns(db_cursor, table) or {} for table in READ_MODEL_SOURCES[read_model]}
+    column_types = []
+    for column, source in sources.items():
+        if source is None:
+            column_types.append((column, COMPUTED_COLUMN_TYPES.get(column, TEXT)))
+        else:
+            column_types.append((column, source_columns[source[0]].get(source[1], TEXT)))
+    return column_types
+
+def create_read_model_table(db_cursor, read_model, column_types):
+    """Create a read model table keyed by file_id"""
+    extra = ', level INTEGER NOT NULL' if read_model == 'wbs_structure_mv' else ''
+    db_cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {read_model} (
+            file_id INTEGER NOT NULL,
+            {', '.join(f'{column} {column_type}' for column, column_type in column_types)}{extra}
+        )
+    """)
+
+def sync_read_model_types(db_cursor, read_model, column_types, existing_columns):
+    """
+    Change read model columns whose type no longer matches their source, e.g.
+    after the loader widened a source column to TEXT. Returns True if any
+    column was changed.
+    """
+    changed = False
+    for column, column_type in column_types:
+        if existing_columns.get(column) in (None, column_type):
+            continue
+        db_cursor.execute("SAVEPOINT read_model_type")
+        try:
+            db_cursor.execute(
+                f'ALTER TABLE {read_model} ALTER COLUMN {column} TYPE {column_type} USING {column}::{column_type}'
+            )
+            db_cursor.execute("RELEASE SAVEPOINT read_model_type")
+            log(f"[ReadModels] Changed column '{column}' of {read_model} to {column_type}")
+            changed = True
+        except psycopg2.Error as e:
+            db_cursor.execute("ROLLBACK TO SAVEPOINT read_model_type")
+            print(f"[ReadModels] Warning: Could not change column '{column}' of {read_model} "
+                  f"to {column_type}: {str(e)}")
+    return changed
+
+def ensure_read_model_tables(db_cursor, schema_changes=None):
+    """
+    Create the read model tables that the schema catalog does not know yet,
+    and bring the column types of existing ones in line with their sources.
+    """
+    for read_model in READ_MODEL_SOURCES:
+        column_types = read_model_column_types(db_cursor, read_model)
+        existing_columns = get_table_columns(db_cursor, read_model, schema_changes)
+        if existing_columns is None:
+            create_read_model_table(db_cursor, read_model, column_types)
+        elif not sync_read_model_types(db_cursor, read_model, column_types, existing_columns):
+            continue
+        note_schema_change(db_cursor, read_model, schema_changes)
+
+def resolve_source_file_id(db_cursor, file_id, table_name):
+    """
+    Return the file_id whose rows hold table_name for a snapshot.
+    Incremental loads store unchanged tables as references to an earlier
+    snapshot (see xer_incremental), so the chain is followed back to the
+    snapshot stored in full.
+    """
+    if get_table_columns(db_cursor, 'xer_table_snapshots') is None:
+        return file_id
+
+    current = file_id
+    while True:
+        db_cursor.execute(
+            "SELECT storage_mode, base_file_id FROM xer_table_snapshots WHERE file_id = %s AND table_name = %s",
+            (current, table_name)
+        )
+        row = db_cursor.fetchone()
+        if row is None or row[0] == 'full':
+            return current
+        current = row[1]
+
+def column_expr(alias, table_columns, column):
+    """Select a source column as TEXT, or NULL if this export does not have it"""
+    if column in table_columns:
+        return f'{alias}."{column}"::TEXT'
+    return 'NULL::TEXT'
+
+def source_expr(alias, table_columns, column):
+    """Select a source column with its own type, or NULL if this export does not have it"""
+    if column in table_columns:
+        return f'{alias}."{column}"'
+    return 'NULL::TEXT'
+
+def join_expr(left, left_columns, right, right_columns, column_left, column_right):
+    """Join condition that compares natively when both sides share a type, as TEXT otherwise"""
+    if left_columns[column_left] == right_columns[column_right]:
+        return f'{left}."{column_left}" = {right}."{column_right}"'
+    return f'{left}."{column_left}"::TEXT = {right}."{column_right}"::TEXT'
+
+def refresh_activity_relationships(db_cursor, file_id, source_file_ids):
+    """Rebuild activity_relationship_mv rows of one snapshot"""
+    task_columns = get_table_columns(db_cursor, 'TASK') or {}
+    pred_columns = get_table_columns(db_cursor, 'TASKPRED') or {}
+    if 'task_id' not in task_columns or not {'task_id', 'pred_task_id'} <= set(pred_columns):
+        return 0
+
+    def real_expr(alias, table_columns, column):
+        if column in table_columns:
+            return f'CAST({alias}."{column}" AS DOUBLE PRECISION)'
+        return 'NULL::DOUBLE PRECISION'
+
+    db_cursor.execute(f"""
+        INSERT INTO activity_relationship_mv (file_id, {', '.join(ACTIVITY_RELATIONSHIP_COLUMNS)})
+        SELECT DISTINCT
+            %(file_id)s,
+            r.activity_id, r.project_id, r.activity_name, r.original_duration, r.activity_status,
+            r.activity_id2, r.activity_name2, r.activity_status2, r.lag, r.driving, r.free_float,
+            r.relationship_type, r.predecessor_activity_duration, r.relationship_status,
+            CASE WHEN r.predecessor_activity_duration >= 0.75 THEN 'Excessive Lag' END,
+            CASE WHEN r.lag_value > 0 THEN 'Lag' END,
+            CASE WHEN r.lag_value < 0 THEN 'Lead' END,
+            CASE WHEN r.lag_value <> 0 THEN 'Lead or Lag' ELSE 'None' END
+        FROM (
+            SELECT
+                {source_expr('tk', task_columns, 'task_code')} AS activity_id,
+                {source_expr('tk', task_columns, 'proj_id')} AS project_id,
+                {source_expr('tk', task_columns, 'task_name')} AS activity_name,
+                {source_expr('tk', task_columns, 'target_drtn_hr_cnt')} AS original_duration,
+                {source_expr('tk', task_columns, 'status_code')} AS activity_status,
+                {source_expr('tk1', task_columns, 'task_code')} AS activity_id2,
+                {source_expr('tk1', task_columns, 'task_name')} AS activity_name2,
+                {source_expr('tk1', task_columns, 'status_code')} AS activity_status2,
+                {source_expr('tp', pred_columns, 'lag_hr_cnt')} AS lag,
+                {real_expr('tp', pred_columns, 'lag_hr_cnt')} AS lag_value,
+                {source_expr('tk', task_columns, 'driving_path_flag')} AS driving,
+                {source_expr('tk', task_columns, 'free_float_hr_cnt')} AS free_float,
+                {source_expr('tp', pred_columns, 'pred_type')} AS relationship_type,
+                {real_expr('tp', pred_columns, 'lag_hr_cnt')}
+                    / NULLIF({real_expr('tk', task_columns, 'target_drtn_hr_cnt')}, 0) AS predecessor_activity_duration,
+                CASE
+                    WHEN {column_expr('tk', task_columns, 'status_code')} = 'TK_Complete'
+                     AND {column_expr('tk1', task_columns, 'status_code')} = 'TK_Complete' THEN 'Complete'
+                    ELSE 'Incomplete'
+                END AS relationship_status
+            FROM "TASKPRED" tp
+            INNER JOIN "TASK" tk
+                ON {join_expr('tk', task_columns, 'tp', pred_columns, 'task_id', 'task_id')}
+                AND tk.file_id = %(task_file_id)s
+            INNER JOIN "TASK" tk1
+                ON {join_expr('tk1', task_columns, 'tp', pred_columns, 'task_id', 'pred_task_id')}
+                AND tk1.file_id = %(task_file_id)s
+            WHERE tp.file_id = %(pred_file_id)s
+        ) r
+    """, {
+        'file_id': file_id,
+        'task_file_id': source_file_ids['TASK'],
+        'pred_file_id': source_file_ids['TASKPRED']
+    })
+    return db_cursor.rowcount
+
+def refresh_awp_tasks(db_cursor, file_id, source_file_ids):
+    """Rebuild awp_tasks_mv rows of one snapshot"""
+    task_columns = get_table_columns(db_cursor, 'TASK') or {}
+    if not task_columns:
+        return 0
+
+    select_list = ', '.join(source_expr('t', task_columns, col) for col in AWP_TASK_COLUMNS)
+    db_cursor.execute(f"""
+        INSERT INTO awp_tasks_mv (file_id, {', '.join(AWP_TASK_COLUMNS)})
+        SELECT %(file_id)s, {select_list}
+        FROM "TASK" t
+        WHERE t.file_id = %(task_file_id)s
+    """, {'file_id': file_id, 'task_file_id': source_file_ids['TASK']})
+    return db_cursor.rowcount
+
+def refresh_wbs_structure(db_cursor, file_id, source_file_ids):
+    """Rebuild wbs_structure_mv rows of one snapshot"""
+    wbs_columns = get_table_columns(db_cursor, 'PROJWBS') or {}
+    if not {'wbs_id', 'parent_wbs_id'} <= set(wbs_columns):
+        return 0
+
+    base_list = ', '.join(f"{source_expr('w', wbs_columns, col)} AS {col}" for col in WBS_STRUCTURE_COLUMNS)
+    child_list = ', '.join(source_expr('w', wbs_columns, col) for col in WBS_STRUCTURE_COLUMNS)
+    db_cursor.execute(f"""
+        INSERT INTO wbs_structure_mv (file_id, {', '.join(WBS_STRUCTURE_COLUMNS)}, level)
+        WITH RECURSIVE wbs_tree AS (
+            SELECT {base_list}, 1 AS level
+            FROM "PROJWBS" w
+            WHERE w.file_id = %(wbs_file_id)s AND w.parent_wbs_id IS NULL
+
+            UNION ALL
+
+            SELECT {child_list}, wt.level + 1
+            FROM "PROJWBS" w
+            INNER JOIN wbs_tree wt ON {join_expr('w', wbs_columns, 'wt', wbs_columns, 'parent_wbs_id', 'wbs_id')}
+            WHERE w.file_id = %(wbs_file_id)s AND wt.level < %(max_depth)s
+        )
+        SELECT %(file_id)s, wbs_tree.* FROM wbs_tree
+    """, {'file_id': file_id, 'wbs_file_id': source_file_ids['PROJWBS'], 'max_depth': MAX_WBS_DEPTH})
+    return db_cursor.rowcount
+
+READ_MODEL_REFRESHERS = {
+    'activity_relationship_mv': refresh_activity_relationships,
+    'awp_tasks_mv': refresh_awp_tasks,
+    'wbs_structure_mv': refresh_wbs_structure,
+}
+
+def analyze_tables(connection, table_names, file_id=None):
+    """
+    Refresh planner statistics of freshly loaded XER tables. A new snapshot's
+    file_id is not in the existing statistics, so without this the planner
+    expects a single row per file_id and joins the snapshot with nested loops.
+    For partitioned tables only the partition of `file_id` is analyzed, which
+    is what queries on that snapshot are planned with.
+    Returns the names of the tables (or partitions) analyzed.
+    """
+    with connection.cursor() as db_cursor:
+        partitioned = get_partitioned_tables(db_cursor)
+        partitions = get_snapshot_partitions(db_cursor, [file_id]) if file_id is not None else {}
+        analyzed = [
+            partitions.get((table_name, file_id), table_name)
+            for table_name in sorted(table_names)
+            if get_table_columns(db_cursor, table_name) is not None
+            and (table_name not in partitioned or (table_name, file_id) in partitions)
+        ]
+        if analyzed:
+            execute_pipelined(db_cursor, [(f'ANALYZE "{table_name}"', None) for table_name in analyzed])
+    connection.commit()
+    return analyzed
+
+def refresh_read_models(connection, file_id, changed_tables=None):
+    """
+    Replace the read model rows of one snapshot in a single transaction.
+    With changed_tables, only read models built from those XER tables are
+    refreshed. Returns {read_model: rows}.
+    """
+    schema_changes = {}
+    refreshed = {}
+    db_cursor = connection.cursor()
+    try:
+        ensure_read_model_tables(db_cursor, schema_changes)
+        for read_model, sources in READ_MODEL_SOURCES.items():
+            if changed_tables is not None and not set(sources) & set(changed_tables):
+                continue
+
+            source_file_ids = {table: resolve_source_file_id(db_cursor, file_id, table) for table in sources}
+
+            db_cursor.execute(f"DELETE FROM {read_model} WHERE file_id = %s", (file_id,))
+            refreshed[read_model] = READ_MODEL_REFRESHERS[read_model](db_cursor, file_id, source_file_ids)
+            log(f"[ReadModels] Refreshed {read_model} for file_id {file_id}: {refreshed[read_model]} rows")
+        connection.commit()
+        publish_schema_changes(schema_changes)
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        db_cursor.close()
+    return refreshed
+
+def run_post_ingest(file_id, changed_tables=None, metrics=None):
+    """
+    Index the ingested tables and refresh the read models of one snapshot.
+    Runs after the ingestion transaction has committed, on its own pooled
+    connection; index builds and refreshes are timed as the 'index' and
+    'refresh' phases of `metrics` if given.
+    Returns {'indexes': [...], 'read_models': {...}}.
+    """
+    if metrics is None:
+        metrics = IngestMetrics()
+
+    connection = get_connection()
+    try:
+        with metrics.phase('index'):
+            indexes = ensure_indexes(connection, XER_TABLE_INDEXES)
+        sources = {table for tables in READ_MODEL_SOURCES.values() for table in tables}
+        with metrics.phase('analyze'):
+            analyze_tables(connection, sources if changed_tables is None else sources & set(changed_tables), file_id)
+        with metrics.phase('refresh'):
+            read_models = refresh_read_models(connection, file_id, changed_tables)
+        with metrics.phase('index'):
+            indexes += ensure_indexes(connection, READ_MODEL_INDEXES)
+    finally:
+        return_connection(connection)
+    return {'indexes': indexes, 'read_models': read_models}
+
+def main():
+    """
+    Rebuild indexes and read models for the given file_ids.
+    """
+    if len(sys.argv) < 2:
+        print("Usage: python xer_read_models.py <file_id> [...]")
+        return 1
+
+    for file_id in sys.argv[1:]:
+        run_post_ingest(int(file_id))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,540 @@
+"""
+XER file reader for Primavera P6 schedule data.
+Tokenizes XER files into (table_name, columns, row_batch) chunks without
+touching the database, so it can run in parser subprocesses. Besides plain
+.xer files it reads .xer.gz, .xer.zst and .zip archives (one snapshot per
+XER file in the archive), decompressing them as they are tokenized.
+"""
+
+import os
+import re
+import gzip
+import mmap
+import time
+import codecs
+import queue
+import zipfile
+import threading
+from contextlib import ExitStack, contextmanager
+
+from xer_metrics import log
+
+# Rows per (table_name, columns, row_batch) chunk yielded by iter_xer_batches
+DEFAULT_BATCH_SIZE = int(os.getenv('XER_BATCH_SIZE', '5000'))
+
+# Bytes read per block (extended to the end of a line); reading and tokenizing are timed per block
+READ_BLOCK_SIZE = 1024 * 1024
+
+# Table names that start a line of the header-row layout
+TABLE_NAME_PATTERN = re.compile(r'[A-Z][A-Z0-9_]*\Z')
+
+# The first line after a run of %R lines that is another record (%T, %F, %E)
+RUN_END_PATTERN = re.compile(r'\n%[^R]')
+
+# ASCII whitespace besides space, tab and newline; runs containing any are always stripped
+RARE_WHITESPACE = ('\r', '\x0b', '\x0c', '\x1c', '\x1d', '\x1e', '\x1f')
+
+# Leading bytes of the compressed and archive formats; anything else is read as plain XER text
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+ZIP_MAGICS = (b'PK\x03\x04', b'PK\x05\x06')
+
+# Suffixes dropped from the name of a compressed file to get the snapshot's filename
+COMPRESSED_SUFFIXES = ('.gz', '.zst')
+
+# Parsed batches buffered ahead of the database writer
+DEFAULT_PREFETCH_DEPTH = int(os.getenv('XER_PREFETCH_DEPTH', '4'))
+
+def sanitize_column_name(col_name, index):
+    """
+    Sanitize column name for database use.
+    Returns a valid column name.
+    """
+    if not col_name or not col_name.strip():
+        return f"col_{index}"
+    
+    # Remove leading/trailing whitespace
+    col_name = col_name.strip()
+    
+    # Replace invalid characters with underscores
+    sanitized = re.sub(r'[^\w]', '_', col_name)
+    
+    # Ensure it doesn't start with a number
+    if sanitized and sanitized[0].isdigit():
+        sanitized = f"col_{sanitized}"
+    
+    # If sanitization resulted in empty string, use fallback
+    if not sanitized:
+        sanitized = f"col_{index}"
+    
+    return sanitized
+
+def needs_strip(text):
+    """
+    Return True if some value in `text`, a run of values separated by tabs,
+    may have whitespace at either end. Text that is not plain ASCII always
+    needs stripping.
+    """
+    if not text.isascii() or any(char in text for char in RARE_WHITESPACE):
+        return True
+    return ' \t' in text or '\t ' in text or text[:1] == ' ' or text[-1:] == ' '
+
+def detect_encoding(data, start=0):
+    """
+    Return the encoding of an XER file held in `data` (bytes or mmap):
+    'utf-8' if everything from `start` on is valid UTF-8 (ASCII included),
+    otherwise 'cp1252', the encoding of P6 exports on Windows. Only the part
+    from the first non-ASCII block on is decoded.
+    """
+    return detect_blocks_encoding(
+        data[offset:offset + READ_BLOCK_SIZE] for offset in range(start, len(data), READ_BLOCK_SIZE)
+    )
+
+def detect_stream_encoding(file_path, member=None):
+    """
+    Return the encoding of a compressed XER file (or zip member) the same way
+    as detect_encoding, decompressing it in a separate pass.
+    """
+    with open_xer_stream(file_path, member) as stream:
+        return detect_blocks_encoding(iter(lambda: stream.read(READ_BLOCK_SIZE), b''))
+
+def detect_blocks_encoding(blocks):
+    """Return 'utf-8' if the concatenated byte blocks are valid UTF-8, otherwise 'cp1252'"""
+    decoder = None
+    try:
+        for chunk in blocks:
+            if decoder is None:
+                if chunk.isascii():
+                    continue
+                decoder = codecs.getincrementaldecoder('utf-8')()
+            decoder.decode(chunk)
+        if decoder is not None:
+            decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return 'cp1252'
+    return 'utf-8'
+
+def tokenize_rows(text, column_count):
+    """
+    Split a run of %R lines into value tuples aligned with column_count
+    columns; values are stripped and empty values become None. Other lines
+    in the run (blank lines, comments) are ignored.
+    """
+    joined = text.rstrip('\n').replace('\n', '\t')
+    if column_count and not needs_strip(joined):
+        # Well-formed runs are split in one pass: every row then has exactly
+        # column_count values and its %R marker sits in the col_0 slot
+        flat = joined.split('\t')
+        count, extra = divmod(len(flat), column_count)
+        if not extra and joined.count('%R') == count and flat[::column_count].count('%R') == count:
+            values = [value or None for value in flat]
+            values[::column_count] = [None] * count
+            return list(zip(*[iter(values)] * column_count))
+    
+    lines = [line.strip() for line in text.split('\n')]
+    rows = [
+        tuple([value.strip() or None for value in line[2:].split('\t')])
+        for line in lines if line[:2] == '%R'
+    ]
+    
+    # Pad short rows and cut long ones so every tuple lines up with the column list
+    if rows and (min(map(len, rows)) != column_count or max(map(len, rows)) != column_count):
+        padding = (None,) * column_count
+        rows = [row[:column_count] + padding[len(row):] for row in rows]
+    return rows
+
+def detect_container(file_path):
+    """
+    Return how an XER file is packed, from its leading bytes: 'gzip',
+    'zstd', 'zip' or 'xer' (plain text). Uploads are stored under temporary
+    names, so the extension is not relied on.
+    """
+    with open(file_path, 'rb') as file:
+        head = file.read(4)
+    if head.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if head == ZSTD_MAGIC:
+        return 'zstd'
+    if head in ZIP_MAGICS:
+        return 'zip'
+    return 'xer'
+
+def is_xer_member(name):
+    """Return True if a zip member name is an XER file (macOS resource forks excluded)"""
+    base_name = os.path.basename(name)
+    return (name.lower().endswith('.xer') and not base_name.startswith('._')
+            and not name.startswith('__MACOSX/'))
+
+def list_xer_members(file_path, filename=None):
+    """
+    Return (member, snapshot_filename) pairs for the XER files in an upload,
+    in archive order. member is the name to pass to iter_xer_batches (None
+    for plain and compressed files). The snapshot filename is the member's
+    base name, or `filename` (default: the file's own name) without a .gz
+    or .zst suffix.
+    """
+    filename = filename or os.path.basename(file_path)
+    if detect_container(file_path) != 'zip':
+        for suffix in COMPRESSED_SUFFIXES:
+            if filename.lower().endswith(suffix):
+                filename = filename[:-len(suffix)]
+                break
+        return [(None, filename)]
+    
+    with zipfile.ZipFile(file_path) as archive:
+        members = [info.filename for info in archive.infolist() if not info.is_dir() and is_xer_member(info.filename)]
+    if not members:
+        raise ValueError(f"No .xer files found in archive {filename}")
+    return [(member, os.path.basename(member)) for member in members]
+
+@contextmanager
+def open_xer_stream(file_path, member=None):
+    """
+    Open an XER file, or one member of a zip archive, as a binary stream of
+    its decompressed contents. Nothing is extracted to disk. Without a
+    member, a zip archive must contain exactly one XER file.
+    """
+    container = detect_container(file_path)
+    
+    if container == 'gzip':
+        with gzip.open(file_path, 'rb') as stream:
+            yield stream
+        return
+    
+    if container == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("Reading .zst files requires the zstandard package (pip install zstandard)")
+        with open(file_path, 'rb') as file:
+            # Exports compressed in parallel (zstd -T) consist of several frames
+            with zstandard.ZstdDecompressor().stream_reader(file, read_across_frames=True) as stream:
+                yield stream
+        return
+    
+    if container == 'zip':
+        with zipfile.ZipFile(file_path) as archive:
+            if member is None:
+                members = [name for name in archive.namelist() if is_xer_member(name)]
+                if len(members) != 1:
+                    raise ValueError(
+                        f"Archive {file_path} contains {len(members)} XER files; name the one to read"
+                    )
+                member = members[0]
+            with archive.open(member) as stream:
+                yield stream
+        return
+    
+    with open(file_path, 'rb') as stream:
+        yield stream
+
+def iter_mapped_blocks(data, position=0):
+    """Yield blocks of a memory-mapped file from `position`, each about READ_BLOCK_SIZE bytes and ending at a line end"""
+    size = len(data)
+    while position < size:
+        end = data.find(b'\n', min(position + READ_BLOCK_SIZE, size) - 1)
+        end = size if end < 0 else end + 1
+        yield data[position:end]
+        position = end
+
+def iter_stream_blocks(stream):
+    """Yield blocks of a binary stream, each about READ_BLOCK_SIZE bytes and ending at a line end, without a UTF-8 BOM"""
+    rest = b''
+    first = True
+    while True:
+        chunk = stream.read(READ_BLOCK_SIZE)
+        if not chunk:
+            break
+        if first and chunk.startswith(codecs.BOM_UTF8):
+            chunk = chunk[len(codecs.BOM_UTF8):]
+        first = False
+        data = rest + chunk if rest else chunk
+        cut = data.rfind(b'\n') + 1
+        if cut == 0:
+            rest = data
+            continue
+        rest = data[cut:]
+        yield data[:cut]
+    if rest:
+        yield rest
+
+def iter_xer_batches(file_path, batch_size=DEFAULT_BATCH_SIZE, metrics=None, tables=None, member=None):
+    """
+    Stream an XER file as (table_name, columns, row_batch) chunks.
+    Each row_batch is a list of at most batch_size tuples aligned with the
+    shared `columns` list, with empty strings already turned into None. Peak
+    memory depends on the batch size rather than on the size of the file.
+    Batches of one table are yielded in file order.
+
+    Both record layouts are understood: the %T/%F/%R layout of P6 exports,
+    and the header-row layout where every line starts with its table name
+    (TABLE<TAB>FIELD...; the first line of a table names the fields, whose
+    names are lower-cased, and the literal NULL is a missing value).
+
+    Plain files are memory-mapped and cut into blocks of READ_BLOCK_SIZE at
+    line boundaries; their encoding (UTF-8 or cp1252) is detected once.
+    Compressed files are decompressed block by block as they are tokenized
+    (`member` names the XER file to read from a zip archive, see
+    list_xer_members). Their leading ASCII blocks decode the same in either
+    encoding; at the first block with other bytes, the encoding of the whole
+    file is detected in a second decompression pass, so files without
+    non-ASCII bytes are only decompressed once. Either way a file is read in
+    a single encoding. Each block is decoded in one call. Runs of %R lines are tokenized together,
+    and values are only stripped in runs where whitespace touches a field
+    boundary. With `tables`, rows of other tables are skipped without being
+    split into values. If an IngestMetrics is given, reading and tokenizing
+    time are added to its 'read' and 'tokenize' phases.
+    """
+    log(f"[Parser] Starting to stream XER file: {file_path} (batch size {batch_size})")
+    
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"XER file not found: {file_path}")
+    
+    if batch_size < 1:
+        raise ValueError(f"Batch size must be at least 1, got {batch_size}")
+    
+    wanted = None if tables is None else set(tables)
+    current_table = None
+    current_name = None
+    current_columns = []
+    column_count = 0
+    skipping = False
+    batch = []
+    ready = []
+    record_count = 0
+    table_count = 0
+    line_num = 0
+    clock = time.perf_counter
+    
+    def start_table(table_name):
+        log(f"[Parser] Found table: {table_name}")
+        return wanted is not None and table_name not in wanted
+    
+    def add_rows(rows):
+        nonlocal batch, record_count
+        record_count += len(rows)
+        start = 0
+        while start < len(rows):
+            end = start + batch_size - len(batch)
+            batch.extend(rows[start:end])
+            start = end
+            if len(batch) >= batch_size:
+                ready.append((current_table, current_columns, batch))
+                batch = []
+    
+    def flush():
+        nonlocal batch
+        if batch:
+            ready.append((current_table, current_columns, batch))
+            batch = []
+    
+    try:
+        with ExitStack() as stack:
+            if detect_container(file_path) == 'xer':
+                file = stack.enter_context(open(file_path, 'rb'))
+                if os.fstat(file.fileno()).st_size == 0:
+                    log("[Parser] Finished streaming XER file. Found 0 tables.")
+                    return
+                data = stack.enter_context(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+                position = len(codecs.BOM_UTF8) if data[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8 else 0
+                encoding = detect_encoding(data, position)
+                blocks = iter_mapped_blocks(data, position)
+                log(f"[Parser] Detected encoding: {encoding}")
+            else:
+                blocks = iter_stream_blocks(stack.enter_context(open_xer_stream(file_path, member)))
+                encoding = None
+            # Bytes cp1252 leaves undefined become U+FFFD instead of being dropped
+            errors = 'strict' if encoding == 'utf-8' else 'replace'
+            
+            while True:
+                started = clock()
+                block = next(blocks, None)
+                tokenize_started = clock()
+                if metrics:
+                    metrics.add_time('read', tokenize_started - started)
+                if block is None:
+                    break
+                
+                if encoding is None and not block.isascii():
+                    encoding = detect_stream_encoding(file_path, member)
+                    errors = 'strict' if encoding == 'utf-8' else 'replace'
+                    log(f"[Parser] Detected encoding: {encoding}")
+                    if metrics:
+                        metrics.add_time('read', clock() - tokenize_started)
+                        tokenize_started = clock()
+                text = block.decode(encoding or 'ascii', errors)
+                if '\r' in text:
+                    text = text.replace('\r\n', '\n')
+                length = len(text)
+                cursor = 0
+                
+                while cursor < length:
+                    if text.startswith('%R', cursor) and (skipping or current_columns):
+                        match = RUN_END_PATTERN.search(text, cursor)
+                        run_end = match.start() if match else length
+                        if not skipping:
+                            add_rows(tokenize_rows(text[cursor:run_end], column_count))
+                        line_num += text.count('\n', cursor, run_end) + 1
+                        cursor = run_end + 1
+                        continue
+                    
+                    line_end = text.find('\n', cursor)
+                    if line_end < 0:
+                        line_end = length
+                    line = text[cursor:line_end]
+                    cursor = line_end + 1
+                    line_num += 1
+                    line = line.strip()
+                    if not line:
+                        continue
+                    head = line[:2]
+                    
+                    if head == '%R':
+                        # Rows indented by whitespace, or before any %F line
+                        if not skipping and current_columns:
+                            add_rows(tokenize_rows(line, column_count))
+                        continue
+                    
+                    if head == '%T':
+                        flush()
+                        current_table = line[2:].strip()
+                        current_name = None
+                        current_columns = []
+                        column_count = 0
+                        record_count = 0
+                        table_count += 1
+                        skipping = start_table(current_table)
+                        continue
+                    
+                    if head == '%F':
+                        if current_table and not skipping:
+                            raw_columns = [col.strip() for col in line.rstrip()[2:].split('\t')]
+                            current_columns = [
+                                sanitize_column_name(raw_col, i) for i, raw_col in enumerate(raw_columns)
+                            ]
+                            column_count = len(current_columns)
+                            log(f"[Parser] Columns for {current_table}: {len(current_columns)} columns")
+                        continue
+                    
+                    if head == '%E':
+                        if current_table:
+                            flush()
+                            log(f"[Parser] Completed table {current_table}: {record_count} records")
+                            current_table = None
+                            current_name = None
+                            current_columns = []
+                            column_count = 0
+                        continue
+                    
+                    # Header-row layout: TABLE<TAB>FIELD... lines
+                    tab = line.find('\t')
+                    if tab <= 0:
+                        continue
+                    name = line[:tab]
+                    if name == current_name:
+                        if skipping:
+                            continue
+                        values = [value.strip() for value in line[tab + 1:].split('\t')][:column_count]
+                        values.extend([''] * (column_count - len(values)))
+                        add_rows([tuple([value if value and value != 'NULL' else None for value in values])])
+                        continue
+                    if name == 'ERMHDR' or not TABLE_NAME_PATTERN.match(name):
+                        continue
+                    
+                    flush()
+                    if current_name is not None:
+                        log(f"[Parser] Completed table {current_table}: {record_count} records")
+                    current_table = current_name = name
+                    record_count = 0
+                    table_count += 1
+                    skipping = start_table(current_table)
+                    raw_columns = [col.strip() for col in line[tab + 1:].rstrip().split('\t')]
+                    current_columns = [
+                        sanitize_column_name(raw_col.lower(), i) for i, raw_col in enumerate(raw_columns)
+                    ]
+                    column_count = len(current_columns)
+                    log(f"[Parser] Columns for {current_table}: {len(current_columns)} columns")
+                
+                if metrics:
+                    metrics.add_time('tokenize', clock() - tokenize_started)
+                # Hand over the batches completed in this block (time spent downstream is not counted)
+                for item in ready:
+                    yield item
+                ready = []
+            
+            # Flush the last table if the file has no trailing %E
+            if batch:
+                yield current_table, current_columns, batch
+                batch = []
+    
+    except Exception as e:
+        print(f"[Parser] Error reading XER file at line {line_num}: {str(e)}")
+        raise
+    
+    log(f"[Parser] Finished streaming XER file. Found {table_count} tables.")
+
+def prefetch_batches(batches, depth=DEFAULT_PREFETCH_DEPTH):
+    """
+    Run a batch generator on a background thread so parsing overlaps with
+    database writes. At most `depth` batches are buffered ahead of the consumer;
+    parser exceptions are re-raised in the consuming thread.
+    """
+    buffer = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+    done = object()
+    
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce():
+        try:
+            for item in batches:
+                if not put(item):
+                    return
+            put(done)
+        except BaseException as e:
+            put(e)
+    
+    producer = threading.Thread(target=produce, name='xer-parser', daemon=True)
+    producer.start()
+    
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # Unblock the producer if the consumer stops early
+        stop.set()
+        producer.join(timeout=1)
+
+def parse_xer_file(file_path):
+    """
+    Parse XER file and return structured data with column mapping.
+    Returns a dictionary with table names as keys and table data as values.
+    Each table data contains 'columns', 'column_mapping' (column name to tuple
+    position, shared by all rows) and 'records' (a list of value tuples).
+    This materializes the whole file; use iter_xer_batches() for large files.
+    """
+    xer_data = {}
+    
+    for table_name, columns, records in iter_xer_batches(file_path):
+        if table_name not in xer_data:
+            xer_data[table_name] = {
+                'columns': columns,
+                'column_mapping': {col: i for i, col in enumerate(columns)},
+                'records': []
+            }
+        xer_data[table_name]['records'].extend(records)
+    
+    log(f"[Parser] Successfully parsed XER file. Found {len(xer_data)} tables with data.")
+    return xer_data
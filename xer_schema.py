@@ -0,0 +1,115 @@
+"""
+Process-wide schema catalog for XER tables.
+Column names and types of every table in the current schema are read from
+information_schema once per process and cached, so steady-state uploads need
+no introspection or DDL round trips.
+
+DDL issued inside an ingestion transaction is recorded in a per-ingestion
+`schema_changes` overlay and only merged into the shared cache by
+publish_schema_changes() after that transaction commits; a rolled back
+ingestion simply drops its overlay.
+"""
+
+import threading
+
+from xer_types import normalize_pg_type
+from xer_metrics import log
+
+# {table_name: {column_name_lower: type}} for committed tables, loaded on first use
+schema_catalog = None
+schema_catalog_lock = threading.Lock()
+
+def read_table_columns(db_cursor, table_name=None):
+    """
+    Read column types from information_schema.
+    Returns {table_name: {column_name_lower: type}} for one table or for all
+    tables of the current schema. Partitions are left out; their columns are
+    those of the partitioned table (see xer_partitions).
+    """
+    query = """
+        SELECT table_name, column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name NOT IN (
+              SELECT c.relname
+              FROM pg_class c
+              JOIN pg_namespace n ON n.oid = c.relnamespace
+              WHERE n.nspname = current_schema() AND c.relispartition
+          )
+    """
+    params = None
+    if table_name is not None:
+        query += " AND table_name = %s"
+        params = (table_name,)
+    query += " ORDER BY table_name, ordinal_position"
+
+    db_cursor.execute(query, params)
+    tables = {}
+    for name, column_name, data_type in db_cursor.fetchall():
+        tables.setdefault(name, {})[column_name.lower()] = normalize_pg_type(data_type)
+    return tables
+
+def load_schema_catalog(db_cursor):
+    """Load the column catalog of the current schema into the process cache"""
+    global schema_catalog
+    tables = read_table_columns(db_cursor)
+    with schema_catalog_lock:
+        schema_catalog = tables
+    log(f"[Schema] Loaded catalog for {len(tables)} tables")
+    return tables
+
+def get_table_columns(db_cursor, table_name, schema_changes=None):
+    """
+    Return {column_name_lower: type} for a table, or None if it doesn't exist.
+    Changes made earlier in the same ingestion (schema_changes) take precedence
+    over the shared cache.
+    """
+    if schema_changes is not None and table_name in schema_changes:
+        return schema_changes[table_name]
+
+    with schema_catalog_lock:
+        catalog = schema_catalog
+    if catalog is None:
+        catalog = load_schema_catalog(db_cursor)
+
+    columns = catalog.get(table_name)
+    return dict(columns) if columns is not None else None
+
+def note_schema_change(db_cursor, table_name, schema_changes=None):
+    """
+    Re-read one table after DDL on db_cursor's transaction.
+    The result goes into schema_changes if given (published after commit),
+    otherwise straight into the shared cache.
+    """
+    columns = read_table_columns(db_cursor, table_name).get(table_name)
+
+    if schema_changes is not None:
+        schema_changes[table_name] = columns
+        return columns
+
+    with schema_catalog_lock:
+        if schema_catalog is not None:
+            if columns is None:
+                schema_catalog.pop(table_name, None)
+            else:
+                schema_catalog[table_name] = columns
+    return columns
+
+def publish_schema_changes(schema_changes):
+    """Merge the DDL of a committed ingestion into the shared cache"""
+    if not schema_changes:
+        return
+    with schema_catalog_lock:
+        if schema_catalog is None:
+            return
+        for table_name, columns in schema_changes.items():
+            if columns is None:
+                schema_catalog.pop(table_name, None)
+            else:
+                schema_catalog[table_name] = columns
+
+def invalidate_schema_catalog():
+    """Forget the cached catalog; it is reloaded on next use"""
+    global schema_catalog
+    with schema_catalog_lock:
+        schema_catalog = None
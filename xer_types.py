@@ -0,0 +1,101 @@
+"""
+Column type inference for XER tables.
+P6 field names carry their type in the suffix (_hr_cnt, _date, _id, _pct,
+_cost, _qty). A column gets the suffix type only if the sampled values
+actually parse as that type, so non-standard exports fall back to TEXT.
+"""
+
+import re
+
+TEXT = 'TEXT'
+BIGINT = 'BIGINT'
+DOUBLE = 'DOUBLE PRECISION'
+NUMERIC = 'NUMERIC'
+TIMESTAMP = 'TIMESTAMP'
+
+# Checked in order, so the longer _hr_cnt suffix wins over shorter ones
+P6_SUFFIX_TYPES = (
+    ('_hr_cnt', DOUBLE),
+    ('_date', TIMESTAMP),
+    ('_id', BIGINT),
+    ('_pct', DOUBLE),
+    ('_cost', NUMERIC),
+    ('_qty', DOUBLE),
+)
+
+VALUE_PATTERNS = {
+    BIGINT: re.compile(r'-?\d{1,18}'),
+    DOUBLE: re.compile(r'-?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?'),
+    NUMERIC: re.compile(r'-?(\d+\.?\d*|\.\d+)'),
+    TIMESTAMP: re.compile(r'\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?'),
+}
+
+NUMERIC_TYPES = (BIGINT, DOUBLE, NUMERIC)
+
+# information_schema data_type values mapped onto the types used here
+PG_TYPE_NAMES = {
+    'text': TEXT,
+    'character varying': TEXT,
+    'bigint': BIGINT,
+    'integer': BIGINT,
+    'double precision': DOUBLE,
+    'real': DOUBLE,
+    'numeric': NUMERIC,
+    'timestamp without time zone': TIMESTAMP,
+    'timestamp with time zone': TIMESTAMP,
+}
+
+def suffix_type(column_name):
+    """Return the type implied by a P6 field suffix, or TEXT"""
+    lowered = column_name.lower()
+    for suffix, column_type in P6_SUFFIX_TYPES:
+        if lowered.endswith(suffix):
+            return column_type
+    return TEXT
+
+def values_conform(column_type, values):
+    """Return True if every non-NULL value can be loaded into column_type"""
+    if column_type == TEXT:
+        return True
+    fullmatch = VALUE_PATTERNS[column_type].fullmatch
+    return all(value is None or fullmatch(value) for value in values)
+
+def infer_column_type(column_name, values):
+    """
+    Infer the type of one column from its P6 suffix and sampled values.
+    Integer-looking _id columns with decimals are widened to DOUBLE PRECISION;
+    anything else that does not parse becomes TEXT.
+    """
+    column_type = suffix_type(column_name)
+    if values_conform(column_type, values):
+        return column_type
+    if column_type == BIGINT and values_conform(DOUBLE, values):
+        return DOUBLE
+    return TEXT
+
+def infer_column_types(columns, records):
+    """
+    Infer a type for every column from sampled record tuples.
+    Returns a list of types aligned with columns.
+    """
+    column_values = list(zip(*records)) if records else [()] * len(columns)
+    return [
+        infer_column_type(column_name, column_values[index] if index < len(column_values) else ())
+        for index, column_name in enumerate(columns)
+    ]
+
+def merge_types(current_type, new_type):
+    """
+    Return the narrowest type that can hold values of both types.
+    Numeric types widen to NUMERIC (if either side is NUMERIC) or DOUBLE
+    PRECISION; any other disagreement widens to TEXT.
+    """
+    if current_type == new_type:
+        return current_type
+    if current_type in NUMERIC_TYPES and new_type in NUMERIC_TYPES:
+        return NUMERIC if NUMERIC in (current_type, new_type) else DOUBLE
+    return TEXT
+
+def normalize_pg_type(data_type):
+    """Map an information_schema data_type onto the types used here"""
+    return PG_TYPE_NAMES.get(data_type.lower(), TEXT)
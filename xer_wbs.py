@@ -0,0 +1,210 @@
+"""
+WBS hierarchy tables for XER snapshots.
+The PROJWBS tree of each file is resolved in memory while it is ingested and
+stored as:
+    xer_wbs_nodes    one row per WBS node with its depth, materialized id path
+                     ('/root/child/.../node/'), name path and a sort key that
+                     orders nodes depth-first, siblings by seq_num/short name
+    xer_wbs_closure  one row per (ancestor, descendant) pair, including each
+                     node paired with itself at distance 0
+so subtree, ancestor and drilldown queries are equality or range lookups on
+indexed columns instead of WITH RECURSIVE queries.
+
+A node whose parent is not in the file is a root, which covers both the
+project node and orphans. Nodes that cannot be reached from any root (their
+parent links form a loop) are reported and left out.
+"""
+
+import io
+
+from config.database import execute_pipelined
+from xer_schema import get_table_columns, note_schema_change
+from xer_metrics import log
+
+# Characters that must be escaped in PostgreSQL COPY text format
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+# Digits per level of the sort key; allows up to 10^6 - 1 siblings
+SORT_KEY_WIDTH = 6
+
+NAME_PATH_SEPARATOR = ' > '
+
+WBS_NODE_COLUMNS = (
+    'file_id', 'wbs_id', 'parent_wbs_id', 'proj_id', 'wbs_short_name', 'wbs_name',
+    'depth', 'path', 'name_path', 'sort_key', 'is_root'
+)
+
+WBS_CLOSURE_COLUMNS = ('file_id', 'ancestor_id', 'descendant_id', 'distance')
+
+def ensure_wbs_tables(db_cursor, schema_changes=None):
+    """Create the WBS hierarchy tables unless the schema catalog already knows them"""
+    if all(get_table_columns(db_cursor, table, schema_changes) is not None
+           for table in ('xer_wbs_nodes', 'xer_wbs_closure')):
+        return
+
+    db_cursor.execute("""
+        CREATE TABLE IF NOT EXISTS xer_wbs_nodes (
+            file_id INTEGER NOT NULL,
+            wbs_id TEXT NOT NULL,
+            parent_wbs_id TEXT,
+            proj_id TEXT,
+            wbs_short_name TEXT,
+            wbs_name TEXT,
+            depth INTEGER NOT NULL,
+            path TEXT NOT NULL,
+            name_path TEXT,
+            sort_key TEXT NOT NULL,
+            is_root BOOLEAN NOT NULL,
+            PRIMARY KEY (file_id, wbs_id)
+        )
+    """)
+    db_cursor.execute("""
+        CREATE INDEX IF NOT EXISTS xer_wbs_nodes_sort_idx
+        ON xer_wbs_nodes (file_id, proj_id, sort_key)
+    """)
+    db_cursor.execute("""
+        CREATE INDEX IF NOT EXISTS xer_wbs_nodes_path_idx
+        ON xer_wbs_nodes (file_id, path text_pattern_ops)
+    """)
+    db_cursor.execute("""
+        CREATE TABLE IF NOT EXISTS xer_wbs_closure (
+            file_id INTEGER NOT NULL,
+            ancestor_id TEXT NOT NULL,
+            descendant_id TEXT NOT NULL,
+            distance INTEGER NOT NULL,
+            PRIMARY KEY (file_id, ancestor_id, descendant_id)
+        )
+    """)
+    db_cursor.execute("""
+        CREATE INDEX IF NOT EXISTS xer_wbs_closure_descendant_idx
+        ON xer_wbs_closure (file_id, descendant_id)
+    """)
+    for table in ('xer_wbs_nodes', 'xer_wbs_closure'):
+        note_schema_change(db_cursor, table, schema_changes)
+
+def sibling_order(node):
+    """Sort siblings like P6: by seq_num (numerically when possible), then short name"""
+    seq_num = node['seq_num']
+    try:
+        seq_value = (0, float(seq_num), '')
+    except (TypeError, ValueError):
+        seq_value = (1, 0.0, seq_num or '')
+    return seq_value, node['wbs_short_name'] or '', node['wbs_id']
+
+def build_wbs_hierarchy(nodes):
+    """
+    Resolve the tree of a list of node dictionaries (wbs_id, parent_wbs_id,
+    proj_id, seq_num, wbs_short_name, wbs_name).
+    Returns (node_rows, closure_rows, unreachable_ids); rows are ordered
+    depth-first and do not include the file_id.
+    """
+    by_id = {node['wbs_id']: node for node in nodes}
+    children = {}
+    roots = []
+    for node in by_id.values():
+        parent_id = node['parent_wbs_id']
+        if parent_id is None or parent_id not in by_id or parent_id == node['wbs_id']:
+            roots.append(node)
+        else:
+            children.setdefault(parent_id, []).append(node)
+    for siblings in children.values():
+        siblings.sort(key=sibling_order)
+    roots.sort(key=lambda node: (node['proj_id'] or '',) + sibling_order(node))
+
+    node_rows = []
+    closure_rows = []
+    visited = set()
+    # Stack entries: (node, rank among siblings, ancestor chain of (id, name, rank) from the root)
+    stack = [(root, rank, ()) for rank, root in reversed(list(enumerate(roots, 1)))]
+    while stack:
+        node, rank, ancestors = stack.pop()
+        wbs_id = node['wbs_id']
+        if wbs_id in visited:
+            continue
+        visited.add(wbs_id)
+
+        chain = ancestors + ((wbs_id, node['wbs_name'] or node['wbs_short_name'] or wbs_id, rank),)
+        node_rows.append((
+            wbs_id,
+            node['parent_wbs_id'],
+            node['proj_id'],
+            node['wbs_short_name'],
+            node['wbs_name'],
+            len(chain),
+            '/' + '/'.join(link[0] for link in chain) + '/',
+            NAME_PATH_SEPARATOR.join(link[1] for link in chain),
+            '.'.join(str(link[2]).zfill(SORT_KEY_WIDTH) for link in chain),
+            not ancestors
+        ))
+        depth = len(chain)
+        for position, link in enumerate(chain):
+            closure_rows.append((link[0], wbs_id, depth - 1 - position))
+
+        for child_rank, child in reversed(list(enumerate(children.get(wbs_id, ()), 1))):
+            stack.append((child, child_rank, chain))
+
+    unreachable = [wbs_id for wbs_id in by_id if wbs_id not in visited]
+    return node_rows, closure_rows, unreachable
+
+def copy_rows(db_cursor, table_name, columns, rows):
+    """Load rows of plain values into a table with COPY"""
+    lines = []
+    for row in rows:
+        fields = []
+        for value in row:
+            if value is None:
+                fields.append('\\N')
+            elif value is True or value is False:
+                fields.append('t' if value else 'f')
+            else:
+                fields.append(str(value).translate(COPY_ESCAPES))
+        lines.append('\t'.join(fields))
+    if not lines:
+        return
+    buffer = io.StringIO('\n'.join(lines) + '\n')
+    db_cursor.copy_expert(f"COPY {table_name} ({', '.join(columns)}) FROM STDIN", buffer)
+
+def collect_wbs_hierarchy(db_cursor, batches, file_id, summary=None, schema_changes=None):
+    """
+    Pass a batch stream through unchanged while collecting its PROJWBS rows.
+    Once the stream ends, the hierarchy is resolved and written to
+    xer_wbs_nodes/xer_wbs_closure on db_cursor, in the same transaction as the
+    data. Node and closure counts are collected in `summary` if a dictionary
+    is given.
+    """
+    nodes = []
+    fields = ('wbs_id', 'parent_wbs_id', 'proj_id', 'seq_num', 'wbs_short_name', 'wbs_name')
+
+    for table_name, columns, records in batches:
+        if table_name == 'PROJWBS':
+            lowered = [col.lower() for col in columns]
+            if 'wbs_id' in lowered:
+                positions = [lowered.index(name) if name in lowered else None for name in fields]
+                for record in records:
+                    node = {
+                        name: record[position] if position is not None else None
+                        for name, position in zip(fields, positions)
+                    }
+                    if node['wbs_id'] is not None:
+                        nodes.append(node)
+        yield table_name, columns, records
+
+    if not nodes:
+        return
+
+    node_rows, closure_rows, unreachable = build_wbs_hierarchy(nodes)
+    if unreachable:
+        print(f"[WBS] Warning: {len(unreachable)} WBS nodes are in a parent loop and were skipped, "
+              f"e.g. {', '.join(unreachable[:10])}")
+
+    ensure_wbs_tables(db_cursor, schema_changes)
+    execute_pipelined(db_cursor, (
+        ("DELETE FROM xer_wbs_nodes WHERE file_id = %s", (file_id,)),
+        ("DELETE FROM xer_wbs_closure WHERE file_id = %s", (file_id,))
+    ))
+    copy_rows(db_cursor, 'xer_wbs_nodes', WBS_NODE_COLUMNS, [(file_id,) + row for row in node_rows])
+    copy_rows(db_cursor, 'xer_wbs_closure', WBS_CLOSURE_COLUMNS, [(file_id,) + row for row in closure_rows])
+
+    if summary is not None:
+        summary.update(nodes=len(node_rows), closure=len(closure_rows), unreachable=len(unreachable))
+    log(f"[WBS] Stored {len(node_rows)} WBS nodes and {len(closure_rows)} closure rows for file_id {file_id}")